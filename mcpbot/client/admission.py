@@ -0,0 +1,222 @@
+import asyncio
+from collections import OrderedDict, deque
+import math
+import time
+from typing import Annotated, Any, AsyncGenerator
+
+from fastapi import Depends, HTTPException, status
+
+from mcpbot.client.oauth2 import UserAuth
+from mcpbot.shared.config import (
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MAX_QUEUE_PER_USER,
+    ADMISSION_MAX_WAIT,
+)
+from mcpbot.shared.utils import register_metrics
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted, it should be retried after a while."""
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """A slot to run an agent. Releasing it more than once has no effect.
+
+    The request that admitted the ticket releases it, unless the ticket was
+    handed over (e.g. to the stream of the response), which releases it then.
+    """
+
+    def __init__(self, scheduler: "AdmissionScheduler") -> None:
+        self.scheduler = scheduler
+        self.admitted_at = time.monotonic()
+        self.released = False
+        self.handed_over = False
+
+    def hand_over(self) -> None:
+        """The new holder of the ticket is responsible for releasing it."""
+        self.handed_over = True
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self.scheduler._release(time.monotonic() - self.admitted_at)
+
+
+class AdmissionScheduler:
+    """Limits the number of agents running at once, fairly across users.
+
+    Up to `max_concurrent` agents run at once. The other requests wait in a
+    queue per user, and the queues are served round-robin, so a user with
+    many requests cannot starve the others. A request is rejected right away
+    if the queue (or the user's queue) is full, or after waiting `max_wait`
+    seconds for a slot.
+
+    Args:
+        max_concurrent: The maximum number of agents running at once.
+        max_queue: The maximum number of waiting requests.
+        max_queue_per_user: The maximum number of waiting requests per user.
+        max_wait: The maximum time to wait for a slot, in seconds.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_queue_per_user: int = ADMISSION_MAX_QUEUE_PER_USER,
+        max_wait: float = ADMISSION_MAX_WAIT,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+
+        self._active = 0
+        self._queued = 0
+        # The waiting requests per user, in round-robin order of the users
+        self._queues: OrderedDict[str, deque[asyncio.Future[None]]] = (
+            OrderedDict()
+        )
+        self._run_time = 1.0  # Moving average of the run time, in seconds
+        self._waits: deque[float] = deque(maxlen=1000)
+        self._counters = dict.fromkeys(
+            ["admitted", "rejected_full", "rejected_timeout"], 0
+        )
+
+    async def acquire(self, user_id: str) -> AdmissionTicket:
+        """Waits for a slot to run an agent.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out.
+        """
+        queued_at = time.monotonic()
+        if self._active < self.max_concurrent and not self._queued:
+            self._active += 1
+            return self._admit(queued_at)
+
+        queue = self._queues.get(user_id)
+        if self._queued >= self.max_queue or (
+            queue and len(queue) >= self.max_queue_per_user
+        ):
+            self._counters["rejected_full"] += 1
+            raise AdmissionRejected(
+                "Too many queued requests.", self.retry_after
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self._queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except TimeoutError:
+            if self._abandon(user_id, waiter):
+                self._counters["rejected_timeout"] += 1
+                raise AdmissionRejected("Timed out waiting.", self.retry_after)
+        except asyncio.CancelledError:
+            # The client went away, give the slot back if it was handed over
+            if not self._abandon(user_id, waiter):
+                self._active -= 1
+                self._dispatch()
+            raise
+        return self._admit(queued_at)
+
+    @property
+    def retry_after(self) -> int:
+        """The estimated time until the queue is served, in seconds."""
+        rounds = (self._queued + 1) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(rounds * self._run_time))
+
+    def metrics(self) -> dict[str, Any]:
+        waits = sorted(self._waits)
+        return {
+            **self._counters,
+            "active": self._active,
+            "queued": self._queued,
+            "queued_users": len(self._queues),
+            "wait_ms_p50": _percentile(waits, 0.50) * 1000,
+            "wait_ms_p95": _percentile(waits, 0.95) * 1000,
+            "wait_ms_max": (waits[-1] if waits else 0.0) * 1000,
+            "run_time_s_avg": self._run_time,
+        }
+
+    def _admit(self, queued_at: float) -> AdmissionTicket:
+        self._waits.append(time.monotonic() - queued_at)
+        self._counters["admitted"] += 1
+        return AdmissionTicket(self)
+
+    def _release(self, run_time: float) -> None:
+        self._run_time = 0.9 * self._run_time + 0.1 * run_time
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hands the free slots to the waiting users, round-robin."""
+        while self._active < self.max_concurrent and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            self._active += 1
+            waiter.set_result(None)
+
+    def _abandon(self, user_id: str, waiter: asyncio.Future[None]) -> bool:
+        """Removes a waiter from the queue.
+
+        Returns:
+            False if the waiter was already handed a slot, True otherwise.
+        """
+        if waiter.done():
+            return False
+        waiter.cancel()
+        queue = self._queues[user_id]
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[user_id]
+        return True
+
+
+def _percentile(values: list[float], quantile: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * quantile), len(values) - 1)]
+
+
+scheduler = AdmissionScheduler()
+register_metrics("admission", scheduler.metrics)
+
+
+async def admit_user(user: UserAuth) -> AsyncGenerator[AdmissionTicket, None]:
+    """Admits the request of the user to run an agent.
+
+    The ticket is released when the request is done, unless the handler
+    handed it over. The dependencies are solved before the request is
+    validated, so an invalid request releases its ticket here too.
+
+    Raises:
+        HTTPException: 503 with a `Retry-After` header, if not admitted.
+    """
+    try:
+        ticket = await scheduler.acquire(user.user_id)
+    except AdmissionRejected as error:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(error),
+            headers={"Retry-After": str(error.retry_after)},
+        )
+    try:
+        yield ticket
+    finally:
+        if not ticket.handed_over:
+            ticket.release()
+
+
+Admission = Annotated[AdmissionTicket, Depends(admit_user)]
@@ -0,0 +1,73 @@
+import hashlib
+import json
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, SystemMessage
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.prebuilt import create_react_agent
+from langgraph.prebuilt.chat_agent_executor import AgentState
+from mcp.server import FastMCP
+from mcp.types import Tool as MCPTool
+
+from mcpbot.server.prompts import client_prompt
+from mcpbot.server.transport import convert_local_tool
+
+
+# Process-level cache of the compiled agents, keyed by (llm, tool-set) version
+_AGENTS: dict[tuple[str, str], CompiledStateGraph] = {}  # type: ignore[type-arg]
+
+
+def agent_prompt(state: AgentState) -> list[BaseMessage]:
+    """Prepends the client prompt to the messages of the agent.
+
+    The prompt is rendered on every LLM call, so the timestamp it contains is
+    always the current one, even though the agent itself is cached.
+    """
+    return [SystemMessage(content=client_prompt()), *state["messages"]]
+
+
+def llm_version(llm: BaseChatModel) -> str:
+    """Returns a hash of the parameters that identify the LLM."""
+    params = json.dumps(llm._identifying_params, sort_keys=True, default=str)
+    return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+
+def tools_version(tools: list[MCPTool]) -> str:
+    """Returns a hash of the definitions of the tools."""
+    definitions = json.dumps(
+        [tool.model_dump(mode="json") for tool in tools], sort_keys=True
+    )
+    return hashlib.sha256(definitions.encode("utf-8")).hexdigest()
+
+
+async def get_agent(
+    server: FastMCP,
+    llm: BaseChatModel,
+) -> CompiledStateGraph:  # type: ignore[type-arg]
+    """Returns the ReAct agent for the tools of the server.
+
+    The agent (graph and tool schemas) is compiled once and reused across
+    requests. It is only rebuilt when the LLM or the tools of the server
+    change. Per-request state (e.g. the user email) must be passed in the
+    run config, see `mcpbot.server.transport.meta_context_config`.
+
+    Args:
+        server: The in-process MCP server that provides the tools.
+        llm: The LLM that drives the agent.
+
+    Returns:
+        The compiled agent.
+    """
+    tools = await server.list_tools()
+    key = (llm_version(llm), tools_version(tools))
+
+    if key not in _AGENTS:
+        agent = create_react_agent(
+            model=llm,
+            tools=[convert_local_tool(server, tool) for tool in tools],
+            prompt=agent_prompt,
+        )
+        # Older versions are never used again
+        _AGENTS.clear()
+        _AGENTS[key] = agent
+    return _AGENTS[key]
@@ -0,0 +1,191 @@
+import asyncio
+from collections import OrderedDict
+import logging
+import math
+import re
+import time
+from typing import Any
+
+from langchain_core.embeddings import Embeddings
+from pydantic import BaseModel
+
+from mcpbot.shared.config import (
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+)
+from mcpbot.shared.init import config
+from mcpbot.shared.utils import register_metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Only answers that were produced with these tools (and no others) are
+# cached, so a hit only ever returns an answer of the knowledge base
+CACHEABLE_TOOLS = frozenset({"rag"})
+# A heuristic that skips the lookup (and its embedding) for questions that
+# obviously ask for an action. It misses many phrasings (e.g. "I need a desk
+# tomorrow"), the guarantee is CACHEABLE_TOOLS and the similarity threshold.
+BOOKING_PATTERN = re.compile(
+    r"(un)?book|boek|reserv|cancel|annuleer", re.IGNORECASE
+)
+
+
+class CachedAnswer(BaseModel):
+    question: str
+    embedding: list[float]  # Normalized, so the dot product is the cosine
+    answer: str
+    created_at: float
+
+
+class AnswerLookup(BaseModel):
+    answer: str | None = None
+    embedding: list[float] | None = None
+
+
+class SemanticAnswerCache:
+    """Caches the answers of the agent, by the meaning of the question.
+
+    A question is served from cache if a previous question has a cosine
+    similarity of at least `threshold`. Only answers based on the knowledge
+    base (the `rag` tool) are stored. The similarity scan runs in a thread,
+    off the event loop. The entries expire after `ttl` seconds
+    and the least recently used entry is evicted when the cache is full.
+
+    Args:
+        embeddings: The embeddings used to compare the questions.
+        threshold: The minimum cosine similarity for a hit.
+        max_size: The maximum number of entries (0 disables the cache).
+        ttl: The time to live of an entry, in seconds.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_size: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+    ) -> None:
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self._counters = dict.fromkeys(
+            ["hits", "misses", "bypassed", "stored", "evicted"], 0
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def is_cacheable(self, question: str) -> bool:
+        return self.enabled and not BOOKING_PATTERN.search(question)
+
+    async def get(self, question: str) -> AnswerLookup:
+        """Looks up the answer of the most similar cached question.
+
+        The cache is bypassed if the question looks like an action (e.g. a
+        booking, see `BOOKING_PATTERN`) or if it cannot be embedded.
+
+        Returns:
+            The cached answer (None on a miss) and the embedding of the
+            question, to store the answer with after a miss.
+        """
+        if not self.is_cacheable(question):
+            self._counters["bypassed"] += 1
+            return AnswerLookup()
+
+        try:
+            vector = await self.embeddings.aembed_query(question)
+        except Exception:
+            logger.exception("Failed to embed the question, cache bypassed.")
+            self._counters["bypassed"] += 1
+            return AnswerLookup()
+
+        embedding = normalize(vector)
+        self._expire()
+
+        # A snapshot, the entries may change while the thread scans them
+        entries = list(self._entries.values())
+        best = await asyncio.to_thread(
+            self._most_similar, embedding, entries, self.threshold
+        )
+        if best is None:
+            self._counters["misses"] += 1
+            return AnswerLookup(embedding=embedding)
+
+        self._counters["hits"] += 1
+        if best.question in self._entries:
+            self._entries.move_to_end(best.question)
+        return AnswerLookup(answer=best.answer, embedding=embedding)
+
+    def put(
+        self,
+        question: str,
+        embedding: list[float] | None,
+        answer: str,
+        tools: set[str],
+    ) -> None:
+        """Stores an answer, if it was only based on the knowledge base."""
+        if embedding is None or not answer or not tools:
+            return
+        if not tools <= CACHEABLE_TOOLS or not self.is_cacheable(question):
+            return
+
+        self._entries[question] = CachedAnswer(
+            question=question,
+            embedding=embedding,
+            answer=answer,
+            created_at=time.monotonic(),
+        )
+        self._entries.move_to_end(question)
+        self._counters["stored"] += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._counters["evicted"] += 1
+
+    def invalidate(self) -> None:
+        """Removes all entries, e.g. after the knowledge base is updated."""
+        self._entries.clear()
+
+    def metrics(self) -> dict[str, Any]:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "size": len(self._entries),
+            "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+        }
+
+    @staticmethod
+    def _most_similar(
+        embedding: list[float],
+        entries: list[CachedAnswer],
+        threshold: float,
+    ) -> CachedAnswer | None:
+        """The entry with the highest similarity, if at least `threshold`."""
+        best, best_score = None, threshold
+        for entry in entries:
+            score = math.sumprod(embedding, entry.embedding)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def _expire(self) -> None:
+        expired_before = time.monotonic() - self.ttl
+        for key in [
+            key
+            for key, entry in self._entries.items()
+            if entry.created_at < expired_before
+        ]:
+            del self._entries[key]
+            self._counters["evicted"] += 1
+
+
+def normalize(vector: list[float]) -> list[float]:
+    norm = math.sqrt(math.sumprod(vector, vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+answer_cache = SemanticAnswerCache(embeddings=config.models.embeddings)
+register_metrics("answer_cache", answer_cache.metrics)
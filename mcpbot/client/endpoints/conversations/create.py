@@ -17,12 +17,16 @@ async def conversations_create(user: UserAuth) -> Conversation:
     - user_id: The ID of the user who created the conversation.
     - created_at: The timestamp when the conversation was created.
     - last_updated_at: The timestamp when the conversation was last updated.
+    - message_count, total_tokens: The number of messages and their tokens.
+    - last_role, last_message_preview: The role and start of the last message.
     """
     db = config.databases.chat["conversations"]
 
     # USE_CASE_SPECIFIC: We want 1 conversation per user.
     conversation_id = user.user_id.split("@")[0]
-    if response := db.get_conversation(conversation_id, user.user_id):
+    if response := await db.aget_conversation(conversation_id, user.user_id):
         return response
 
-    return db.create_conversation(user.user_id, conversation_id=conversation_id)
+    return await db.acreate_conversation(
+        user.user_id, conversation_id=conversation_id
+    )
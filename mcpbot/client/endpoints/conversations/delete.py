@@ -2,6 +2,7 @@ from typing import Any
 from fastapi import APIRouter
 
 from mcpbot.client.oauth2 import UserAuth
+from mcpbot.client.persistence import chat_writer
 from mcpbot.shared.init import config
 
 
@@ -14,9 +15,12 @@ async def conversations_delete(
     user: UserAuth,
 ) -> dict[str, Any]:
     """Deletes a conversation by its ID."""
+    # Queued messages must be stored before they can be deleted
+    await chat_writer.flush(conversation_id)
+
     db = config.databases.chat["conversations"]
     db_messages = config.databases.chat["messages"]
 
-    db.delete_conversation(conversation_id, user.user_id)
-    db_messages.delete_all_messages(conversation_id)
+    await db.adelete_conversation(conversation_id, user.user_id)
+    await db_messages.adelete_all_messages(conversation_id)
     return {}
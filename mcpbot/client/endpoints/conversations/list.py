@@ -1,8 +1,11 @@
-from fastapi import APIRouter
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Query, status
 
 from mcpbot.client.oauth2 import UserAuth
+from mcpbot.shared.config import PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT
 from mcpbot.shared.init import config
-from mcpbot.shared.services.database_chat import Conversation, OrderBy
+from mcpbot.shared.services.database_chat import Conversation, OrderBy, Page
 
 
 router_v1 = APIRouter(prefix="/v1")
@@ -10,8 +13,24 @@ router_v1 = APIRouter(prefix="/v1")
 
 @router_v1.get("/conversations")
 async def conversations_list(
-    user: UserAuth, order_by: OrderBy = "DESC"
-) -> list[Conversation]:
-    """Lists all conversations for the authenticated user."""
+    user: UserAuth,
+    order_by: OrderBy = "DESC",
+    limit: Annotated[int, Query(ge=1, le=PAGE_MAX_LIMIT)] = PAGE_DEFAULT_LIMIT,
+    cursor: str | None = None,
+) -> Page[Conversation]:
+    """Lists a page of conversations of the authenticated user. The next
+    page is listed with the `next_cursor` of the page, until it is null.
+
+    Every conversation has the fields of its sidebar entry (message count,
+    total tokens, role and preview of the last message), so the messages do
+    not need to be listed.
+    """
     db = config.databases.chat["conversations"]
-    return db.list_conversations(user.user_id, order_by)
+    try:
+        return await db.alist_conversations_page(
+            user.user_id, order_by, limit, cursor
+        )
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)
+        )
@@ -1,22 +1,49 @@
+import asyncio
+from contextlib import aclosing
 from datetime import datetime, UTC
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Awaitable, Callable
 from uuid import uuid4
 
+from fastapi import Request
 from fastapi.responses import StreamingResponse
 from fastapi.routing import APIRouter
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
-from langchain_mcp_adapters.client import MultiServerMCPClient  # type: ignore[import-untyped]
-from langgraph.prebuilt import create_react_agent
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+)
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
+from mcpbot.client.admission import Admission, AdmissionTicket
+from mcpbot.client.agent import get_agent
+from mcpbot.client.answer_cache import AnswerLookup, answer_cache
+from mcpbot.client.history import count_tokens, history_window, token_estimator
 from mcpbot.client.oauth2 import UserAuth
-from mcpbot.server.prompts import client_prompt
-from mcpbot.shared.config import PORT
+from mcpbot.client.persistence import ConversationWrite, chat_writer
+from mcpbot.client.streaming import (
+    ClientDisconnected,
+    CreateMessageResponse,
+    STREAM_ENCODERS,
+    StreamFormat,
+    cancel_on_disconnect,
+    coalesce_text,
+)
+from mcpbot.client.summary import summarizer, summary_message
+from mcpbot.server.context import MetaContext
+from mcpbot.server.main import mcp
+from mcpbot.server.transport import meta_context_config
+from mcpbot.shared.config import (
+    STREAM_DISCONNECT_POLICY,
+    STREAM_DISCONNECT_POLL_MS,
+    STREAM_FLUSH_BYTES,
+    STREAM_FLUSH_INTERVAL_MS,
+)
 from mcpbot.shared.init import config
 from mcpbot.shared.services.database_chat import Message
 
 
-MESSAGE_LIMIT = 10
 MESSAGE_MAP: dict[str, type[BaseMessage]] = {
     "human": HumanMessage,
     "ai": AIMessage,
@@ -27,31 +54,72 @@ class MessagesBody(BaseModel):
     message: str
 
 
-class CreateMessageResponse(BaseModel):
-    human: Message
-    ai: Message
-
-
 router_v1 = APIRouter(prefix="/v1")
 
 
 @router_v1.post("/conversations/{conversation_id}/messages")
 async def messages_create(
+    request: Request,
     user: UserAuth,
+    ticket: Admission,
     conversation_id: str,
     body: MessagesBody,
+    stream_format: StreamFormat = "sse",
 ) -> StreamingResponse:
-    """Creates a new message in the conversation. The answer is streamed."""
+    """Creates a new message in the conversation. The answer is streamed.
+
+    The stream format is one of:
+    - `sse`: Server-sent events. A `start` event with the messages, `delta`
+      events with the new text of the answer and a `done` event with the IDs
+      of the stored messages.
+    - `json`: Legacy format. The full response (human and AI message) is sent
+      for every token, where the AI text only contains the new token.
+
+    The number of agents running at once is limited. If the request cannot be
+    admitted in time, a 503 is returned with a `Retry-After` header.
+
+    If the client disconnects, the agent run is cancelled. The partial answer
+    is stored or discarded as per `STREAM_DISCONNECT_POLICY`.
+    """
+    # The summary replaces the turns it covers. Only the newest messages
+    # that the history window can select are read (a tail read).
     db_messages = config.databases.chat["messages"]
-    history = [
-        MESSAGE_MAP[entry.role](content=entry.text)
-        for entry in db_messages.list_messages(conversation_id)
-    ]
+    messages, summary = await asyncio.gather(
+        chat_writer.list_recent_messages(
+            conversation_id, history_window.max_messages
+        ),
+        db_messages.aget_summary(conversation_id),
+    )
+    pinned = body.message
+    if summary:
+        messages = [
+            m for m in messages if m.created_at > summary.summarized_until
+        ]
+        pinned = f"{summary_message(summary).content}\n{pinned}"
+
+    # The newest messages that fit the history window (count, token budget)
+    window = history_window.select(messages, pinned)
+    history = [MESSAGE_MAP[entry.role](content=entry.text) for entry in window]
+    if summary:
+        history.insert(0, summary_message(summary))
     history.append(HumanMessage(content=body.message))
 
+    # The stream holds the admission slot from here on
+    encoder = STREAM_ENCODERS[stream_format]
+    ticket.hand_over()
     return StreamingResponse(
-        chat_streamer(history, conversation_id, user.user_id, user.email),
-        media_type="text/event-stream",
+        chat_streamer(
+            history,
+            conversation_id,
+            user.user_id,
+            user.email,
+            ticket,
+            request.is_disconnected,
+            stream_format,
+        ),
+        media_type=encoder.media_type,
+        # In case the stream is never started (e.g. the client went away)
+        background=BackgroundTask(ticket.release),
     )
 
 
@@ -60,8 +128,10 @@ async def chat_streamer(
     conversation_id: str,
     user_id: str,
     email: str,
+    ticket: AdmissionTicket,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    stream_format: StreamFormat = "sse",
 ) -> AsyncGenerator[str, None]:
-    llm = config.models.llm
     full_response: list[str] = []
 
     # Metadata
@@ -92,38 +162,114 @@ async def chat_streamer(
         ),
     )
 
-    client = MultiServerMCPClient(
-        {
-            "mcpbot": {
-                "url": f"http://localhost:{PORT}/mcp/",
-                "transport": "streamable_http",
-                "headers": {"user_email": email},
-            }
-        }
-    )
+    encoder = STREAM_ENCODERS[stream_format](response)
+    if frame := encoder.start():
+        yield frame
+
+    # The admission slot is held until the agent is done. If the client
+    # disconnects, the agent run is cancelled along with the stream.
+    interrupted = False
+    try:
+        # Repeated FAQ questions are answered from cache, without the agent.
+        # Only standalone questions, follow-ups depend on the history.
+        standalone = len(messages) == 1
+        cached = (
+            await answer_cache.get(human_message)
+            if standalone
+            else AnswerLookup()
+        )
+        tools_used: set[str] = set()
+        if cached.answer is not None:
+            full_response.append(cached.answer)
+            yield encoder.delta(cached.answer)
+        else:
+            # Tokens are coalesced to reduce the number of writes per answer
+            stream = coalesce_text(
+                cancel_on_disconnect(
+                    agent_streamer(messages, email, tools_used),
+                    is_disconnected,
+                    interval_ms=STREAM_DISCONNECT_POLL_MS,
+                ),
+                interval_ms=STREAM_FLUSH_INTERVAL_MS,
+                max_bytes=STREAM_FLUSH_BYTES,
+            )
+            async with aclosing(stream):
+                async for text in stream:
+                    full_response.append(text)
+                    yield encoder.delta(text)
+    except ClientDisconnected:
+        interrupted = True
+    except (asyncio.CancelledError, GeneratorExit):
+        # The server stopped the stream, e.g. the client disconnected. It
+        # cannot wait here, the write is queued in the background.
+        if write := turn_write(response, "".join(full_response), True):
+            chat_writer.submit(write)
+            summarizer.schedule(write.conversation_id, write.user_id)
+        raise
+    finally:
+        ticket.release()
+
+    answer = "".join(full_response)
+    if not interrupted and cached.answer is None and standalone:
+        answer_cache.put(human_message, cached.embedding, answer, tools_used)
+    # Waits while the write-behind queue is full (backpressure)
+    if write := turn_write(response, answer, interrupted):
+        await chat_writer.put(write)
+        # Fold the oldest turns into the summary, off the request path
+        summarizer.schedule(write.conversation_id, write.user_id)
+    if not interrupted and (frame := encoder.done()):
+        yield frame
 
-    agent = create_react_agent(
-        model=llm,
-        tools=await client.get_tools(),
-        prompt=client_prompt(),
+
+def turn_write(
+    response: CreateMessageResponse,
+    answer: str,
+    interrupted: bool,
+) -> ConversationWrite | None:
+    """Returns the write of the messages of a chat turn, to queue.
+
+    The question and the answer are always stored together, so the turns of
+    the conversation stay consistent. An answer that was interrupted by a
+    client disconnect is stored as per `STREAM_DISCONNECT_POLICY`, and never
+    if it has no text yet (None).
+    """
+    if interrupted and (STREAM_DISCONNECT_POLICY == "discard" or not answer):
+        return None
+
+    response.ai.text = answer
+    count_tokens(response.human, token_estimator)
+    count_tokens(response.ai, token_estimator)
+    return ConversationWrite(
+        conversation_id=response.human.conversation_id,
+        user_id=response.human.user_id,
+        messages=[response.human, response.ai],
     )
+
+
+async def agent_streamer(
+    messages: list[BaseMessage],
+    email: str,
+    tools_used: set[str] | None = None,
+) -> AsyncGenerator[str, None]:
+    """Runs the agent and yields the text of the answer as it is generated.
+
+    Chunks without text (e.g. tool calls) and tool messages are skipped. The
+    names of the called tools are added to `tools_used`, if given.
+    """
+    # The agent is shared across requests, only the user context is bound here
+    agent = await get_agent(mcp, config.models.llm)
     stream = agent.astream(
         {"messages": messages},
-        {"recursion_limit": 7},
+        {
+            **meta_context_config(MetaContext(user_email=email)),
+            "recursion_limit": 7,
+        },
         stream_mode="messages",
     )
     async for chunk, _ in stream:
-        if isinstance(chunk, AIMessage):
-            full_response.append(chunk.content)  # type: ignore[arg-type]
-            response.ai.text = chunk.content  # type: ignore[assignment]
-            yield response.model_dump_json()
-
-    response.ai.text = "".join(full_response)
-
-    # Create the message in the database
-    db_messages = config.databases.chat["messages"]
-    db_conv = config.databases.chat["conversations"]
-    db_messages.delete_over_n_messages(conversation_id, MESSAGE_LIMIT - 2)
-    db_messages.create_message(**response.human.model_dump())
-    db_messages.create_message(**response.ai.model_dump())
-    db_conv.update_conversation_timestamp(conversation_id, user_id=user_id)
+        if isinstance(chunk, ToolMessage) and tools_used is not None:
+            # Failed calls are recorded apart, so the answer is not cached
+            name = chunk.name or ""
+            tools_used.add(name if chunk.status == "success" else f"{name}!")
+        elif isinstance(chunk, AIMessage) and (text := chunk.text()):
+            yield text
@@ -3,7 +3,9 @@ from typing import Any
 from fastapi import APIRouter
 
 from mcpbot.client.oauth2 import UserAuth
+from mcpbot.client.persistence import chat_writer
 from mcpbot.shared.init import config
+from mcpbot.shared.services.database_chat import ConversationActivity
 
 
 router_v1 = APIRouter(prefix="/v1")
@@ -16,16 +18,33 @@ async def messages_delete(
     message_id: str,
 ) -> dict[str, Any]:
     """Deletes a message and all messages after it in the conversation."""
+    # Queued messages must be stored before they can be deleted
+    await chat_writer.flush(conversation_id)
+
     db = config.databases.chat["messages"]
-    ordered_messages = db.list_messages(conversation_id, order_by="DESC")
-    if message_id not in [message.id for message in ordered_messages]:
+    db_conversations = config.databases.chat["conversations"]
+    message = await db.aget_message(message_id, conversation_id)
+    if message is None:
         return {}
 
-    # Delete all messages after the message_id inclusive
-    for i, message in enumerate(ordered_messages):
-        db.delete_message(message.id, conversation_id)
-        if message.id == message_id:
-            if message.role == "ai":
-                db.delete_message(ordered_messages[i + 1].id, conversation_id)
-            break
+    # An AI message is deleted with the human message it answers
+    created_at = message.created_at
+    if message.role == "ai":
+        previous = await db.aget_message_before(conversation_id, created_at)
+        if previous is not None:
+            created_at = previous.created_at
+
+    # The deleted messages are subtracted from the conversation
+    deleted = await db.adelete_messages_after(conversation_id, created_at)
+    last = await db.aget_message_before(conversation_id, created_at)
+    await db_conversations.aupdate_conversation_activity(
+        [
+            ConversationActivity.of(
+                conversation_id,
+                user.user_id,
+                deleted=deleted,
+                last=last,
+            )
+        ]
+    )
     return {}
@@ -1,8 +1,11 @@
-from fastapi import APIRouter
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Query, status
 
 from mcpbot.client.oauth2 import UserAuth
-from mcpbot.shared.init import config
-from mcpbot.shared.services.database_chat import Message, OrderBy
+from mcpbot.client.persistence import chat_writer
+from mcpbot.shared.config import PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT
+from mcpbot.shared.services.database_chat import Message, OrderBy, Page
 
 
 router_v1 = APIRouter(prefix="/v1")
@@ -13,7 +16,17 @@ async def messages_list(
     user: UserAuth,
     conversation_id: str,
     order_by: OrderBy = "ASC",
-) -> list[Message]:
-    """Lists all messages of a conversation."""
-    db = config.databases.chat["messages"]
-    return db.list_messages(conversation_id, order_by)
+    limit: Annotated[int, Query(ge=1, le=PAGE_MAX_LIMIT)] = PAGE_DEFAULT_LIMIT,
+    cursor: str | None = None,
+) -> Page[Message]:
+    """Lists a page of messages of a conversation. The next page is listed
+    with the `next_cursor` of the page, until it is null.
+    """
+    try:
+        return await chat_writer.list_messages_page(
+            conversation_id, order_by, limit, cursor
+        )
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)
+        )
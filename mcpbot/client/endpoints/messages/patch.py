@@ -1,7 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
 
+from mcpbot.client.admission import Admission
 from mcpbot.client.oauth2 import UserAuth
+from mcpbot.client.streaming import StreamFormat
 from .create import messages_create, MessagesBody
 from .delete import messages_delete
 
@@ -11,18 +13,25 @@ router_v1 = APIRouter(prefix="/v1")
 
 @router_v1.patch("/conversations/{conversation_id}/messages/{message_id}")
 async def messages_patch(
+    request: Request,
     user: UserAuth,
+    ticket: Admission,
     conversation_id: str,
     message_id: str,
     body: MessagesBody,
+    stream_format: StreamFormat = "sse",
 ) -> StreamingResponse:
     """Updates a message in the conversation. First, it deletes the message
     and all messages after it in the conversation. Then, it creates a new
     message with the new content.
+
+    The request is admitted before anything is deleted.
     """
     await messages_delete(
         user=user,
         conversation_id=conversation_id,
         message_id=message_id,
     )
-    return await messages_create(user, conversation_id, body)
+    return await messages_create(
+        request, user, ticket, conversation_id, body, stream_format
+    )
@@ -0,0 +1,7 @@
+from . import cache as system_cache, metrics as system_metrics
+
+
+__all__ = [
+    "system_cache",
+    "system_metrics",
+]
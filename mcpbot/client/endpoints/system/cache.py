@@ -0,0 +1,19 @@
+from typing import Any
+
+from fastapi import APIRouter
+
+from mcpbot.client.answer_cache import answer_cache
+from mcpbot.client.oauth2 import AdminAuth
+
+
+router_v1 = APIRouter(prefix="/v1")
+
+
+@router_v1.delete("/cache/answers")
+async def answer_cache_delete(user: AdminAuth) -> dict[str, Any]:
+    """Invalidates the cached answers, e.g. after the FAQ is updated.
+
+    Admins only (`ADMIN_EMAILS`).
+    """
+    answer_cache.invalidate()
+    return {}
@@ -0,0 +1,18 @@
+from typing import Any
+
+from fastapi import APIRouter
+
+from mcpbot.client.oauth2 import AdminAuth
+from mcpbot.shared.utils import collect_metrics
+
+
+router_v1 = APIRouter(prefix="/v1")
+
+
+@router_v1.get("/metrics")
+async def metrics_get(user: AdminAuth) -> dict[str, dict[str, Any]]:
+    """Returns the in-process metrics of the components (e.g. caches).
+
+    Admins only (`ADMIN_EMAILS`).
+    """
+    return collect_metrics()
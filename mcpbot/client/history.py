@@ -0,0 +1,158 @@
+from abc import ABC, abstractmethod
+from functools import cached_property
+from typing import Any, Literal
+
+from mcpbot.shared.config import (
+    HISTORY_MESSAGE_LIMIT,
+    HISTORY_TOKEN_BUDGET,
+    HISTORY_TOKEN_ESTIMATOR,
+)
+from mcpbot.shared.services.database_chat import Message
+
+
+TokenEstimatorType = Literal["chars", "tiktoken"]
+
+
+# Token estimators
+class TokenEstimator(ABC):
+    """Estimates the number of tokens of a text, locally."""
+
+    @abstractmethod
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+
+class CharTokenEstimator(TokenEstimator):
+    """Approximates the tokens by the number of characters (~4 per token)."""
+
+    def __init__(self, chars_per_token: float = 4.0) -> None:
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + 1
+
+
+class TiktokenEstimator(TokenEstimator):
+    """Counts the tokens with the tokenizer of the OpenAI models."""
+
+    def __init__(self, encoding: str = "cl100k_base") -> None:
+        self.encoding_name = encoding
+
+    @cached_property
+    def encoding(self) -> Any:
+        try:
+            import tiktoken
+        except ImportError as error:
+            raise ImportError(
+                "Unable to import tiktoken. "
+                "Please install with `pip install tiktoken`."
+            ) from error
+        return tiktoken.get_encoding(self.encoding_name)
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+def get_token_estimator(estimator: TokenEstimatorType) -> TokenEstimator:
+    if estimator == "chars":
+        return CharTokenEstimator()
+    elif estimator == "tiktoken":
+        return TiktokenEstimator()
+    else:
+        raise ValueError(f"Unsupported token estimator: {estimator}")
+
+
+def count_tokens(message: Message, estimator: TokenEstimator) -> int:
+    """Returns the token count of a message, cached on the message."""
+    if message.tokens is None:
+        message.tokens = estimator.count(message.text)
+    return message.tokens
+
+
+# History policies
+class HistoryPolicy(ABC):
+    """Selects which of the newest messages are sent to the LLM."""
+
+    @abstractmethod
+    def select(self, messages: list[Message], pinned: str) -> list[Message]:
+        """Selects the messages to keep.
+
+        Args:
+            messages: The history of the conversation, ordered ASC.
+            pinned: The text that is always sent along with the history (e.g.
+                the new question of the user and the conversation summary).
+
+        Returns:
+            The newest messages that satisfy the policy, ordered ASC.
+        """
+        raise NotImplementedError
+
+    @property
+    def max_messages(self) -> int | None:
+        """The most messages the policy selects (None if unbounded), so only
+        the newest ones need to be read.
+        """
+        return None
+
+
+class MessageCountPolicy(HistoryPolicy):
+    """Keeps the newest `limit` messages."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+
+    @property
+    def max_messages(self) -> int | None:
+        return max(self.limit, 0)
+
+    def select(self, messages: list[Message], pinned: str) -> list[Message]:
+        return messages[-self.limit :] if self.limit > 0 else []
+
+
+class TokenBudgetPolicy(HistoryPolicy):
+    """Keeps the newest messages that fit, with the pinned text, in a budget."""
+
+    def __init__(self, budget: int, estimator: TokenEstimator) -> None:
+        self.budget = budget
+        self.estimator = estimator
+
+    def select(self, messages: list[Message], pinned: str) -> list[Message]:
+        remaining = self.budget - self.estimator.count(pinned)
+        n_messages = 0
+        for message in reversed(messages):
+            remaining -= count_tokens(message, self.estimator)
+            if remaining < 0:
+                break
+            n_messages += 1
+        return messages[len(messages) - n_messages :]
+
+
+class HistoryWindow:
+    """Assembles the history window by applying all policies in turn."""
+
+    def __init__(self, policies: list[HistoryPolicy]) -> None:
+        self.policies = policies
+
+    @property
+    def max_messages(self) -> int | None:
+        """The most messages the window selects (None if unbounded)."""
+        limits = [
+            policy.max_messages
+            for policy in self.policies
+            if policy.max_messages is not None
+        ]
+        return min(limits) if limits else None
+
+    def select(self, messages: list[Message], pinned: str) -> list[Message]:
+        for policy in self.policies:
+            messages = policy.select(messages, pinned)
+        return messages
+
+
+token_estimator = get_token_estimator(HISTORY_TOKEN_ESTIMATOR)  # type: ignore[arg-type]
+history_window = HistoryWindow(
+    [
+        MessageCountPolicy(HISTORY_MESSAGE_LIMIT),
+        TokenBudgetPolicy(HISTORY_TOKEN_BUDGET, token_estimator),
+    ]
+)
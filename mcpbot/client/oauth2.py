@@ -7,7 +7,7 @@ import jwt
 from mcp.shared.auth import OAuthToken
 from pydantic import BaseModel
 
-from mcpbot.shared.config import HOST_URL
+from mcpbot.shared.config import ADMIN_EMAILS, HOST_URL
 from mcpbot.shared.init import config
 from mcpbot.shared.services.auth import CommonTokenParams
 
@@ -144,3 +144,27 @@ async def validate_user(token: Annotated[str, Depends(oauth2_scheme)]) -> User:
 
 
 UserAuth = Annotated[User, Depends(validate_user)]
+
+
+async def validate_admin(user: UserAuth) -> User:
+    """
+    Validate that the user is an admin (one of `ADMIN_EMAILS`).
+
+    Args:
+        user: The authenticated user.
+
+    Returns:
+        The User object containing user_id and email.
+
+    Raises:
+        HTTPException: If the user is not an admin.
+    """
+    if user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required",
+        )
+    return user
+
+
+AdminAuth = Annotated[User, Depends(validate_admin)]
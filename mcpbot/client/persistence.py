@@ -0,0 +1,333 @@
+import asyncio
+from collections import defaultdict
+import logging
+
+from pydantic import BaseModel
+
+from mcpbot.shared.config import (
+    CHAT_WRITE_BATCH_SIZE,
+    CHAT_WRITE_QUEUE_SIZE,
+    CHAT_WRITE_WINDOW_MS,
+    PAGE_DEFAULT_LIMIT,
+)
+from mcpbot.shared.init import config
+from mcpbot.shared.services.database_chat import (
+    ChatDB,
+    ConversationActivity,
+    Message,
+    OrderBy,
+    Page,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationWrite(BaseModel):
+    """The writes of a chat turn: the messages to add to the conversation."""
+
+    conversation_id: str
+    user_id: str
+    messages: list[Message]
+
+    def apply(self, messages: list[Message]) -> list[Message]:
+        """Applies the write to a list of messages (ordered ASC).
+
+        Messages that are already in the list (i.e. the write is being
+        persisted at the moment) are not added twice.
+        """
+        stored = {message.id for message in messages}
+        return messages + [
+            message for message in self.messages if message.id not in stored
+        ]
+
+
+# A queued write and the future of its outcome
+_QueuedWrite = tuple[ConversationWrite, asyncio.Future[None]]
+
+
+class ChatWriteQueue:
+    """Write-behind queue for the messages of the chat.
+
+    The writes are persisted by a background worker, off the request path,
+    with group commit: the writes of concurrent requests are collected for
+    `window_ms` (or up to `batch_size` writes), then the messages of all of
+    them are stored with one call to the database, and the activity of the
+    conversations (timestamp, message count, tokens, last message) with
+    another. Writes of the same conversation are stored in order. Every write
+    gets a future with its own outcome: it fails if any of its messages could
+    not be stored, without failing the rest of the group.
+
+    While a write is queued, `list_messages` overlays it on the stored
+    messages, so the reads of a conversation stay consistent.
+
+    If the worker is not running, the writes are persisted directly.
+    """
+
+    def __init__(
+        self,
+        db_messages: ChatDB,
+        db_conversations: ChatDB,
+        max_size: int = CHAT_WRITE_QUEUE_SIZE,
+        batch_size: int = CHAT_WRITE_BATCH_SIZE,
+        window_ms: int = CHAT_WRITE_WINDOW_MS,
+    ) -> None:
+        self.db_messages = db_messages
+        self.db_conversations = db_conversations
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.window_ms = window_ms
+
+        self._pending: dict[str, list[ConversationWrite]] = defaultdict(list)
+        self._queue: asyncio.Queue[_QueuedWrite] | None = None
+        self._flushed: asyncio.Condition | None = None
+        self._worker: asyncio.Task[None] | None = None
+        self._submitted: set[asyncio.Task[None]] = set()
+
+    async def start(self) -> None:
+        """Starts the background worker."""
+        self._queue = asyncio.Queue(self.max_size)
+        self._flushed = asyncio.Condition()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Persists all queued writes and stops the background worker."""
+        if self._submitted:
+            await asyncio.gather(*self._submitted, return_exceptions=True)
+        if self._queue is None or self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        self._queue, self._flushed, self._worker = None, None, None
+
+    async def put(self, write: ConversationWrite) -> asyncio.Future[None]:
+        """Queues a write. Waits if the queue is full.
+
+        Returns:
+            A future resolved once the write is persisted, or failed with the
+            error that prevented it.
+        """
+        done = asyncio.get_running_loop().create_future()
+        if self._queue is None:
+            await self._commit([(write, done)])
+            return done
+        self._pending[write.conversation_id].append(write)
+        try:
+            await self._queue.put((write, done))
+        except BaseException:
+            # Cancelled while waiting, the write was never queued
+            self._unpend(write)
+            task = asyncio.create_task(self._notify_flushed())
+            self._submitted.add(task)
+            task.add_done_callback(self._submitted.discard)
+            raise
+        return done
+
+    def submit(self, write: ConversationWrite) -> asyncio.Future[None]:
+        """Queues a write without waiting, only where `put` cannot be awaited
+        (e.g. a cancelled request), as it is not bound by `max_size`.
+
+        The write is visible to `list_messages` and `flush` right away.
+
+        Returns:
+            A future resolved once the write is persisted, or failed with the
+            error that prevented it.
+        """
+        done = asyncio.get_running_loop().create_future()
+        if self._queue is None:
+            task = asyncio.create_task(self._commit([(write, done)]))
+        else:
+            self._pending[write.conversation_id].append(write)
+            task = asyncio.create_task(self._queue.put((write, done)))
+        self._submitted.add(task)
+        task.add_done_callback(self._submitted.discard)
+        return done
+
+    async def flush(self, conversation_id: str) -> None:
+        """Waits until the queued writes of a conversation are persisted."""
+        if self._flushed is None:
+            return
+        async with self._flushed:
+            await self._flushed.wait_for(
+                lambda: not self._pending.get(conversation_id)
+            )
+
+    async def list_messages(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+    ) -> list[Message]:
+        """Lists the messages of a conversation, including queued writes."""
+        pending = list(self._pending.get(conversation_id, []))
+        if not pending:
+            return await self.db_messages.alist_messages(
+                conversation_id, order_by
+            )
+
+        messages = await self.db_messages.alist_messages(conversation_id)
+        for write in pending:
+            messages = write.apply(messages)
+        if order_by == "DESC":
+            messages.reverse()
+        return messages
+
+    async def list_recent_messages(
+        self,
+        conversation_id: str,
+        n_messages: int | None,
+    ) -> list[Message]:
+        """Lists the newest `n_messages` messages of a conversation (all if
+        None), ordered ASC, including queued writes.
+        """
+        if n_messages is None:
+            return await self.list_messages(conversation_id)
+        pending = list(self._pending.get(conversation_id, []))
+        messages = await self.db_messages.alist_recent_messages(
+            conversation_id, n_messages
+        )
+        for write in pending:
+            messages = write.apply(messages)
+        return messages[-n_messages:] if n_messages > 0 else []
+
+    async def list_messages_page(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Message]:
+        """Lists a page of the messages of a conversation.
+
+        The queued writes of the conversation are persisted first, so the
+        cursors stay valid across the pages.
+
+        Raises:
+            ValueError: If the cursor is invalid.
+        """
+        await self.flush(conversation_id)
+        return await self.db_messages.alist_messages_page(
+            conversation_id, order_by, limit, cursor
+        )
+
+    async def _run(self) -> None:
+        assert self._queue is not None and self._flushed is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # Collect the writes of the concurrent requests into one group
+            deadline = loop.time() + self.window_ms / 1000
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(
+                            await asyncio.wait_for(self._queue.get(), timeout)
+                        )
+                    except TimeoutError:
+                        break
+                else:
+                    batch.append(self._queue.get_nowait())
+
+            try:
+                await self._commit(batch)
+            except Exception:
+                logger.exception("Failed to persist a group of chat writes.")
+            finally:
+                for write, _ in batch:
+                    self._unpend(write)
+                    self._queue.task_done()
+
+            await self._notify_flushed()
+
+    async def _notify_flushed(self) -> None:
+        if self._flushed is not None:
+            async with self._flushed:
+                self._flushed.notify_all()
+
+    def _unpend(self, write: ConversationWrite) -> None:
+        pending = self._pending[write.conversation_id]
+        pending.remove(write)
+        if not pending:
+            del self._pending[write.conversation_id]
+
+    async def _commit(self, batch: list[_QueuedWrite]) -> None:
+        """Persists a group of writes and resolves their futures, also if the
+        commit fails or is cancelled, so the callers never wait forever.
+        """
+        errors: list[Exception | None]
+        try:
+            errors = await self._store(batch)
+        except Exception as error:
+            errors = [error] * len(batch)
+            raise
+        except BaseException:
+            # E.g. the worker is cancelled on shutdown
+            errors = [RuntimeError("The write was cancelled.")] * len(batch)
+            raise
+        finally:
+            for (write, done), failure in zip(batch, errors):
+                if done.done():
+                    continue
+                if failure is None:
+                    done.set_result(None)
+                    continue
+                logger.error(
+                    "Failed to persist messages of "
+                    f"'{write.conversation_id}': {failure}"
+                )
+                done.set_exception(failure)
+                # Mark it retrieved, the caller may not wait for the outcome
+                done.exception()
+
+    async def _store(self, batch: list[_QueuedWrite]) -> list[Exception | None]:
+        """Persists a group of writes.
+
+        Returns:
+            For each write, None if it was persisted or the error.
+        """
+        messages = [message for write, _ in batch for message in write.messages]
+        errors: list[Exception | None] = [None] * len(batch)
+        try:
+            results = await self.db_messages.acreate_messages(messages)
+        except Exception as error:
+            results = [error] * len(messages)
+
+        # The first error of the messages of a write fails it
+        results_iter = iter(results)
+        for i, (write, _) in enumerate(batch):
+            for _, result in zip(write.messages, results_iter):
+                if result is not None and errors[i] is None:
+                    errors[i] = result
+
+        # The stored messages are counted once per conversation
+        added: dict[tuple[str, str], list[Message]] = defaultdict(list)
+        for message, result in zip(messages, results):
+            if result is None:
+                added[(message.conversation_id, message.user_id)].append(
+                    message
+                )
+        activities = [
+            ConversationActivity.of(conversation_id, user_id, added=stored)
+            for (conversation_id, user_id), stored in added.items()
+        ]
+        if activities:
+            db = self.db_conversations
+            try:
+                results = await db.aupdate_conversation_activity(activities)
+            except Exception as error:
+                results = [error] * len(activities)
+            for activity, result in zip(activities, results):
+                if result is not None:
+                    logger.error(
+                        "Failed to update the conversation "
+                        f"'{activity.conversation_id}': {result}"
+                    )
+        return errors
+
+
+chat_writer = ChatWriteQueue(
+    db_messages=config.databases.chat["messages"],
+    db_conversations=config.databases.chat["conversations"],
+)
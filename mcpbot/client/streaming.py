@@ -0,0 +1,286 @@
+from abc import ABC, abstractmethod
+import asyncio
+import time
+from typing import (
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Literal,
+    TypeVar,
+)
+
+from pydantic import BaseModel
+
+from mcpbot.shared.services.database_chat import Message
+
+
+T = TypeVar("T")
+
+STREAM_VERSION = 1
+
+# - sse: Server-sent events with a start, delta(s) and done event (default)
+# - json: Legacy format, the full CreateMessageResponse for every token
+StreamFormat = Literal["sse", "json"]
+
+# What happens to an answer that is interrupted by a client disconnect:
+# - persist: The question and the partial answer are stored (default)
+# - discard: Nothing is stored, as if the question was never asked
+DisconnectPolicy = Literal["persist", "discard"]
+
+
+class ClientDisconnected(Exception):
+    """The client disconnected while the answer was being streamed."""
+
+
+class CreateMessageResponse(BaseModel):
+    human: Message
+    ai: Message
+
+
+class StartEvent(BaseModel):
+    version: int = STREAM_VERSION
+    human: Message
+    ai: Message
+
+
+class DeltaEvent(BaseModel):
+    text: str
+
+
+class DoneEvent(BaseModel):
+    human_id: str
+    ai_id: str
+
+
+class StreamEncoder(ABC):
+    """Encodes the answer of the agent to the frames sent to the client."""
+
+    media_type = "text/event-stream"
+
+    def __init__(self, response: CreateMessageResponse) -> None:
+        self.response = response
+
+    @abstractmethod
+    def start(self) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delta(self, text: str) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def done(self) -> str:
+        raise NotImplementedError
+
+
+class SseStreamEncoder(StreamEncoder):
+    """Server-sent events, where only the new text is sent per token.
+
+    The stream consists of:
+    - `start`: The human message and the (empty) AI message, sent once.
+    - `delta`: The text added to the AI message.
+    - `done`: The IDs of the stored human and AI messages, sent once.
+    """
+
+    def __init__(self, response: CreateMessageResponse) -> None:
+        super().__init__(response)
+        self.event_id = 0
+
+    def start(self) -> str:
+        event = StartEvent(human=self.response.human, ai=self.response.ai)
+        return self._frame("start", event)
+
+    def delta(self, text: str) -> str:
+        return self._frame("delta", DeltaEvent(text=text))
+
+    def done(self) -> str:
+        event = DoneEvent(
+            human_id=self.response.human.id,
+            ai_id=self.response.ai.id,
+        )
+        return self._frame("done", event)
+
+    def _frame(self, event: str, data: BaseModel) -> str:
+        frame = f"id: {self.event_id}\nevent: {event}\n"
+        frame += f"data: {data.model_dump_json()}\n\n"
+        self.event_id += 1
+        return frame
+
+
+class JsonStreamEncoder(StreamEncoder):
+    """Legacy format, the full response is sent for every token, without any
+    framing. The text of the AI message only contains the new text.
+    """
+
+    def start(self) -> str:
+        return ""
+
+    def delta(self, text: str) -> str:
+        self.response.ai.text = text
+        return self.response.model_dump_json()
+
+    def done(self) -> str:
+        return ""
+
+
+STREAM_ENCODERS: dict[StreamFormat, type[StreamEncoder]] = {
+    "sse": SseStreamEncoder,
+    "json": JsonStreamEncoder,
+}
+
+
+async def coalesce_text(
+    stream: AsyncIterator[str],
+    interval_ms: int,
+    max_bytes: int,
+) -> AsyncGenerator[str, None]:
+    """Coalesces the text of a token stream into larger chunks.
+
+    The first token is yielded immediately, to keep the time to first token.
+    Afterwards, the text is buffered and yielded every `interval_ms`
+    milliseconds or when the buffer reaches `max_bytes`, whichever comes
+    first. The remaining text is yielded when the stream ends, or before an
+    error of the stream (e.g. `ClientDisconnected`) is raised, so the caller
+    always gets all the text that was produced.
+
+    Args:
+        stream: The stream of text tokens.
+        interval_ms: The maximum time to buffer text for, in milliseconds.
+        max_bytes: The maximum size of the buffered text, in bytes.
+
+    Yields:
+        The coalesced text.
+    """
+    iterator = aiter(stream)
+    interval = interval_ms / 1000
+    buffer: list[str] = []
+    buffer_size = 0
+    first_token = True
+    next_token: asyncio.Task[str] | None = None
+    flush_at = 0.0
+
+    try:
+        while True:
+            if next_token is None:
+                next_token = asyncio.ensure_future(anext(iterator))
+
+            # Wait for the next token, but not longer than the flush deadline
+            timeout = max(flush_at - time.monotonic(), 0) if buffer else None
+            done, _ = await asyncio.wait({next_token}, timeout=timeout)
+            if not done:
+                yield "".join(buffer)
+                buffer, buffer_size = [], 0
+                continue
+
+            try:
+                text = next_token.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if buffer:
+                    yield "".join(buffer)
+                    buffer, buffer_size = [], 0
+                raise
+            finally:
+                next_token = None
+
+            if first_token:
+                first_token = False
+                yield text
+                continue
+
+            if not buffer:
+                flush_at = time.monotonic() + interval
+            buffer.append(text)
+            buffer_size += len(text.encode("utf-8"))
+            if buffer_size >= max_bytes or time.monotonic() >= flush_at:
+                yield "".join(buffer)
+                buffer, buffer_size = [], 0
+    finally:
+        # A read is pending only if this generator was closed or cancelled,
+        # then its text cannot be yielded anymore
+        await close_stream(iterator, next_token)
+
+    if buffer:
+        yield "".join(buffer)
+
+
+async def cancel_on_disconnect(
+    stream: AsyncIterator[str],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    interval_ms: int,
+) -> AsyncGenerator[str, None]:
+    """Yields the text of a stream until the client disconnects.
+
+    The client is checked every `interval_ms` milliseconds, also while the
+    stream is idle (e.g. during a tool call). On a disconnect, the stream is
+    closed, which cancels the work behind it (e.g. the agent run and its LLM
+    calls). The text that was read in the meantime is yielded before the
+    error is raised, so it is not lost from the partial answer.
+
+    Raises:
+        ClientDisconnected: If the client disconnected.
+    """
+    iterator = aiter(stream)
+    interval = interval_ms / 1000
+    next_token: asyncio.Task[str] | None = None
+    check_at = time.monotonic() + interval
+
+    try:
+        while True:
+            if next_token is None:
+                next_token = asyncio.ensure_future(anext(iterator))
+
+            timeout = max(check_at - time.monotonic(), 0)
+            done, _ = await asyncio.wait({next_token}, timeout=timeout)
+            if time.monotonic() >= check_at:
+                if await is_disconnected():
+                    pending, next_token = next_token, None
+                    text = await close_stream(iterator, pending)
+                    if text is not None:
+                        yield text
+                    raise ClientDisconnected()
+                check_at = time.monotonic() + interval
+            if not done:
+                continue
+
+            try:
+                text = next_token.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                next_token = None
+            yield text
+    finally:
+        await close_stream(iterator, next_token)
+
+
+async def close_stream(
+    iterator: AsyncIterator[T],
+    pending: asyncio.Future[T] | None,
+) -> T | None:
+    """Closes a stream, so the work behind it stops right away.
+
+    The pending read is cancelled first, which cancels the stream where it
+    waits. The stream is closed afterwards in any case, as the read may have
+    finished already, and then the cancel has no effect.
+
+    Args:
+        iterator: The stream to close.
+        pending: The pending read of the stream, if any.
+
+    Returns:
+        The item of the pending read, if it finished before it could be
+        cancelled. None otherwise.
+    """
+    item: T | None = None
+    if pending is not None:
+        pending.cancel()
+        # A stream cannot be closed while it is being read
+        await asyncio.wait({pending})
+        if not pending.cancelled() and pending.exception() is None:
+            item = pending.result()
+    if isinstance(iterator, AsyncGenerator):
+        await iterator.aclose()
+    return item
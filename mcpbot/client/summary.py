@@ -0,0 +1,170 @@
+import asyncio
+from datetime import UTC, datetime
+import logging
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from mcpbot.client.persistence import ChatWriteQueue, chat_writer
+from mcpbot.shared.config import (
+    SUMMARY_KEEP_MESSAGES,
+    SUMMARY_SHUTDOWN_TIMEOUT,
+    SUMMARY_THRESHOLD,
+)
+from mcpbot.shared.init import config
+from mcpbot.shared.services.database_chat import (
+    ChatDB,
+    ConversationActivity,
+    Message,
+    Summary,
+)
+
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """
+You maintain the running summary of a conversation between a Devoteam employee and an assistant.
+Update the summary with the new messages. Keep every fact that may be needed later in the conversation (names, dates, reservations, decisions, open questions) and drop small talk.
+Answer only with the updated summary, in at most 200 words.
+"""
+
+
+def summary_message(summary: Summary) -> SystemMessage:
+    """Returns the message that replaces the summarized turns in the prompt."""
+    return SystemMessage(
+        content=f"Summary of the earlier conversation:\n{summary.text}"
+    )
+
+
+class ConversationSummarizer:
+    """Folds the oldest turns of a conversation into a rolling summary.
+
+    When a conversation has more than `threshold` messages, all but the newest
+    `keep` messages are summarized, together with the existing summary, into a
+    new summary. The summarized messages are then deleted with one range
+    delete, so every run only summarizes the messages added since the
+    previous one, and subtracted from the conversation.
+
+    The summarization runs in the background, off the request path.
+    """
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        db_messages: ChatDB,
+        db_conversations: ChatDB,
+        writer: ChatWriteQueue,
+        threshold: int = SUMMARY_THRESHOLD,
+        keep: int = SUMMARY_KEEP_MESSAGES,
+    ) -> None:
+        self.llm = llm
+        self.db_messages = db_messages
+        self.db_conversations = db_conversations
+        self.writer = writer
+        self.threshold = threshold
+        self.keep = keep
+        self._tasks: dict[str, asyncio.Task[None]] = dict()
+        self._stopped = False
+
+    def schedule(self, conversation_id: str, user_id: str) -> None:
+        """Summarizes the conversation in the background, if needed.
+
+        Only one summarization runs per conversation at a time, and none
+        once the summarizer is stopped.
+        """
+        if self._stopped or conversation_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(conversation_id, user_id))
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(conversation_id))
+
+    async def stop(self, timeout: float = SUMMARY_SHUTDOWN_TIMEOUT) -> None:
+        """Waits for the running summarizations, e.g. on shutdown.
+
+        The ones still running after `timeout` seconds are cancelled. The
+        summary is stored before the folded messages are deleted, so a
+        cancelled run loses nothing: the next run folds them again.
+        """
+        self._stopped = True
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, running = await asyncio.wait(tasks, timeout=timeout)
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    async def summarize(
+        self,
+        conversation_id: str,
+        user_id: str,
+    ) -> Summary | None:
+        """Folds the oldest messages of the conversation into the summary.
+
+        Returns:
+            The new summary or None if the threshold was not crossed.
+        """
+        messages = await self.db_messages.alist_messages(conversation_id)
+        if len(messages) <= self.threshold:
+            return None
+
+        folded = messages[: len(messages) - self.keep]
+        summary = await self.db_messages.aget_summary(conversation_id)
+
+        response = await self.llm.ainvoke(
+            [
+                SystemMessage(content=SUMMARY_PROMPT),
+                HumanMessage(content=self._render(summary, folded)),
+            ]
+        )
+        new_summary = Summary(
+            conversation_id=conversation_id,
+            user_id=user_id,
+            text=response.text(),
+            summarized_until=folded[-1].created_at,
+            updated_at=datetime.now(UTC).isoformat(),
+        )
+
+        # Store the summary before deleting, so no turn is ever lost
+        await self.db_messages.aupsert_summary(new_summary)
+        deleted = await self.db_messages.adelete_messages_until(
+            conversation_id, new_summary.summarized_until
+        )
+        recent = await self.db_messages.alist_recent_messages(
+            conversation_id, 1
+        )
+        await self.db_conversations.aupdate_conversation_activity(
+            [
+                ConversationActivity.of(
+                    conversation_id,
+                    user_id,
+                    deleted=deleted,
+                    last=recent[-1] if recent else None,
+                )
+            ]
+        )
+        return new_summary
+
+    async def _run(self, conversation_id: str, user_id: str) -> None:
+        try:
+            # The latest turn may still be in the write-behind queue
+            await self.writer.flush(conversation_id)
+            await self.summarize(conversation_id, user_id)
+        except Exception:
+            logger.exception(f"Failed to summarize '{conversation_id}'.")
+
+    @staticmethod
+    def _render(summary: Summary | None, messages: list[Message]) -> str:
+        turns = "\n".join(
+            f"{message.role.upper()}: {message.text}" for message in messages
+        )
+        previous = summary.text if summary else "(empty)"
+        return f"Current summary:\n{previous}\n\nNew messages:\n{turns}"
+
+
+summarizer = ConversationSummarizer(
+    llm=config.models.llm,
+    db_messages=config.databases.chat["messages"],
+    db_conversations=config.databases.chat["conversations"],
+    writer=chat_writer,
+)
@@ -2,7 +2,6 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from mcp.server import FastMCP
 from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
 from starlette.middleware.base import RequestResponseEndpoint
 
@@ -18,21 +17,17 @@ from mcpbot.client.endpoints.messages import (
     messages_list,
     messages_patch,
 )
+from mcpbot.client.endpoints.system import system_cache, system_metrics
 from mcpbot.client.oauth2 import validate_access_token
-from mcpbot.server import prompts, tools
-from mcpbot.server.common import add_prompts_from_module, add_tools_from_module
+from mcpbot.client.persistence import chat_writer
+from mcpbot.client.summary import summarizer
 from mcpbot.server.context import MetaContext, inject_meta_context
+from mcpbot.server.main import TITLE, mcp
 from mcpbot.shared.config import CORS_ORIGINS
+from mcpbot.shared.init import config
 
 
-TITLE = "MCP Client & Server"
-
-
-# MCP Server
-mcp = FastMCP(name=TITLE)
-add_prompts_from_module(mcp, prompts)
-add_tools_from_module(mcp, tools)
-
+# MCP Server (HTTP transport for external MCP clients)
 session_manager = StreamableHTTPSessionManager(
     app=mcp._mcp_server, json_response=False, stateless=False
 )
@@ -41,8 +36,17 @@ session_manager = StreamableHTTPSessionManager(
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for the FastAPI app."""
-    async with session_manager.run():
-        yield
+    await chat_writer.start()
+    try:
+        async with session_manager.run():
+            yield
+    finally:
+        # Finish the running summaries (they flush the queue), then drain the
+        # queued chat messages before shutting down
+        await summarizer.stop()
+        await chat_writer.stop()
+        for db in config.databases.chat.values():
+            await db.aclose()
 
 
 async def mcp_asgi_app(scope, receive, send):
@@ -73,6 +77,8 @@ app.include_router(messages_create.router_v1, tags=["Messages"])
 app.include_router(messages_delete.router_v1, tags=["Messages"])
 app.include_router(messages_list.router_v1, tags=["Messages"])
 app.include_router(messages_patch.router_v1, tags=["Messages"])
+app.include_router(system_cache.router_v1, tags=["System"])
+app.include_router(system_metrics.router_v1, tags=["System"])
 
 app.mount("/mcp/", mcp_asgi_app)
 
@@ -0,0 +1,13 @@
+from mcp.server import FastMCP
+
+from mcpbot.server import prompts, tools
+from mcpbot.server.common import add_prompts_from_module, add_tools_from_module
+
+
+TITLE = "MCP Client & Server"
+
+
+# MCP Server
+mcp = FastMCP(name=TITLE)
+add_prompts_from_module(mcp, prompts)
+add_tools_from_module(mcp, tools)
@@ -0,0 +1,126 @@
+import json
+from typing import Any
+from uuid import uuid4
+
+import anyio
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from mcp.server import FastMCP
+from mcp.server.fastmcp.exceptions import ToolError
+from mcp.server.lowlevel.server import request_ctx
+from mcp.server.models import InitializationOptions
+from mcp.server.session import ServerSession
+from mcp.shared.context import RequestContext
+from mcp.shared.message import SessionMessage
+from mcp.types import (
+    ContentBlock,
+    RequestParams,
+    ServerCapabilities,
+    TextContent,
+    Tool as MCPTool,
+)
+
+from mcpbot.server.context import MetaContext
+
+
+META_CONTEXT_KEY = "meta_context"
+
+
+async def load_local_tools(server: FastMCP) -> list[BaseTool]:
+    """Loads the tools of an MCP server that runs in the same process.
+
+    The tools are called directly on the server, skipping the HTTP transport
+    and the JSON-RPC encoding, and return the same text as over HTTP. The
+    tools do not hold any per-request state, so they can be shared across
+    requests. The meta context of a call is read from the `configurable` of
+    the run config, under `META_CONTEXT_KEY`, and is passed to the tool the
+    same way the HTTP transport passes the `params['_meta']` of a request.
+
+    Args:
+        server: The MCP server to load the tools from.
+
+    Returns:
+        The tools of the server as LangChain tools.
+    """
+    return [
+        convert_local_tool(server, tool) for tool in await server.list_tools()
+    ]
+
+
+def meta_context_config(context: MetaContext) -> RunnableConfig:
+    """Returns the run config that binds the meta context to the tool calls."""
+    return {"configurable": {META_CONTEXT_KEY: context}}
+
+
+def local_session(server: FastMCP) -> ServerSession:
+    """Returns a session without a client, for the calls made in-process.
+
+    Its streams are closed, so a tool that sends a request or a notification
+    to the client (e.g. a progress report) gets an error instead of waiting.
+    """
+    read_writer, read_stream = anyio.create_memory_object_stream[
+        SessionMessage | Exception
+    ](0)
+    write_stream, write_reader = anyio.create_memory_object_stream[
+        SessionMessage
+    ](0)
+    read_writer.close()
+    write_reader.close()
+    return ServerSession(
+        read_stream,
+        write_stream,
+        InitializationOptions(
+            server_name=server.name,
+            server_version="",
+            capabilities=ServerCapabilities(),
+        ),
+        stateless=True,
+    )
+
+
+def tool_content(result: Any) -> str | list[str]:
+    """Returns the text of a tool result, as the HTTP transport does."""
+    if isinstance(result, dict):
+        return json.dumps(result)
+    # Tools with an output schema return the (unstructured, structured) pair
+    if isinstance(result, tuple):
+        result = result[0]
+    blocks: list[ContentBlock] = list(result)
+    texts = [block.text for block in blocks if isinstance(block, TextContent)]
+    return texts[0] if len(texts) == 1 else texts
+
+
+def convert_local_tool(server: FastMCP, tool: MCPTool) -> BaseTool:
+    """Converts a tool of an in-process MCP server to a LangChain tool."""
+
+    session = local_session(server)
+
+    async def call_tool(config: RunnableConfig, **arguments: Any) -> Any:
+        context = config.get("configurable", {}).get(META_CONTEXT_KEY)
+        # FastMCP reads the context of the current request from `request_ctx`
+        token = request_ctx.set(
+            RequestContext(
+                request_id=uuid4().hex,
+                meta=(
+                    RequestParams.Meta(**context.model_dump())
+                    if isinstance(context, MetaContext)
+                    else None
+                ),
+                session=session,
+                lifespan_context={},
+            )
+        )
+        try:
+            return tool_content(await server.call_tool(tool.name, arguments))
+        except ToolError as error:
+            raise ToolException(str(error)) from error
+        finally:
+            request_ctx.reset(token)
+
+    return StructuredTool(
+        name=tool.name,
+        description=tool.description or "",
+        args_schema=tool.inputSchema,
+        coroutine=call_tool,
+        metadata=tool.annotations.model_dump() if tool.annotations else None,
+    )
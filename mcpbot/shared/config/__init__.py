@@ -1,14 +1,85 @@
-from .main import COMPANY, CONFIG_FILE, CORS_ORIGINS, ENV, HOST_URL, PORT
+from .main import (
+    ADMIN_EMAILS,
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MAX_QUEUE_PER_USER,
+    ADMISSION_MAX_WAIT,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    CHAT_CACHE_MESSAGES,
+    CHAT_CACHE_SIZE_MB,
+    CHAT_CACHE_TTL,
+    CHAT_DB_MAX_THREADS,
+    CHAT_WRITE_BATCH_SIZE,
+    CHAT_WRITE_QUEUE_SIZE,
+    CHAT_WRITE_WINDOW_MS,
+    COMPANY,
+    CONFIG_FILE,
+    CONVERSATION_PREVIEW_CHARS,
+    CORS_ORIGINS,
+    EMBEDDINGS_CACHE_PATH,
+    EMBEDDINGS_CACHE_SIZE,
+    ENV,
+    HISTORY_MESSAGE_LIMIT,
+    HISTORY_TOKEN_BUDGET,
+    HISTORY_TOKEN_ESTIMATOR,
+    HOST_URL,
+    PAGE_DEFAULT_LIMIT,
+    PAGE_MAX_LIMIT,
+    PORT,
+    STREAM_DISCONNECT_POLICY,
+    STREAM_DISCONNECT_POLL_MS,
+    STREAM_FLUSH_BYTES,
+    STREAM_FLUSH_INTERVAL_MS,
+    SUMMARY_KEEP_MESSAGES,
+    SUMMARY_SHUTDOWN_TIMEOUT,
+    SUMMARY_THRESHOLD,
+    VECTOR_UPSERT_BATCH_SIZE,
+    VECTOR_UPSERT_CONCURRENCY,
+)
 from .yaml_schema import DatabaseConfig, YamlConfig
 
 
 __all__ = [
+    "ADMIN_EMAILS",
+    "ADMISSION_MAX_CONCURRENT",
+    "ADMISSION_MAX_QUEUE",
+    "ADMISSION_MAX_QUEUE_PER_USER",
+    "ADMISSION_MAX_WAIT",
+    "ANSWER_CACHE_SIZE",
+    "ANSWER_CACHE_THRESHOLD",
+    "ANSWER_CACHE_TTL",
+    "CHAT_CACHE_MESSAGES",
+    "CHAT_CACHE_SIZE_MB",
+    "CHAT_CACHE_TTL",
+    "CHAT_DB_MAX_THREADS",
+    "CHAT_WRITE_BATCH_SIZE",
+    "CHAT_WRITE_QUEUE_SIZE",
+    "CHAT_WRITE_WINDOW_MS",
     "COMPANY",
     "CONFIG_FILE",
+    "CONVERSATION_PREVIEW_CHARS",
     "CORS_ORIGINS",
     "DatabaseConfig",
+    "EMBEDDINGS_CACHE_PATH",
+    "EMBEDDINGS_CACHE_SIZE",
     "ENV",
+    "HISTORY_MESSAGE_LIMIT",
+    "HISTORY_TOKEN_BUDGET",
+    "HISTORY_TOKEN_ESTIMATOR",
     "HOST_URL",
+    "PAGE_DEFAULT_LIMIT",
+    "PAGE_MAX_LIMIT",
     "PORT",
+    "STREAM_DISCONNECT_POLICY",
+    "STREAM_DISCONNECT_POLL_MS",
+    "STREAM_FLUSH_BYTES",
+    "STREAM_FLUSH_INTERVAL_MS",
+    "SUMMARY_KEEP_MESSAGES",
+    "SUMMARY_SHUTDOWN_TIMEOUT",
+    "SUMMARY_THRESHOLD",
+    "VECTOR_UPSERT_BATCH_SIZE",
+    "VECTOR_UPSERT_CONCURRENCY",
     "YamlConfig",
 ]
@@ -13,3 +13,66 @@ CONFIG_FILE = "mcpbot/config-local.yml" if LOCAL else "mcpbot/config-azure.yml"
 COMPANY = "Devoteam"
 
 CORS_ORIGINS = ["*"]
+# The users allowed to use the admin endpoints (e.g. metrics, cache)
+ADMIN_EMAILS = frozenset(
+    email.strip().lower()
+    for email in os.getenv("ADMIN_EMAILS", "").split(",")
+    if email.strip()
+)
+
+# Admission: Max. agents running at once, then per-user queues (bounded)
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 8))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 32))
+ADMISSION_MAX_QUEUE_PER_USER = int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", 4))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", 10))
+
+# Answer cache: Similar FAQ questions (cosine) are answered from cache
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 500))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))
+
+# Chat persistence: Size of the write-behind queue and of a flushed batch
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", 1000))
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", 100))
+# Chat persistence: How long the writes are collected into one group commit
+CHAT_WRITE_WINDOW_MS = int(os.getenv("CHAT_WRITE_WINDOW_MS", 20))
+# Chat persistence: Threads for the blocking I/O of the local chat databases
+CHAT_DB_MAX_THREADS = int(os.getenv("CHAT_DB_MAX_THREADS", 8))
+# Chat persistence: In-process cache of the recent conversations (0 disables)
+CHAT_CACHE_SIZE_MB = int(os.getenv("CHAT_CACHE_SIZE_MB", 32))
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", 300))
+# Chat persistence: Newest messages cached per conversation for the history
+CHAT_CACHE_MESSAGES = int(os.getenv("CHAT_CACHE_MESSAGES", 50))
+# Chat persistence: Length of the last message preview of a conversation
+CONVERSATION_PREVIEW_CHARS = int(os.getenv("CONVERSATION_PREVIEW_CHARS", 120))
+
+# Embeddings: Cache of the embedded queries, in memory (0 disables) and on disk
+EMBEDDINGS_CACHE_SIZE = int(os.getenv("EMBEDDINGS_CACHE_SIZE", 10000))
+EMBEDDINGS_CACHE_PATH = os.getenv("EMBEDDINGS_CACHE_PATH", "")
+
+# History: The newest messages sent to the LLM, within a count and token cap
+HISTORY_MESSAGE_LIMIT = int(os.getenv("HISTORY_MESSAGE_LIMIT", 10))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 4000))
+HISTORY_TOKEN_ESTIMATOR = os.getenv("HISTORY_TOKEN_ESTIMATOR", "chars")
+
+# Summary: Over N messages, all but the newest M are folded into a summary
+SUMMARY_THRESHOLD = int(os.getenv("SUMMARY_THRESHOLD", 10))
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", 4))
+# Summary: Seconds the running summaries may take to finish on shutdown
+SUMMARY_SHUTDOWN_TIMEOUT = float(os.getenv("SUMMARY_SHUTDOWN_TIMEOUT", 30))
+
+# Pagination: Default and max. page size of the conversation/message lists
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", 50))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", 200))
+
+# Streaming: Tokens are coalesced and flushed every N ms or M bytes
+STREAM_FLUSH_INTERVAL_MS = int(os.getenv("STREAM_FLUSH_INTERVAL_MS", 50))
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", 1024))
+# Streaming: The client is checked for a disconnect every N ms. The partial
+# answer of a disconnected client is stored ("persist") or not ("discard").
+STREAM_DISCONNECT_POLL_MS = int(os.getenv("STREAM_DISCONNECT_POLL_MS", 500))
+STREAM_DISCONNECT_POLICY = os.getenv("STREAM_DISCONNECT_POLICY", "persist")
+
+# Vector store: Documents embedded per request and written at once on upserts
+VECTOR_UPSERT_BATCH_SIZE = int(os.getenv("VECTOR_UPSERT_BATCH_SIZE", 64))
+VECTOR_UPSERT_CONCURRENCY = int(os.getenv("VECTOR_UPSERT_CONCURRENCY", 8))
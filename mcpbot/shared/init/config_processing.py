@@ -3,8 +3,14 @@ from typing import Callable, TypedDict
 from langchain_core.embeddings import Embeddings
 from langchain_core.language_models.chat_models import BaseChatModel
 
-from mcpbot.shared.config import CONFIG_FILE, DatabaseConfig, YamlConfig
+from mcpbot.shared.config import (
+    CONFIG_FILE,
+    EMBEDDINGS_CACHE_SIZE,
+    DatabaseConfig,
+    YamlConfig,
+)
 from mcpbot.shared.services import (
+    CachedEmbeddings,
     ChatDB,
     CommonTokenParams,
     SecretFactory,
@@ -63,8 +69,14 @@ class ConfigSingleton(metaclass=Singleton):
 
     def get_models(self) -> AppModels:
         model_config = self.yaml_config.models
+        embeddings = get_embeddings(**model_config.embeddings.__dict__)
+        # Repeated queries (e.g. popular questions) are not embedded again
+        if EMBEDDINGS_CACHE_SIZE > 0:
+            embeddings = CachedEmbeddings(
+                embeddings, model=model_config.embeddings.model
+            )
         return AppModels(
-            embeddings=get_embeddings(**model_config.embeddings.__dict__),
+            embeddings=embeddings,
             llm=get_llm(**model_config.llm.__dict__),
         )
 
@@ -1,15 +1,24 @@
 from .auth import CommonTokenParams, get_auth_method
 from .database_chat import ChatDB, get_chat_db
-from .database_vector import VectorDB, get_vector_db
+from .database_vector import (
+    SearchHit,
+    VectorDB,
+    VectorDocument,
+    get_vector_db,
+)
+from .embeddings_cache import CachedEmbeddings
 from .llm import get_embeddings, get_llm
 from .secrets import SecretFactory
 
 
 __all__ = [
+    "CachedEmbeddings",
     "ChatDB",
     "CommonTokenParams",
+    "SearchHit",
     "SecretFactory",
     "VectorDB",
+    "VectorDocument",
     "get_auth_method",
     "get_chat_db",
     "get_embeddings",
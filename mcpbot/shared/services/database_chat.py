@@ -1,24 +1,65 @@
 from abc import ABC, abstractmethod
+import asyncio
+import base64
+from bisect import insort
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import UTC, datetime
+import json
 from pathlib import Path
-import shutil
-from typing import Any, Literal
+import sqlite3
+import threading
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Generic,
+    Iterator,
+    Literal,
+    TypeVar,
+)
 from uuid import uuid4
 
 from pydantic import BaseModel
 
-from mcpbot.shared.utils import read_file, write_file
+from mcpbot.shared.config import (
+    CHAT_CACHE_MESSAGES,
+    CHAT_CACHE_SIZE_MB,
+    CHAT_CACHE_TTL,
+    CHAT_DB_MAX_THREADS,
+    CONVERSATION_PREVIEW_CHARS,
+    PAGE_DEFAULT_LIMIT,
+)
+from mcpbot.shared.utils import AppendLog, register_metrics
 
 
 OrderBy = Literal["ASC", "DESC"]
 Role = Literal["human", "ai"]
 
+T = TypeVar("T")
+M = TypeVar("M", bound=BaseModel)
+
+# The ID of the summary of a conversation
+SUMMARY_ID = "summary"
+
+# Bounded pool for the blocking I/O of the backends without an async client
+_EXECUTOR = ThreadPoolExecutor(
+    max_workers=CHAT_DB_MAX_THREADS, thread_name_prefix="chat-db"
+)
+
 
 class Conversation(BaseModel):
     id: str
     user_id: str
     created_at: str
     last_updated_at: str
+    # Denormalized from the messages at write time, for the conversation list
+    message_count: int = 0
+    total_tokens: int = 0
+    last_role: Role | None = None
+    last_message_preview: str | None = None
 
 
 class Message(BaseModel):
@@ -28,21 +69,211 @@ class Message(BaseModel):
     role: Role
     text: str
     created_at: str
+    tokens: int | None = None  # Estimated token count, cached at write time
+
+
+class Summary(BaseModel):
+    id: str = SUMMARY_ID
+    conversation_id: str
+    user_id: str
+    text: str
+    summarized_until: str  # created_at of the newest summarized message
+    updated_at: str
+
+
+class ConversationActivity(BaseModel):
+    """A change of the messages of a conversation, to apply to its
+    denormalized fields: the messages added (or, if negative, deleted), their
+    tokens and the newest message of the conversation after the change (None
+    if there is none left).
+    """
+
+    conversation_id: str
+    user_id: str
+    message_count: int = 0
+    total_tokens: int = 0
+    last_role: Role | None = None
+    last_message_preview: str | None = None
+
+    @classmethod
+    def of(
+        cls,
+        conversation_id: str,
+        user_id: str,
+        added: list[Message] | None = None,
+        deleted: list[Message] | None = None,
+        last: Message | None = None,
+    ) -> "ConversationActivity":
+        """The activity of messages added to and/or deleted from a
+        conversation. `last` defaults to the newest added message.
+        """
+        added, deleted = added or [], deleted or []
+        if last is None and added:
+            last = max(added, key=_message_key)
+        return cls(
+            conversation_id=conversation_id,
+            user_id=user_id,
+            message_count=len(added) - len(deleted),
+            total_tokens=sum(m.tokens or 0 for m in added)
+            - sum(m.tokens or 0 for m in deleted),
+            last_role=last.role if last else None,
+            last_message_preview=preview(last.text) if last else None,
+        )
+
+    def apply(self, conversation: Conversation, timestamp: str) -> None:
+        conversation.message_count += self.message_count
+        conversation.total_tokens += self.total_tokens
+        conversation.last_role = self.last_role
+        conversation.last_message_preview = self.last_message_preview
+        conversation.last_updated_at = timestamp
+
+
+def preview(text: str) -> str:
+    """The preview of a message in the conversation list."""
+    if len(text) <= CONVERSATION_PREVIEW_CHARS:
+        return text
+    return text[: CONVERSATION_PREVIEW_CHARS - 1].rstrip() + "…"
+
+
+class Page(BaseModel, Generic[T]):
+    """A page of a list. `next_cursor` is None on the last page."""
+
+    items: list[T]
+    next_cursor: str | None = None
+
+
+def encode_cursor(value: Any) -> str:
+    """Encodes the position in a list (e.g. a continuation token) into an
+    opaque, URL-safe cursor.
+    """
+    data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Any:
+    """Decodes a cursor.
+
+    Raises:
+        ValueError: If the cursor is invalid.
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (UnicodeError, ValueError) as error:
+        raise ValueError("Invalid cursor.") from error
+
+
+def _decode_key(cursor: str | None) -> tuple[str, str] | None:
+    """Decodes the (sort key, ID) of the last item of a page."""
+    if cursor is None:
+        return None
+    key = decode_cursor(cursor)
+    if (
+        not isinstance(key, list)
+        or len(key) != 2
+        or not all(isinstance(part, str) for part in key)
+    ):
+        raise ValueError("Invalid cursor.")
+    return key[0], key[1]
+
+
+def _key_page(
+    items: list[T], key: Callable[[T], tuple[str, str]], limit: int
+) -> Page[T]:
+    """Makes a page of up to `limit` items, out of up to `limit + 1` items
+    listed after the cursor.
+    """
+    if len(items) <= limit:
+        return Page(items=items)
+    items = items[:limit]
+    return Page(items=items, next_cursor=encode_cursor(key(items[-1])))
+
+
+def _message_key(message: Message) -> tuple[str, str]:
+    return message.created_at, message.id
+
+
+def _conversation_key(conversation: Conversation) -> tuple[str, str]:
+    return conversation.last_updated_at, conversation.id
+
+
+def _user_key(conversation: Conversation) -> tuple[str, str]:
+    return conversation.user_id, conversation.id
+
+
+def _each(
+    function: Callable[..., Any], calls: list[tuple[Any, ...]]
+) -> list[Exception | None]:
+    """Calls a function for each arguments, collecting the errors."""
+    results: list[Exception | None] = []
+    for args in calls:
+        try:
+            function(*args)
+        except Exception as error:
+            results.append(error)
+        else:
+            results.append(None)
+    return results
+
+
+def _group(keys: list[str]) -> dict[str, list[int]]:
+    """Groups the indexes of items by key (e.g. their partition key)."""
+    groups: dict[str, list[int]] = dict()
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+    return groups
+
+
+def new_conversation(
+    user_id: str, conversation_id: str | None = None
+) -> Conversation:
+    if not conversation_id:
+        conversation_id = uuid4().hex
+    timestamp = datetime.now(UTC).isoformat()
+    return Conversation(
+        id=conversation_id,
+        user_id=user_id,
+        created_at=timestamp,
+        last_updated_at=timestamp,
+    )
+
+
+def new_message(
+    conversation_id: str,
+    user_id: str,
+    role: Role,
+    text: str,
+    id: str | None = None,
+    created_at: str | None = None,
+    tokens: int | None = None,
+) -> Message:
+    if not id:
+        id = uuid4().hex
+    if not created_at:
+        created_at = datetime.now(UTC).isoformat()
+    return Message(
+        id=id,
+        conversation_id=conversation_id,
+        user_id=user_id,
+        role=role,
+        text=text,
+        created_at=created_at,
+        tokens=tokens,
+    )
 
 
 class ChatDB(ABC):
+    """A chat database, with a blocking and an async interface.
+
+    By default, the async methods (prefixed with `a`) run the blocking ones
+    in a bounded thread pool, so they do not block the event loop. Backends
+    with a native async client override them.
+    """
+
     def create_conversation(
         self, user_id: str, conversation_id: str | None = None
     ) -> Conversation:
-        if not conversation_id:
-            conversation_id = uuid4().hex
-        timestamp = datetime.now(UTC).isoformat()
-        conversation = Conversation(
-            id=conversation_id,
-            user_id=user_id,
-            created_at=timestamp,
-            last_updated_at=timestamp,
-        )
+        conversation = new_conversation(user_id, conversation_id)
         self._create_conversation(conversation)
         return conversation
 
@@ -54,31 +285,154 @@ class ChatDB(ABC):
         text: str,
         id: str | None = None,
         created_at: str | None = None,
+        tokens: int | None = None,
     ) -> Message:
-        if not id:
-            id = uuid4().hex
-        if not created_at:
-            created_at = datetime.now(UTC).isoformat()
-        message = Message(
-            id=id,
-            conversation_id=conversation_id,
-            user_id=user_id,
-            role=role,
-            text=text,
-            created_at=created_at,
+        message = new_message(
+            conversation_id, user_id, role, text, id, created_at, tokens
         )
         self._create_message(message)
         return message
 
-    def delete_over_n_messages(
+    def delete_messages_after(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> list[Message]:
+        """Deletes the messages created at or after `created_at`.
+
+        By default, the messages are deleted one by one. Backends override it
+        with a range delete.
+
+        Returns:
+            The deleted messages, ordered ASC.
+        """
+        deleted = []
+        for message in self.list_messages(conversation_id, order_by="DESC"):
+            if message.created_at < created_at:
+                break
+            self.delete_message(message.id, conversation_id)
+            deleted.append(message)
+        return deleted[::-1]
+
+    def delete_messages_until(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> list[Message]:
+        """Deletes the messages created at or before `created_at`, e.g. the
+        ones folded into the summary.
+
+        By default, the messages are deleted one by one. Backends override it
+        with a range delete.
+
+        Returns:
+            The deleted messages, ordered ASC.
+        """
+        deleted = []
+        for message in self.list_messages(conversation_id):
+            if message.created_at > created_at:
+                break
+            self.delete_message(message.id, conversation_id)
+            deleted.append(message)
+        return deleted
+
+    def keep_last_n(self, conversation_id: str, n_messages: int) -> None:
+        """Deletes all messages but the newest `n_messages`.
+
+        By default, the messages are deleted one by one. Backends override it
+        with a range delete.
+        """
+        messages = self.list_messages(conversation_id, order_by="DESC")
+        for message in messages[max(n_messages, 0) :]:
+            self.delete_message(message.id, conversation_id)
+
+    def get_message_before(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> Message | None:
+        """Gets the newest message created before `created_at`."""
+        for message in self.list_messages(conversation_id, order_by="DESC"):
+            if message.created_at < created_at:
+                return message
+        return None
+
+    def list_recent_messages(
         self,
         conversation_id: str,
         n_messages: int,
-    ) -> None:
-        messages = self.list_messages(conversation_id)
-        if len(messages) > n_messages:
-            for message_id in messages[n_messages:]:
-                self.delete_message(message_id.id, conversation_id)
+    ) -> list[Message]:
+        """Lists the newest `n_messages` messages, ordered ASC."""
+        if n_messages <= 0:
+            return []
+        messages = self.list_messages(conversation_id, order_by="DESC")
+        return messages[:n_messages][::-1]
+
+    def list_conversations_page(
+        self,
+        user_id: str,
+        order_by: OrderBy = "DESC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        """Lists a page of up to `limit` conversations, from the `cursor` of
+        the previous page (from the start if None).
+
+        By default, the conversations are listed and the page is cut from
+        them, by (last_updated_at, ID). Backends override it with a range
+        read.
+
+        Raises:
+            ValueError: If the cursor is invalid.
+        """
+        return self._cut_page(
+            self.list_conversations(user_id, order_by),
+            _conversation_key,
+            order_by,
+            limit,
+            cursor,
+        )
+
+    def list_messages_page(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Message]:
+        """Lists a page of up to `limit` messages, from the `cursor` of the
+        previous page (from the start if None).
+
+        By default, the messages are listed and the page is cut from them,
+        by (created_at, ID). Backends override it with a range read.
+
+        Raises:
+            ValueError: If the cursor is invalid.
+        """
+        return self._cut_page(
+            self.list_messages(conversation_id, order_by),
+            _message_key,
+            order_by,
+            limit,
+            cursor,
+        )
+
+    @staticmethod
+    def _cut_page(
+        items: list[T],
+        key: Callable[[T], tuple[str, str]],
+        order_by: OrderBy,
+        limit: int,
+        cursor: str | None,
+    ) -> Page[T]:
+        after = _decode_key(cursor)
+        items = sorted(items, key=key, reverse=order_by == "DESC")
+        if after is not None:
+            if order_by == "DESC":
+                items = [item for item in items if key(item) < after]
+            else:
+                items = [item for item in items if key(item) > after]
+        return _key_page(items[: limit + 1], key, limit)
 
     def update_conversation_timestamp(
         self,
@@ -91,6 +445,326 @@ class ChatDB(ABC):
         conversation.last_updated_at = datetime.now(UTC).isoformat()
         self._update_conversation(conversation)
 
+    # Group commit
+    def create_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        """Creates messages of any conversations, e.g. the writes of many
+        requests at once.
+
+        By default, the messages are created one by one. Backends override it
+        with a batch per conversation or a single transaction.
+
+        Returns:
+            For each message, None if it was created or the error.
+        """
+        return _each(self._create_message, [(m,) for m in messages])
+
+    def update_conversation_timestamps(
+        self, conversations: list[tuple[str, str]]
+    ) -> list[Exception | None]:
+        """Updates the timestamp of conversations, given as (conversation ID,
+        user ID).
+
+        By default, the conversations are updated one by one. Backends
+        override it with a batch per user or a single transaction.
+
+        Returns:
+            For each conversation, None if it was updated or the error.
+        """
+        return _each(self.update_conversation_timestamp, conversations)
+
+    def update_conversation_activity(
+        self, activities: list[ConversationActivity]
+    ) -> list[Exception | None]:
+        """Applies the activities to the denormalized fields of their
+        conversations (see `ConversationActivity`) and updates their
+        timestamps.
+
+        By default, the conversations are read and written one by one.
+        Backends override it with increments, batched per user.
+
+        Returns:
+            For each activity, None if it was applied or the error.
+        """
+        timestamp = datetime.now(UTC).isoformat()
+        return _each(self._apply_activity, [(a, timestamp) for a in activities])
+
+    def _apply_activity(
+        self, activity: ConversationActivity, timestamp: str
+    ) -> None:
+        conversation = self.get_conversation(
+            activity.conversation_id, activity.user_id
+        )
+        if not conversation:
+            return
+        activity.apply(conversation, timestamp)
+        self._update_conversation(conversation)
+
+    # Export and import
+    @abstractmethod
+    def list_all_conversations_page(
+        self,
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        """Lists a page of the conversations of all users, in a stable order
+        (e.g. by user ID and ID), to export them.
+
+        Raises:
+            ValueError: If the cursor is invalid.
+        """
+        raise NotImplementedError
+
+    def iter_conversations(
+        self,
+        batch_size: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Iterator[Page[Conversation]]:
+        """Iterates over the pages of the conversations of all users, from
+        the `cursor` of a page (from the start if None).
+
+        A page is yielded with the cursor of the next one, so an interrupted
+        export can be resumed from it.
+        """
+        while True:
+            page = self.list_all_conversations_page(batch_size, cursor)
+            yield page
+            if page.next_cursor is None:
+                return
+            cursor = page.next_cursor
+
+    def iter_messages(
+        self,
+        conversation_id: str,
+        batch_size: int = PAGE_DEFAULT_LIMIT,
+    ) -> Iterator[list[Message]]:
+        """Iterates over the messages of a conversation (ordered ASC), in
+        batches of up to `batch_size` messages.
+        """
+        cursor = None
+        while True:
+            page = self.list_messages_page(
+                conversation_id, "ASC", batch_size, cursor
+            )
+            if page.items:
+                yield page.items
+            if page.next_cursor is None:
+                return
+            cursor = page.next_cursor
+
+    def count_messages(self, conversation_id: str) -> int:
+        """Counts the messages of a conversation."""
+        return len(self.list_messages(conversation_id))
+
+    @abstractmethod
+    def upsert_conversations(
+        self, conversations: list[Conversation]
+    ) -> list[Exception | None]:
+        """Adds or replaces conversations of any users, as they are (e.g.
+        imported from another database).
+
+        Returns:
+            For each conversation, None if it was written or the error.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        """Adds or replaces messages of any conversations, as they are (e.g.
+        imported from another database).
+
+        Returns:
+            For each message, None if it was written or the error.
+        """
+        raise NotImplementedError
+
+    # Async interface
+    async def acreate_conversation(
+        self, user_id: str, conversation_id: str | None = None
+    ) -> Conversation:
+        return await self._run(
+            self.create_conversation, user_id, conversation_id
+        )
+
+    async def acreate_message(
+        self,
+        conversation_id: str,
+        user_id: str,
+        role: Role,
+        text: str,
+        id: str | None = None,
+        created_at: str | None = None,
+        tokens: int | None = None,
+    ) -> Message:
+        return await self._run(
+            self.create_message,
+            conversation_id,
+            user_id,
+            role,
+            text,
+            id,
+            created_at,
+            tokens,
+        )
+
+    async def adelete_messages_after(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> list[Message]:
+        return await self._run(
+            self.delete_messages_after, conversation_id, created_at
+        )
+
+    async def adelete_messages_until(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> list[Message]:
+        return await self._run(
+            self.delete_messages_until, conversation_id, created_at
+        )
+
+    async def akeep_last_n(self, conversation_id: str, n_messages: int) -> None:
+        await self._run(self.keep_last_n, conversation_id, n_messages)
+
+    async def aget_message_before(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> Message | None:
+        return await self._run(
+            self.get_message_before, conversation_id, created_at
+        )
+
+    async def alist_recent_messages(
+        self,
+        conversation_id: str,
+        n_messages: int,
+    ) -> list[Message]:
+        return await self._run(
+            self.list_recent_messages, conversation_id, n_messages
+        )
+
+    async def alist_conversations_page(
+        self,
+        user_id: str,
+        order_by: OrderBy = "DESC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        return await self._run(
+            self.list_conversations_page, user_id, order_by, limit, cursor
+        )
+
+    async def alist_messages_page(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Message]:
+        return await self._run(
+            self.list_messages_page, conversation_id, order_by, limit, cursor
+        )
+
+    async def aupdate_conversation_timestamp(
+        self,
+        conversation_id: str,
+        user_id: str,
+    ) -> None:
+        await self._run(
+            self.update_conversation_timestamp, conversation_id, user_id
+        )
+
+    async def acreate_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        return await self._run(self.create_messages, messages)
+
+    async def aupdate_conversation_timestamps(
+        self, conversations: list[tuple[str, str]]
+    ) -> list[Exception | None]:
+        return await self._run(
+            self.update_conversation_timestamps, conversations
+        )
+
+    async def aupdate_conversation_activity(
+        self, activities: list[ConversationActivity]
+    ) -> list[Exception | None]:
+        return await self._run(self.update_conversation_activity, activities)
+
+    async def alist_all_conversations_page(
+        self,
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        return await self._run(self.list_all_conversations_page, limit, cursor)
+
+    async def acount_messages(self, conversation_id: str) -> int:
+        return await self._run(self.count_messages, conversation_id)
+
+    async def aupsert_conversations(
+        self, conversations: list[Conversation]
+    ) -> list[Exception | None]:
+        return await self._run(self.upsert_conversations, conversations)
+
+    async def aupsert_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        return await self._run(self.upsert_messages, messages)
+
+    async def adelete_conversation(
+        self, conversation_id: str, user_id: str
+    ) -> None:
+        await self._run(self.delete_conversation, conversation_id, user_id)
+
+    async def adelete_message(
+        self, message_id: str, conversation_id: str
+    ) -> None:
+        await self._run(self.delete_message, message_id, conversation_id)
+
+    async def adelete_all_messages(self, conversation_id: str) -> None:
+        await self._run(self.delete_all_messages, conversation_id)
+
+    async def aget_summary(self, conversation_id: str) -> Summary | None:
+        return await self._run(self.get_summary, conversation_id)
+
+    async def aupsert_summary(self, summary: Summary) -> None:
+        await self._run(self.upsert_summary, summary)
+
+    async def alist_conversations(
+        self, user_id: str, order_by: OrderBy = "DESC"
+    ) -> list[Conversation]:
+        return await self._run(self.list_conversations, user_id, order_by)
+
+    async def alist_messages(
+        self, conversation_id: str, order_by: OrderBy = "ASC"
+    ) -> list[Message]:
+        return await self._run(self.list_messages, conversation_id, order_by)
+
+    async def aget_conversation(
+        self, conversation_id: str, user_id: str
+    ) -> Conversation | None:
+        return await self._run(self.get_conversation, conversation_id, user_id)
+
+    async def aget_message(
+        self, message_id: str, conversation_id: str
+    ) -> Message | None:
+        return await self._run(self.get_message, message_id, conversation_id)
+
+    async def aclose(self) -> None:
+        """Releases the resources of the database (e.g. its clients)."""
+
+    @staticmethod
+    async def _run(function: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_EXECUTOR, function, *args)
+
+    # Blocking interface
     @abstractmethod
     def _create_conversation(self, conversation: Conversation) -> None:
         raise NotImplementedError
@@ -115,6 +789,14 @@ class ChatDB(ABC):
     def delete_all_messages(self, conversation_id: str) -> None:
         raise NotImplementedError
 
+    @abstractmethod
+    def get_summary(self, conversation_id: str) -> Summary | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_summary(self, summary: Summary) -> None:
+        raise NotImplementedError
+
     @abstractmethod
     def list_conversations(
         self, user_id: str, order_by: OrderBy = "DESC"
@@ -141,6 +823,21 @@ class ChatDB(ABC):
 
 
 class JsonChatDB(ChatDB):
+    """Local chat database, stored in append-only JSONL segments.
+
+    The records are stored in one segment per partition key: the messages
+    (and, in their own directory, the summary) per conversation, the
+    conversations per user. Listing the messages of a conversation is a
+    sequential read of its segment, the newest messages are a tail read and
+    a page is a range read from the cursor.
+
+    On POSIX, several processes (e.g. uvicorn workers) can share the
+    directory, see `AppendLog`. On Windows, only one process may use it.
+
+    A directory in the legacy layout (a JSON file per record) is imported
+    into the segments when it is opened, see `AppendLog.import_legacy`.
+    """
+
     def __init__(
         self,
         endpoint: str,
@@ -148,103 +845,335 @@ class JsonChatDB(ChatDB):
         **kwargs: Any,
     ):
         self.path = f"{endpoint}/{collection}"
+        self.log = AppendLog(self.path, sort_field="created_at")
+        self.summaries = AppendLog(
+            f"{self.path}/summaries", sort_field="updated_at"
+        )
+        self.log.import_legacy()
 
     def _create_conversation(self, conversation: Conversation) -> None:
-        write_file(
-            f"{self.path}/{conversation.user_id}/{conversation.id}.json",
-            conversation.model_dump(),
+        self.log.put(
+            conversation.user_id, conversation.id, conversation.model_dump()
         )
 
     def _create_message(self, message: Message) -> None:
-        write_file(
-            f"{self.path}/{message.conversation_id}/{message.id}.json",
-            message.model_dump(),
-        )
+        self.log.put(message.conversation_id, message.id, message.model_dump())
 
     def _update_conversation(self, conversation: Conversation) -> None:
         return self._create_conversation(conversation)
 
     def delete_conversation(self, conversation_id: str, user_id: str) -> None:
-        file_path = Path(self.path) / user_id / f"{conversation_id}.json"
-        if file_path.exists():
-            file_path.unlink()
+        self.log.delete(user_id, conversation_id)
 
     def delete_message(self, message_id: str, conversation_id: str) -> None:
-        file_path = Path(self.path) / conversation_id / f"{message_id}.json"
-        if file_path.exists():
-            file_path.unlink()
+        self.log.delete(conversation_id, message_id)
 
     def delete_all_messages(self, conversation_id: str) -> None:
-        messages_dir = Path(self.path) / conversation_id
-        if messages_dir.exists():
-            shutil.rmtree(messages_dir)
+        self.log.drop(conversation_id)
+        self.summaries.drop(conversation_id)
 
-    def get_conversation(
-        self, conversation_id: str, user_id: str
-    ) -> Conversation | None:
-        try:
-            conversation = read_file(
-                f"{self.path}/{user_id}/{conversation_id}.json"
-            )
-        except FileNotFoundError:
-            return None
-        return Conversation(**conversation)
+    def create_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        # One write per conversation segment
+        results: list[Exception | None] = [None] * len(messages)
+        groups = _group([message.conversation_id for message in messages])
+        for conversation_id, indexes in groups.items():
+            try:
+                self.log.put_many(
+                    conversation_id,
+                    [
+                        (messages[i].id, messages[i].model_dump())
+                        for i in indexes
+                    ],
+                )
+            except Exception as error:
+                for i in indexes:
+                    results[i] = error
+        return results
 
-    def get_message(
-        self, message_id: str, conversation_id: str
-    ) -> Message | None:
-        try:
-            message = read_file(
-                f"{self.path}/{conversation_id}/{message_id}.json"
-            )
-        except FileNotFoundError:
-            return None
-        return Message(**message)
+    def upsert_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        return self.create_messages(messages)
 
-    def list_conversations(
+    def upsert_conversations(
+        self, conversations: list[Conversation]
+    ) -> list[Exception | None]:
+        # One write per user segment
+        results: list[Exception | None] = [None] * len(conversations)
+        groups = _group(
+            [conversation.user_id for conversation in conversations]
+        )
+        for user_id, indexes in groups.items():
+            try:
+                self.log.put_many(
+                    user_id,
+                    [
+                        (conversations[i].id, conversations[i].model_dump())
+                        for i in indexes
+                    ],
+                )
+            except Exception as error:
+                for i in indexes:
+                    results[i] = error
+        return results
+
+    def list_all_conversations_page(
         self,
-        user_id: str,
-        order_by: OrderBy = "DESC",
-    ) -> list[Conversation]:
-        conversations = Path(self.path) / user_id
-        if not conversations.exists():
-            return []
-        for conversation in conversations.iterdir():
-            if not conversation.is_file():
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        # By user ID (the segments), then by ID
+        after = _decode_key(cursor)
+        conversations: list[Conversation] = []
+        for user_id in self.log.keys():
+            if after is not None and user_id < after[0]:
                 continue
+            user_conversations = sorted(
+                (Conversation(**record) for record in self.log.items(user_id)),
+                key=_user_key,
+            )
+            conversations += [
+                conversation
+                for conversation in user_conversations
+                if after is None or _user_key(conversation) > after
+            ]
+            if len(conversations) > limit:
+                break
+        return _key_page(conversations, _user_key, limit)
 
-        listed_conversations = [
-            Conversation(**read_file(conversation))
-            for conversation in conversations.iterdir()
-            if conversation.is_file()
-        ]
-        listed_conversations.sort(
-            key=lambda x: x.created_at,
-            reverse={"ASC": False, "DESC": True}[order_by],
-        )
-        return listed_conversations
+    def count_messages(self, conversation_id: str) -> int:
+        return self.log.count(conversation_id)
 
-    def list_messages(
-        self,
-        conversation_id: str,
-        order_by: OrderBy = "ASC",
+    def update_conversation_timestamps(
+        self, conversations: list[tuple[str, str]]
+    ) -> list[Exception | None]:
+        # One write per user segment
+        results: list[Exception | None] = [None] * len(conversations)
+        timestamp = datetime.now(UTC).isoformat()
+        groups = _group([user_id for _, user_id in conversations])
+        for user_id, indexes in groups.items():
+            try:
+                records = []
+                for i in indexes:
+                    record = self.log.get(user_id, conversations[i][0])
+                    if record is not None:
+                        record["last_updated_at"] = timestamp
+                        records.append((record["id"], record))
+                self.log.put_many(user_id, records)
+            except Exception as error:
+                for i in indexes:
+                    results[i] = error
+        return results
+
+    def update_conversation_activity(
+        self, activities: list[ConversationActivity]
+    ) -> list[Exception | None]:
+        # One write per user segment
+        results: list[Exception | None] = [None] * len(activities)
+        timestamp = datetime.now(UTC).isoformat()
+        groups = _group([activity.user_id for activity in activities])
+        for user_id, indexes in groups.items():
+            try:
+                # A conversation may have several activities in the group
+                conversations: dict[str, Conversation] = dict()
+                for i in indexes:
+                    id = activities[i].conversation_id
+                    if id not in conversations:
+                        record = self.log.get(user_id, id)
+                        if record is None:
+                            continue
+                        conversations[id] = Conversation(**record)
+                    activities[i].apply(conversations[id], timestamp)
+                self.log.put_many(
+                    user_id,
+                    [(id, c.model_dump()) for id, c in conversations.items()],
+                )
+            except Exception as error:
+                for i in indexes:
+                    results[i] = error
+        return results
+
+    def delete_messages_after(
+        self,
+        conversation_id: str,
+        created_at: str,
     ) -> list[Message]:
-        messages = Path(self.path) / conversation_id
-        if not messages.exists():
-            return []
-        listed_messages = [
-            Message(**read_file(message))
-            for message in messages.iterdir()
-            if message.is_file()
-        ]
-        listed_messages.sort(
-            key=lambda x: x.created_at,
-            reverse={"ASC": False, "DESC": True}[order_by],
+        messages = self.log.pop_range(conversation_id, start=created_at)
+        return [Message(**message) for message in messages]
+
+    def delete_messages_until(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> list[Message]:
+        # The range ends at the successor of created_at: the records at
+        # created_at are included, any later one is not
+        messages = self.log.pop_range(conversation_id, end=created_at + "\0")
+        return [Message(**message) for message in messages]
+
+    def keep_last_n(self, conversation_id: str, n_messages: int) -> None:
+        self.log.trim(conversation_id, n_messages)
+
+    def get_message_before(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> Message | None:
+        # The records before the first possible key of created_at
+        messages = self.log.range(
+            conversation_id, (created_at, ""), 1, reverse=True
+        )
+        return Message(**messages[0]) if messages else None
+
+    def get_conversation(
+        self, conversation_id: str, user_id: str
+    ) -> Conversation | None:
+        conversation = self.log.get(user_id, conversation_id)
+        if conversation is None:
+            return None
+        return Conversation(**conversation)
+
+    def get_message(
+        self, message_id: str, conversation_id: str
+    ) -> Message | None:
+        message = self.log.get(conversation_id, message_id)
+        if message is None:
+            return None
+        return Message(**message)
+
+    def get_summary(self, conversation_id: str) -> Summary | None:
+        summary = self.summaries.get(conversation_id, SUMMARY_ID)
+        if summary is None:
+            return None
+        return Summary(**summary)
+
+    def upsert_summary(self, summary: Summary) -> None:
+        self.summaries.put(
+            summary.conversation_id, SUMMARY_ID, summary.model_dump()
+        )
+
+    def list_conversations(
+        self,
+        user_id: str,
+        order_by: OrderBy = "DESC",
+    ) -> list[Conversation]:
+        conversations = self.log.items(user_id, reverse=order_by == "DESC")
+        return [Conversation(**conversation) for conversation in conversations]
+
+    def list_conversations_page(
+        self,
+        user_id: str,
+        order_by: OrderBy = "DESC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        # The segments are sorted by created_at
+        conversations = self.log.range(
+            user_id, _decode_key(cursor), limit + 1, order_by == "DESC"
+        )
+        return _key_page(
+            [Conversation(**conversation) for conversation in conversations],
+            lambda conversation: (conversation.created_at, conversation.id),
+            limit,
         )
-        return listed_messages
+
+    def list_messages(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+    ) -> list[Message]:
+        messages = self.log.items(conversation_id, reverse=order_by == "DESC")
+        return [Message(**message) for message in messages]
+
+    def list_messages_page(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Message]:
+        messages = self.log.range(
+            conversation_id, _decode_key(cursor), limit + 1, order_by == "DESC"
+        )
+        return _key_page(
+            [Message(**message) for message in messages], _message_key, limit
+        )
+
+    def list_recent_messages(
+        self,
+        conversation_id: str,
+        n_messages: int,
+    ) -> list[Message]:
+        messages = self.log.tail(conversation_id, n_messages)
+        return [Message(**message) for message in messages]
+
+
+class RequestCharges:
+    """The request charges (RU) of the Cosmos DB requests, by operation.
+
+    `hook` returns a per-call `raw_response_hook`, so the charges are
+    recorded from the headers of each response, also under concurrency.
+    """
+
+    def __init__(self) -> None:
+        # The [requests, total RU, max. RU] of each operation
+        self._operations: dict[str, list[float]] = dict()
+
+    def hook(self, operation: str) -> Callable[[Any], None]:
+        def record(response: Any) -> None:
+            headers = response.http_response.headers
+            charge = float(headers.get("x-ms-request-charge") or 0)
+            stats = self._operations.setdefault(operation, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += charge
+            stats[2] = max(stats[2], charge)
+
+        return record
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            operation: {
+                "requests": int(requests),
+                "ru_total": total,
+                "ru_avg": total / requests,
+                "ru_max": peak,
+            }
+            for operation, (requests, total, peak) in self._operations.items()
+        }
+
+
+cosmos_charges = RequestCharges()
+register_metrics("cosmos_chat", cosmos_charges.metrics)
+
+Query = tuple[str, list[dict[str, object]]]
+# An operation of a transactional batch: the operation and its args
+BatchOperation = tuple[str, tuple[Any, ...]]
 
 
 class AzureCosmosChatDB(ChatDB):
+    """Chat database in Azure Cosmos DB.
+
+    The messages are partitioned by conversation, the conversations by user.
+    The queries are parameterized (so their plans are cached), scoped to
+    their partition and only project the fields of the models. The request
+    charges are recorded per operation (see `cosmos_charges`).
+
+    The blocking and the async methods share the building of the queries and
+    of the batch operations, and only differ by their client calls.
+    """
+
+    # The max. number of operations in a transactional batch
+    MAX_BATCH_OPERATIONS = 100
+    # The partition key of the items of each kind
+    PARTITION_KEYS = {"message": "conversation_id", "conversation": "user_id"}
+
+    MESSAGE_FIELDS = ", ".join(f"c.{field}" for field in Message.model_fields)
+    CONVERSATION_FIELDS = ", ".join(
+        f"c.{field}" for field in Conversation.model_fields
+    )
+
     def __init__(
         self,
         database: str,
@@ -271,84 +1200,2202 @@ class AzureCosmosChatDB(ChatDB):
         )
         self.read_item_error = CosmosResourceNotFoundError
 
-    def _create_conversation(self, conversation: Conversation) -> None:
-        self.client.create_item(conversation.model_dump())
+        self.database = database
+        self.collection = collection
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self._aclient: Any = None
 
-    def _create_message(self, message: Message) -> None:
-        self.client.create_item(message.model_dump())
+    # The async clients are shared by the containers of an account, and
+    # closed with the last container using them
+    _ASYNC_CLIENTS: dict[tuple[str, str], Any] = dict()
+    _ASYNC_CLIENT_USERS: dict[tuple[str, str], int] = dict()
 
-    def _update_conversation(self, conversation: Conversation) -> None:
-        self.client.upsert_item(conversation.model_dump())
+    @property
+    def aclient(self) -> Any:
+        """The async container client (`azure.cosmos.aio`, on aiohttp),
+        created lazily in the running event loop.
+        """
+        if self._aclient is None:
+            key = (self.endpoint, self.api_key)
+            client = self._ASYNC_CLIENTS.get(key)
+            if client is None:
+                from azure.cosmos.aio import CosmosClient
 
-    def delete_conversation(self, conversation_id: str, user_id: str) -> None:
-        self.client.delete_item(conversation_id, user_id)
+                client = CosmosClient(self.endpoint, self.api_key)
+                self._ASYNC_CLIENTS[key] = client
+            self._ASYNC_CLIENT_USERS[key] = (
+                self._ASYNC_CLIENT_USERS.get(key, 0) + 1
+            )
+            self._aclient = client.get_database_client(
+                self.database
+            ).get_container_client(self.collection)
+        return self._aclient
 
-    def delete_message(self, message_id: str, conversation_id: str) -> None:
+    def _charge(self, operation: str) -> Callable[[Any], None]:
+        """The response hook recording the request charges of an operation."""
+        return cosmos_charges.hook(f"{self.collection}.{operation}")
+
+    async def aclose(self) -> None:
+        if self._aclient is None:
+            return
+        self._aclient = None
+        key = (self.endpoint, self.api_key)
+        self._ASYNC_CLIENT_USERS[key] -= 1
+        if not self._ASYNC_CLIENT_USERS[key]:
+            del self._ASYNC_CLIENT_USERS[key]
+            await self._ASYNC_CLIENTS.pop(key).close()
+
+    async def acreate_conversation(
+        self, user_id: str, conversation_id: str | None = None
+    ) -> Conversation:
+        conversation = new_conversation(user_id, conversation_id)
+        await self.aclient.create_item(
+            conversation.model_dump(),
+            raw_response_hook=self._charge("create_conversation"),
+        )
+        return conversation
+
+    async def acreate_message(
+        self,
+        conversation_id: str,
+        user_id: str,
+        role: Role,
+        text: str,
+        id: str | None = None,
+        created_at: str | None = None,
+        tokens: int | None = None,
+    ) -> Message:
+        message = new_message(
+            conversation_id, user_id, role, text, id, created_at, tokens
+        )
+        await self.aclient.create_item(
+            message.model_dump(),
+            raw_response_hook=self._charge("create_message"),
+        )
+        return message
+
+    async def adelete_messages_after(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> list[Message]:
+        # The whole messages, which the caller subtracts from the conversation
+        items = self._aquery(
+            "delete_messages_after",
+            self._messages_query(conversation_id, "ASC", since=created_at),
+            partition_key=conversation_id,
+        )
+        messages = [Message(**item) async for item in items]
+        await self._adelete_ids(
+            "delete_messages_after",
+            conversation_id,
+            [message.id for message in messages],
+        )
+        return messages
+
+    async def adelete_messages_until(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> list[Message]:
+        items = self._aquery(
+            "delete_messages_until",
+            self._messages_query(conversation_id, "ASC", until=created_at),
+            partition_key=conversation_id,
+        )
+        messages = [Message(**item) async for item in items]
+        await self._adelete_ids(
+            "delete_messages_until",
+            conversation_id,
+            [message.id for message in messages],
+        )
+        return messages
+
+    async def akeep_last_n(self, conversation_id: str, n_messages: int) -> None:
+        ids = self._aquery(
+            "keep_last_n",
+            self._message_ids_query(conversation_id, n_messages),
+            partition_key=conversation_id,
+        )
+        await self._adelete_ids(
+            "keep_last_n", conversation_id, [id async for id in ids]
+        )
+
+    async def aget_message_before(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> Message | None:
+        messages = self._aquery(
+            "get_message_before",
+            self._messages_query(conversation_id, "DESC", 1, created_at),
+            partition_key=conversation_id,
+        )
+        async for message in messages:
+            return Message(**message)
+        return None
+
+    async def aupdate_conversation_timestamp(
+        self,
+        conversation_id: str,
+        user_id: str,
+    ) -> None:
+        conversation = await self.aget_conversation(conversation_id, user_id)
+        if not conversation:
+            return
+        conversation.last_updated_at = datetime.now(UTC).isoformat()
+        await self.aclient.upsert_item(
+            conversation.model_dump(),
+            raw_response_hook=self._charge("update_conversation"),
+        )
+
+    async def acreate_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        return await self._awrite_items("create", "message", messages)
+
+    async def aupsert_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        return await self._awrite_items("upsert", "message", messages)
+
+    async def aupsert_conversations(
+        self, conversations: list[Conversation]
+    ) -> list[Exception | None]:
+        return await self._awrite_items("upsert", "conversation", conversations)
+
+    async def alist_all_conversations_page(
+        self,
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        # A cross-partition query, in the order of the partitions
+        items, token = await self._aquery_page(
+            "list_all_conversations_page",
+            (f"SELECT {self.CONVERSATION_FIELDS} FROM c", []),
+            None,
+            limit,
+            cursor,
+        )
+        return self._page(Conversation, items, token)
+
+    async def acount_messages(self, conversation_id: str) -> int:
+        counts = self._aquery(
+            "count_messages",
+            self._count_query(conversation_id),
+            partition_key=conversation_id,
+        )
+        return int(sum([count async for count in counts]))
+
+    async def aupdate_conversation_timestamps(
+        self, conversations: list[tuple[str, str]]
+    ) -> list[Exception | None]:
+        timestamp = datetime.now(UTC).isoformat()
+        return await self._abatches(
+            "update_conversations",
+            [user_id for _, user_id in conversations],
+            [
+                self._timestamp_patch(conversation_id, timestamp)
+                for conversation_id, _ in conversations
+            ],
+            lambda i: self.aupdate_conversation_timestamp(*conversations[i]),
+        )
+
+    async def aupdate_conversation_activity(
+        self, activities: list[ConversationActivity]
+    ) -> list[Exception | None]:
+        timestamp = datetime.now(UTC).isoformat()
+        patches = [
+            self._activity_patch(activity, timestamp) for activity in activities
+        ]
+
+        async def update(i: int) -> None:
+            _, (id, patch) = patches[i]
+            await self.aclient.patch_item(
+                id,
+                activities[i].user_id,
+                patch_operations=patch,
+                raw_response_hook=self._charge("update_conversation"),
+            )
+
+        return await self._abatches(
+            "update_activity",
+            [activity.user_id for activity in activities],
+            patches,
+            update,
+        )
+
+    async def adelete_conversation(
+        self, conversation_id: str, user_id: str
+    ) -> None:
+        await self.aclient.delete_item(
+            conversation_id,
+            user_id,
+            raw_response_hook=self._charge("delete_conversation"),
+        )
+
+    async def adelete_message(
+        self, message_id: str, conversation_id: str
+    ) -> None:
         try:
-            self.client.delete_item(message_id, conversation_id)
+            await self.aclient.delete_item(
+                message_id,
+                conversation_id,
+                raw_response_hook=self._charge("delete_message"),
+            )
         except self.read_item_error:
             pass
 
-    def delete_all_messages(self, conversation_id: str) -> None:
-        self.client.delete_all_items_by_partition_key(conversation_id)
+    async def adelete_all_messages(self, conversation_id: str) -> None:
+        await self.aclient.delete_all_items_by_partition_key(
+            conversation_id,
+            raw_response_hook=self._charge("delete_all_messages"),
+        )
 
-    def get_conversation(
+    async def aget_conversation(
         self, conversation_id: str, user_id: str
     ) -> Conversation | None:
         try:
-            conversation = self.client.read_item(conversation_id, user_id)
+            conversation = await self.aclient.read_item(
+                conversation_id,
+                user_id,
+                raw_response_hook=self._charge("get_conversation"),
+            )
         except self.read_item_error:
             return None
         return Conversation(**conversation)
 
-    def get_message(
+    async def aget_message(
         self, message_id: str, conversation_id: str
     ) -> Message | None:
         try:
-            message = self.client.read_item(message_id, conversation_id)
+            message = await self.aclient.read_item(
+                message_id,
+                conversation_id,
+                raw_response_hook=self._charge("get_message"),
+            )
         except self.read_item_error:
             return None
         return Message(**message)
 
-    def list_conversations(
+    async def aget_summary(self, conversation_id: str) -> Summary | None:
+        try:
+            summary = await self.aclient.read_item(
+                SUMMARY_ID,
+                conversation_id,
+                raw_response_hook=self._charge("get_summary"),
+            )
+        except self.read_item_error:
+            return None
+        return Summary(**summary)
+
+    async def aupsert_summary(self, summary: Summary) -> None:
+        await self.aclient.upsert_item(
+            summary.model_dump(),
+            raw_response_hook=self._charge("upsert_summary"),
+        )
+
+    async def alist_conversations(
+        self, user_id: str, order_by: OrderBy = "DESC"
+    ) -> list[Conversation]:
+        conversations = self._aquery(
+            "list_conversations",
+            self._conversations_query(user_id, order_by),
+            partition_key=user_id,
+        )
+        return [Conversation(**item) async for item in conversations]
+
+    async def alist_messages(
+        self, conversation_id: str, order_by: OrderBy = "ASC"
+    ) -> list[Message]:
+        messages = self._aquery(
+            "list_messages",
+            self._messages_query(conversation_id, order_by),
+            partition_key=conversation_id,
+        )
+        return [Message(**item) async for item in messages]
+
+    async def alist_recent_messages(
+        self,
+        conversation_id: str,
+        n_messages: int,
+    ) -> list[Message]:
+        if n_messages <= 0:
+            return []
+        messages = self._aquery(
+            "list_recent_messages",
+            self._messages_query(conversation_id, "DESC", n_messages),
+            partition_key=conversation_id,
+        )
+        return [Message(**item) async for item in messages][::-1]
+
+    async def alist_conversations_page(
         self,
         user_id: str,
         order_by: OrderBy = "DESC",
-    ) -> list[Conversation]:
-        conversations = self.client.query_items(
-            f"SELECT * "
-            f"FROM c WHERE c.user_id = '{user_id}' "
-            f"ORDER BY c.last_updated_at {order_by}",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        items, token = await self._aquery_page(
+            "list_conversations_page",
+            self._conversations_query(user_id, order_by),
+            user_id,
+            limit,
+            cursor,
         )
-        return [Conversation(**conversation) for conversation in conversations]
+        return self._page(Conversation, items, token)
 
-    def list_messages(
+    async def alist_messages_page(
         self,
         conversation_id: str,
         order_by: OrderBy = "ASC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Message]:
+        items, token = await self._aquery_page(
+            "list_messages_page",
+            self._messages_query(conversation_id, order_by),
+            conversation_id,
+            limit,
+            cursor,
+        )
+        return self._page(Message, items, token)
+
+    # Blocking interface
+    def _create_conversation(self, conversation: Conversation) -> None:
+        self.client.create_item(
+            conversation.model_dump(),
+            raw_response_hook=self._charge("create_conversation"),
+        )
+
+    def _create_message(self, message: Message) -> None:
+        self.client.create_item(
+            message.model_dump(),
+            raw_response_hook=self._charge("create_message"),
+        )
+
+    def _update_conversation(self, conversation: Conversation) -> None:
+        self.client.upsert_item(
+            conversation.model_dump(),
+            raw_response_hook=self._charge("update_conversation"),
+        )
+
+    def delete_conversation(self, conversation_id: str, user_id: str) -> None:
+        self.client.delete_item(
+            conversation_id,
+            user_id,
+            raw_response_hook=self._charge("delete_conversation"),
+        )
+
+    def delete_message(self, message_id: str, conversation_id: str) -> None:
+        try:
+            self.client.delete_item(
+                message_id,
+                conversation_id,
+                raw_response_hook=self._charge("delete_message"),
+            )
+        except self.read_item_error:
+            pass
+
+    def delete_all_messages(self, conversation_id: str) -> None:
+        self.client.delete_all_items_by_partition_key(
+            conversation_id,
+            raw_response_hook=self._charge("delete_all_messages"),
+        )
+
+    def delete_messages_after(
+        self,
+        conversation_id: str,
+        created_at: str,
     ) -> list[Message]:
-        messages = self.client.query_items(
-            f"SELECT * "
-            f"FROM c WHERE c.conversation_id = '{conversation_id}' "
-            f"ORDER BY c.created_at {order_by}",
+        # The whole messages, which the caller subtracts from the conversation
+        items = self._query(
+            "delete_messages_after",
+            self._messages_query(conversation_id, "ASC", since=created_at),
+            partition_key=conversation_id,
         )
-        return [Message(**message) for message in messages]
+        messages = [Message(**item) for item in items]
+        self._delete_ids(
+            "delete_messages_after",
+            conversation_id,
+            [message.id for message in messages],
+        )
+        return messages
 
+    def delete_messages_until(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> list[Message]:
+        items = self._query(
+            "delete_messages_until",
+            self._messages_query(conversation_id, "ASC", until=created_at),
+            partition_key=conversation_id,
+        )
+        messages = [Message(**item) for item in items]
+        self._delete_ids(
+            "delete_messages_until",
+            conversation_id,
+            [message.id for message in messages],
+        )
+        return messages
 
-class GCPNoSQLDB(ChatDB):
-    pass
+    def keep_last_n(self, conversation_id: str, n_messages: int) -> None:
+        ids = self._query(
+            "keep_last_n",
+            self._message_ids_query(conversation_id, n_messages),
+            partition_key=conversation_id,
+        )
+        self._delete_ids("keep_last_n", conversation_id, list(ids))
 
+    def get_message_before(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> Message | None:
+        messages = self._query(
+            "get_message_before",
+            self._messages_query(conversation_id, "DESC", 1, created_at),
+            partition_key=conversation_id,
+        )
+        return next((Message(**message) for message in messages), None)
 
-def get_chat_db(endpoint: str, collection: str, **kwargs: Any) -> ChatDB:
-    if "azure.com" in endpoint:
-        return AzureCosmosChatDB(
+    def update_conversation_timestamp(
+        self,
+        conversation_id: str,
+        user_id: str,
+    ) -> None:
+        conversation = self.get_conversation(conversation_id, user_id)
+        if not conversation:
+            return
+        conversation.last_updated_at = datetime.now(UTC).isoformat()
+        self._update_conversation(conversation)
+
+    def create_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        return self._write_items("create", "message", messages)
+
+    def upsert_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        return self._write_items("upsert", "message", messages)
+
+    def upsert_conversations(
+        self, conversations: list[Conversation]
+    ) -> list[Exception | None]:
+        return self._write_items("upsert", "conversation", conversations)
+
+    def list_all_conversations_page(
+        self,
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        # A cross-partition query, in the order of the partitions
+        items, token = self._query_page(
+            "list_all_conversations_page",
+            (f"SELECT {self.CONVERSATION_FIELDS} FROM c", []),
+            None,
+            limit,
+            cursor,
+        )
+        return self._page(Conversation, items, token)
+
+    def count_messages(self, conversation_id: str) -> int:
+        counts = self._query(
+            "count_messages",
+            self._count_query(conversation_id),
+            partition_key=conversation_id,
+        )
+        return int(sum(counts))
+
+    def update_conversation_timestamps(
+        self, conversations: list[tuple[str, str]]
+    ) -> list[Exception | None]:
+        timestamp = datetime.now(UTC).isoformat()
+        return self._batches(
+            "update_conversations",
+            [user_id for _, user_id in conversations],
+            [
+                self._timestamp_patch(conversation_id, timestamp)
+                for conversation_id, _ in conversations
+            ],
+            lambda i: self.update_conversation_timestamp(*conversations[i]),
+        )
+
+    def update_conversation_activity(
+        self, activities: list[ConversationActivity]
+    ) -> list[Exception | None]:
+        timestamp = datetime.now(UTC).isoformat()
+        patches = [
+            self._activity_patch(activity, timestamp) for activity in activities
+        ]
+
+        def update(i: int) -> None:
+            _, (id, patch) = patches[i]
+            self.client.patch_item(
+                id,
+                activities[i].user_id,
+                patch_operations=patch,
+                raw_response_hook=self._charge("update_conversation"),
+            )
+
+        return self._batches(
+            "update_activity",
+            [activity.user_id for activity in activities],
+            patches,
+            update,
+        )
+
+    def get_conversation(
+        self, conversation_id: str, user_id: str
+    ) -> Conversation | None:
+        try:
+            conversation = self.client.read_item(
+                conversation_id,
+                user_id,
+                raw_response_hook=self._charge("get_conversation"),
+            )
+        except self.read_item_error:
+            return None
+        return Conversation(**conversation)
+
+    def get_message(
+        self, message_id: str, conversation_id: str
+    ) -> Message | None:
+        try:
+            message = self.client.read_item(
+                message_id,
+                conversation_id,
+                raw_response_hook=self._charge("get_message"),
+            )
+        except self.read_item_error:
+            return None
+        return Message(**message)
+
+    def get_summary(self, conversation_id: str) -> Summary | None:
+        try:
+            summary = self.client.read_item(
+                SUMMARY_ID,
+                conversation_id,
+                raw_response_hook=self._charge("get_summary"),
+            )
+        except self.read_item_error:
+            return None
+        return Summary(**summary)
+
+    def upsert_summary(self, summary: Summary) -> None:
+        self.client.upsert_item(
+            summary.model_dump(),
+            raw_response_hook=self._charge("upsert_summary"),
+        )
+
+    def list_conversations(
+        self,
+        user_id: str,
+        order_by: OrderBy = "DESC",
+    ) -> list[Conversation]:
+        conversations = self._query(
+            "list_conversations",
+            self._conversations_query(user_id, order_by),
+            partition_key=user_id,
+        )
+        return [Conversation(**conversation) for conversation in conversations]
+
+    def list_messages(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+    ) -> list[Message]:
+        messages = self._query(
+            "list_messages",
+            self._messages_query(conversation_id, order_by),
+            partition_key=conversation_id,
+        )
+        return [Message(**message) for message in messages]
+
+    def list_recent_messages(
+        self,
+        conversation_id: str,
+        n_messages: int,
+    ) -> list[Message]:
+        if n_messages <= 0:
+            return []
+        messages = self._query(
+            "list_recent_messages",
+            self._messages_query(conversation_id, "DESC", n_messages),
+            partition_key=conversation_id,
+        )
+        return [Message(**message) for message in messages][::-1]
+
+    def list_conversations_page(
+        self,
+        user_id: str,
+        order_by: OrderBy = "DESC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        items, token = self._query_page(
+            "list_conversations_page",
+            self._conversations_query(user_id, order_by),
+            user_id,
+            limit,
+            cursor,
+        )
+        return self._page(Conversation, items, token)
+
+    def list_messages_page(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Message]:
+        items, token = self._query_page(
+            "list_messages_page",
+            self._messages_query(conversation_id, order_by),
+            conversation_id,
+            limit,
+            cursor,
+        )
+        return self._page(Message, items, token)
+
+    # Batches
+    def _write_items(
+        self,
+        operation: str,
+        kind: str,
+        items: list[Conversation] | list[Message],
+    ) -> list[Exception | None]:
+        """Creates or upserts messages or conversations, with a transactional
+        batch per partition.
+
+        Returns:
+            For each item, None if it was written or the error.
+        """
+        dumps = [item.model_dump() for item in items]
+        write_item = getattr(self.client, f"{operation}_item")
+        return self._batches(
+            f"{operation}_{kind}s",
+            [item[self.PARTITION_KEYS[kind]] for item in dumps],
+            [(operation, (item,)) for item in dumps],
+            lambda i: write_item(
+                dumps[i], raw_response_hook=self._charge(f"{operation}_{kind}")
+            ),
+        )
+
+    async def _awrite_items(
+        self,
+        operation: str,
+        kind: str,
+        items: list[Conversation] | list[Message],
+    ) -> list[Exception | None]:
+        dumps = [item.model_dump() for item in items]
+        write_item = getattr(self.aclient, f"{operation}_item")
+        return await self._abatches(
+            f"{operation}_{kind}s",
+            [item[self.PARTITION_KEYS[kind]] for item in dumps],
+            [(operation, (item,)) for item in dumps],
+            lambda i: write_item(
+                dumps[i], raw_response_hook=self._charge(f"{operation}_{kind}")
+            ),
+        )
+
+    def _batches(
+        self,
+        operation: str,
+        keys: list[str],
+        operations: list[BatchOperation],
+        retry: Callable[[int], None],
+    ) -> list[Exception | None]:
+        """Runs the operations of items with transactional batches, grouped by
+        their partition key.
+
+        A batch is atomic, so a failed batch (e.g. with a deleted
+        conversation) is retried item by item with `retry`, to isolate the
+        errors.
+
+        Returns:
+            For each item, None if it was written or the error.
+        """
+        results: list[Exception | None] = [None] * len(keys)
+        for key, indexes in _group(keys).items():
+            for chunk in self._chunks(indexes):
+                try:
+                    self.client.execute_item_batch(
+                        [operations[i] for i in chunk],
+                        partition_key=key,
+                        raw_response_hook=self._charge(operation),
+                    )
+                except Exception:
+                    for i in chunk:
+                        try:
+                            retry(i)
+                        except Exception as error:
+                            results[i] = error
+        return results
+
+    async def _abatches(
+        self,
+        operation: str,
+        keys: list[str],
+        operations: list[BatchOperation],
+        retry: Callable[[int], Awaitable[None]],
+    ) -> list[Exception | None]:
+        """Like `_batches`, with the partitions run concurrently."""
+        results: list[Exception | None] = [None] * len(keys)
+
+        async def partition(key: str, indexes: list[int]) -> None:
+            for chunk in self._chunks(indexes):
+                try:
+                    await self.aclient.execute_item_batch(
+                        [operations[i] for i in chunk],
+                        partition_key=key,
+                        raw_response_hook=self._charge(operation),
+                    )
+                except Exception:
+                    for i in chunk:
+                        try:
+                            await retry(i)
+                        except Exception as error:
+                            results[i] = error
+
+        await asyncio.gather(
+            *(partition(key, indexes) for key, indexes in _group(keys).items())
+        )
+        return results
+
+    def _delete_ids(
+        self, operation: str, conversation_id: str, ids: list[str]
+    ) -> None:
+        """Deletes messages with transactional batches in their partition."""
+        for chunk in self._chunks(ids):
+            self.client.execute_item_batch(
+                [("delete", (id,)) for id in chunk],
+                partition_key=conversation_id,
+                raw_response_hook=self._charge(operation),
+            )
+
+    async def _adelete_ids(
+        self, operation: str, conversation_id: str, ids: list[str]
+    ) -> None:
+        for chunk in self._chunks(ids):
+            await self.aclient.execute_item_batch(
+                [("delete", (id,)) for id in chunk],
+                partition_key=conversation_id,
+                raw_response_hook=self._charge(operation),
+            )
+
+    def _chunks(self, items: list[T]) -> list[list[T]]:
+        """Splits items into chunks of the size of a transactional batch."""
+        size = self.MAX_BATCH_OPERATIONS
+        return [items[i : i + size] for i in range(0, len(items), size)]
+
+    @staticmethod
+    def _timestamp_patch(
+        conversation_id: str, timestamp: str
+    ) -> BatchOperation:
+        """The batch operation setting the timestamp of a conversation."""
+        return (
+            "patch",
+            (
+                conversation_id,
+                [{"op": "set", "path": "/last_updated_at", "value": timestamp}],
+            ),
+        )
+
+    @staticmethod
+    def _activity_patch(
+        activity: ConversationActivity, timestamp: str
+    ) -> BatchOperation:
+        """The batch operation applying an activity to a conversation. The
+        counts are incremented in place, so concurrent writers add up.
+        """
+        return (
+            "patch",
+            (
+                activity.conversation_id,
+                [
+                    {
+                        "op": "incr",
+                        "path": "/message_count",
+                        "value": activity.message_count,
+                    },
+                    {
+                        "op": "incr",
+                        "path": "/total_tokens",
+                        "value": activity.total_tokens,
+                    },
+                    {
+                        "op": "set",
+                        "path": "/last_role",
+                        "value": activity.last_role,
+                    },
+                    {
+                        "op": "set",
+                        "path": "/last_message_preview",
+                        "value": activity.last_message_preview,
+                    },
+                    {
+                        "op": "set",
+                        "path": "/last_updated_at",
+                        "value": timestamp,
+                    },
+                ],
+            ),
+        )
+
+    # Queries
+    def _conversations_query(self, user_id: str, order_by: OrderBy) -> Query:
+        direction = {"ASC": "ASC", "DESC": "DESC"}[order_by]
+        return (
+            (
+                f"SELECT {self.CONVERSATION_FIELDS} FROM c "
+                "WHERE c.user_id = @user_id "
+                f"ORDER BY c.last_updated_at {direction}"
+            ),
+            [{"name": "@user_id", "value": user_id}],
+        )
+
+    def _messages_query(
+        self,
+        conversation_id: str,
+        order_by: OrderBy,
+        n_messages: int | None = None,
+        before: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> Query:
+        """The messages of a conversation (the first `n_messages` if set),
+        created before `before`, at or after `since` and at or before `until`
+        if set.
+        """
+        direction = {"ASC": "ASC", "DESC": "DESC"}[order_by]
+        top = "TOP @n_messages " if n_messages is not None else ""
+        condition = "AND c.created_at < @before " if before is not None else ""
+        if since is not None:
+            condition += "AND c.created_at >= @since "
+        if until is not None:
+            condition += "AND c.created_at <= @until "
+        parameters: list[dict[str, object]] = [
+            {"name": "@conversation_id", "value": conversation_id},
+            {"name": "@summary_id", "value": SUMMARY_ID},
+        ]
+        if n_messages is not None:
+            parameters.append({"name": "@n_messages", "value": int(n_messages)})
+        if before is not None:
+            parameters.append({"name": "@before", "value": before})
+        if since is not None:
+            parameters.append({"name": "@since", "value": since})
+        if until is not None:
+            parameters.append({"name": "@until", "value": until})
+        return (
+            (
+                f"SELECT {top}{self.MESSAGE_FIELDS} FROM c "
+                "WHERE c.conversation_id = @conversation_id "
+                f"AND c.id != @summary_id {condition}"
+                f"ORDER BY c.created_at {direction}"
+            ),
+            parameters,
+        )
+
+    @staticmethod
+    def _message_ids_query(conversation_id: str, offset: int) -> Query:
+        """The IDs of the messages of a conversation, newest first, but the
+        first `offset`.
+        """
+        return (
+            (
+                "SELECT VALUE c.id FROM c "
+                "WHERE c.conversation_id = @conversation_id "
+                "AND c.id != @summary_id ORDER BY c.created_at DESC "
+                # OFFSET needs a LIMIT, a conversation never has this many
+                "OFFSET @offset LIMIT 1000000"
+            ),
+            [
+                {"name": "@conversation_id", "value": conversation_id},
+                {"name": "@summary_id", "value": SUMMARY_ID},
+                {"name": "@offset", "value": max(int(offset), 0)},
+            ],
+        )
+
+    @staticmethod
+    def _count_query(conversation_id: str) -> Query:
+        return (
+            (
+                "SELECT VALUE COUNT(1) FROM c "
+                "WHERE c.conversation_id = @conversation_id "
+                "AND c.id != @summary_id"
+            ),
+            [
+                {"name": "@conversation_id", "value": conversation_id},
+                {"name": "@summary_id", "value": SUMMARY_ID},
+            ],
+        )
+
+    # Queries, in a partition or across all of them if None
+    def _query(
+        self,
+        operation: str,
+        query: Query,
+        partition_key: str | None,
+        max_item_count: int | None = None,
+    ) -> Any:
+        text, parameters = query
+        return self.client.query_items(
+            text,
+            parameters=parameters,
+            partition_key=partition_key,
+            enable_cross_partition_query=partition_key is None,
+            max_item_count=max_item_count,
+            raw_response_hook=self._charge(operation),
+        )
+
+    def _aquery(
+        self,
+        operation: str,
+        query: Query,
+        partition_key: str | None,
+        max_item_count: int | None = None,
+    ) -> Any:
+        text, parameters = query
+        return self.aclient.query_items(
+            text,
+            parameters=parameters,
+            partition_key=partition_key,
+            enable_cross_partition_query=partition_key is None,
+            max_item_count=max_item_count,
+            raw_response_hook=self._charge(operation),
+        )
+
+    # Pagination, with the continuation tokens of the queries
+    def _query_page(
+        self,
+        operation: str,
+        query: Query,
+        partition_key: str | None,
+        limit: int,
+        cursor: str | None,
+    ) -> tuple[list[dict[str, Any]], str | None]:
+        """The items of a page of a query, and its continuation token."""
+        pages = self._query(operation, query, partition_key, limit).by_page(
+            self._continuation_token(cursor)
+        )
+        return list(next(pages, [])), pages.continuation_token
+
+    async def _aquery_page(
+        self,
+        operation: str,
+        query: Query,
+        partition_key: str | None,
+        limit: int,
+        cursor: str | None,
+    ) -> tuple[list[dict[str, Any]], str | None]:
+        pages = self._aquery(operation, query, partition_key, limit).by_page(
+            self._continuation_token(cursor)
+        )
+        page = await anext(pages, None)
+        items = [item async for item in page] if page else []
+        return items, pages.continuation_token
+
+    def _page(
+        self, model: type[M], items: list[dict[str, Any]], token: str | None
+    ) -> Page[M]:
+        return Page(
+            items=[model(**item) for item in items],
+            next_cursor=self._next_cursor(token),
+        )
+
+    @staticmethod
+    def _continuation_token(cursor: str | None) -> str | None:
+        if cursor is None:
+            return None
+        token = decode_cursor(cursor)
+        if not isinstance(token, str):
+            raise ValueError("Invalid cursor.")
+        return token
+
+    @staticmethod
+    def _next_cursor(continuation_token: str | None) -> str | None:
+        if not continuation_token:
+            return None
+        return encode_cursor(continuation_token)
+
+
+class SqliteChatDB(ChatDB):
+    """Local chat database, stored in SQLite (WAL mode).
+
+    The endpoint is `sqlite:///<directory>`, every collection is stored in
+    its own database file in the directory. Each thread uses its own
+    connection, so the reads run concurrently with a write. `aclose` closes
+    the connections of all threads.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS conversations (
+        id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        last_updated_at TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        total_tokens INTEGER NOT NULL DEFAULT 0,
+        last_role TEXT,
+        last_message_preview TEXT
+    );
+    CREATE INDEX IF NOT EXISTS conversations_user_id_last_updated_at
+        ON conversations (user_id, last_updated_at);
+    CREATE TABLE IF NOT EXISTS messages (
+        id TEXT PRIMARY KEY,
+        conversation_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        text TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        tokens INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS messages_conversation_id_created_at
+        ON messages (conversation_id, created_at);
+    CREATE TABLE IF NOT EXISTS summaries (
+        conversation_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        text TEXT NOT NULL,
+        summarized_until TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    """
+    MESSAGE_COLUMNS = (
+        "id, conversation_id, user_id, role, text, created_at, tokens"
+    )
+    CONVERSATION_COLUMNS = (
+        "id, user_id, created_at, last_updated_at, message_count, "
+        "total_tokens, last_role, last_message_preview"
+    )
+    # The columns added since the first schema, to add to older databases
+    CONVERSATION_MIGRATIONS = {
+        "message_count": "INTEGER NOT NULL DEFAULT 0",
+        "total_tokens": "INTEGER NOT NULL DEFAULT 0",
+        "last_role": "TEXT",
+        "last_message_preview": "TEXT",
+    }
+
+    def __init__(
+        self,
+        endpoint: str,
+        collection: str,
+        **kwargs: Any,
+    ):
+        self.path = Path(endpoint.removeprefix("sqlite:///")) / (
+            f"{collection}.sqlite3"
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        # The connections of all threads, to close them
+        self._connections: set[sqlite3.Connection] = set()
+        self._connections_lock = threading.Lock()
+        with self._connection() as connection:
+            connection.executescript(self.SCHEMA)
+            columns = {
+                row["name"]
+                for row in connection.execute(
+                    "PRAGMA table_info(conversations)"
+                )
+            }
+            for column, definition in self.CONVERSATION_MIGRATIONS.items():
+                if column not in columns:
+                    connection.execute(
+                        "ALTER TABLE conversations "
+                        f"ADD COLUMN {column} {definition}"
+                    )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or connection not in self._connections:
+            # Only used by this thread, but closed by the one of `aclose`
+            connection = sqlite3.connect(
+                self.path,
+                isolation_level=None,
+                cached_statements=256,
+                check_same_thread=False,
+            )
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            with self._connections_lock:
+                self._connections.add(connection)
+            self._local.connection = connection
+        return connection
+
+    async def aclose(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for connection in connections:
+            connection.close()
+
+    def _create_conversation(self, conversation: Conversation) -> None:
+        self._connection().execute(
+            f"INSERT INTO conversations ({self.CONVERSATION_COLUMNS}) "
+            "VALUES (:id, :user_id, :created_at, :last_updated_at, "
+            ":message_count, :total_tokens, :last_role, :last_message_preview)",
+            conversation.model_dump(),
+        )
+
+    def _create_message(self, message: Message) -> None:
+        self._connection().execute(
+            f"INSERT INTO messages ({self.MESSAGE_COLUMNS}) VALUES "
+            "(:id, :conversation_id, :user_id, :role, :text, :created_at, "
+            ":tokens)",
+            message.model_dump(),
+        )
+
+    def _update_conversation(self, conversation: Conversation) -> None:
+        self._connection().execute(
+            "UPDATE conversations SET last_updated_at = :last_updated_at "
+            "WHERE id = :id AND user_id = :user_id",
+            conversation.model_dump(),
+        )
+
+    def delete_messages_after(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> list[Message]:
+        rows = (
+            self._connection()
+            .execute(
+                "DELETE FROM messages "
+                "WHERE conversation_id = ? AND created_at >= ? "
+                f"RETURNING {self.MESSAGE_COLUMNS}",
+                (conversation_id, created_at),
+            )
+            .fetchall()
+        )
+        # RETURNING does not keep an order
+        return sorted((Message(**row) for row in rows), key=_message_key)
+
+    def delete_messages_until(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> list[Message]:
+        rows = (
+            self._connection()
+            .execute(
+                "DELETE FROM messages "
+                "WHERE conversation_id = ? AND created_at <= ? "
+                f"RETURNING {self.MESSAGE_COLUMNS}",
+                (conversation_id, created_at),
+            )
+            .fetchall()
+        )
+        # RETURNING does not keep an order
+        return sorted((Message(**row) for row in rows), key=_message_key)
+
+    def keep_last_n(self, conversation_id: str, n_messages: int) -> None:
+        self._connection().execute(
+            "DELETE FROM messages WHERE conversation_id = ? AND id NOT IN ("
+            "SELECT id FROM messages WHERE conversation_id = ? "
+            "ORDER BY created_at DESC LIMIT ?)",
+            (conversation_id, conversation_id, max(n_messages, 0)),
+        )
+
+    def get_message_before(
+        self,
+        conversation_id: str,
+        created_at: str,
+    ) -> Message | None:
+        row = (
+            self._connection()
+            .execute(
+                f"SELECT {self.MESSAGE_COLUMNS} FROM messages "
+                "WHERE conversation_id = ? AND created_at < ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (conversation_id, created_at),
+            )
+            .fetchone()
+        )
+        return Message(**row) if row else None
+
+    def update_conversation_timestamp(
+        self,
+        conversation_id: str,
+        user_id: str,
+    ) -> None:
+        self._connection().execute(
+            "UPDATE conversations SET last_updated_at = ? "
+            "WHERE id = ? AND user_id = ?",
+            (datetime.now(UTC).isoformat(), conversation_id, user_id),
+        )
+
+    def create_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        try:
+            self._transaction(
+                f"INSERT INTO messages ({self.MESSAGE_COLUMNS}) VALUES "
+                "(:id, :conversation_id, :user_id, :role, :text, :created_at, "
+                ":tokens)",
+                [message.model_dump() for message in messages],
+            )
+        except sqlite3.Error:
+            # The transaction was rolled back, retry one by one
+            return _each(self._create_message, [(m,) for m in messages])
+        return [None] * len(messages)
+
+    def update_conversation_timestamps(
+        self, conversations: list[tuple[str, str]]
+    ) -> list[Exception | None]:
+        timestamp = datetime.now(UTC).isoformat()
+        try:
+            self._transaction(
+                "UPDATE conversations SET last_updated_at = ? "
+                "WHERE id = ? AND user_id = ?",
+                [
+                    (timestamp, conversation_id, user_id)
+                    for conversation_id, user_id in conversations
+                ],
+            )
+        except sqlite3.Error:
+            return _each(self.update_conversation_timestamp, conversations)
+        return [None] * len(conversations)
+
+    def update_conversation_activity(
+        self, activities: list[ConversationActivity]
+    ) -> list[Exception | None]:
+        statement = (
+            "UPDATE conversations SET "
+            "message_count = message_count + :message_count, "
+            "total_tokens = total_tokens + :total_tokens, "
+            "last_role = :last_role, "
+            "last_message_preview = :last_message_preview, "
+            "last_updated_at = :timestamp "
+            "WHERE id = :conversation_id AND user_id = :user_id"
+        )
+        timestamp = datetime.now(UTC).isoformat()
+        return self._upsert(
+            statement,
+            [
+                {**activity.model_dump(), "timestamp": timestamp}
+                for activity in activities
+            ],
+        )
+
+    def upsert_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        return self._upsert(
+            f"INSERT OR REPLACE INTO messages ({self.MESSAGE_COLUMNS}) VALUES "
+            "(:id, :conversation_id, :user_id, :role, :text, :created_at, "
+            ":tokens)",
+            [message.model_dump() for message in messages],
+        )
+
+    def upsert_conversations(
+        self, conversations: list[Conversation]
+    ) -> list[Exception | None]:
+        return self._upsert(
+            f"INSERT OR REPLACE INTO conversations "
+            f"({self.CONVERSATION_COLUMNS}) "
+            "VALUES (:id, :user_id, :created_at, :last_updated_at, "
+            ":message_count, :total_tokens, :last_role, :last_message_preview)",
+            [conversation.model_dump() for conversation in conversations],
+        )
+
+    def list_all_conversations_page(
+        self,
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        # By ID, the primary key, so the pages are range scans
+        query = f"SELECT {self.CONVERSATION_COLUMNS} FROM conversations"
+        parameters: tuple[Any, ...] = ()
+        after = _decode_key(cursor)
+        if after is not None:
+            query += " WHERE id > ?"
+            parameters = (after[0],)
+        rows = (
+            self._connection()
+            .execute(f"{query} ORDER BY id LIMIT ?", (*parameters, limit + 1))
+            .fetchall()
+        )
+        return _key_page(
+            [Conversation(**row) for row in rows],
+            lambda conversation: (conversation.id, conversation.user_id),
+            limit,
+        )
+
+    def count_messages(self, conversation_id: str) -> int:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ?",
+                (conversation_id,),
+            )
+            .fetchone()
+        )
+        return int(row[0])
+
+    def _upsert(
+        self, statement: str, parameters: list[dict[str, Any]]
+    ) -> list[Exception | None]:
+        try:
+            self._transaction(statement, parameters)
+        except sqlite3.Error:
+            # The transaction was rolled back, retry one by one
+            connection = self._connection()
+            return _each(
+                lambda row: connection.execute(statement, row),
+                [(row,) for row in parameters],
+            )
+        return [None] * len(parameters)
+
+    @contextmanager
+    def _begin(self) -> Iterator[sqlite3.Connection]:
+        """A transaction on the connection of the current thread, rolled back
+        on error.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _transaction(self, statement: str, parameters: list[Any]) -> None:
+        """Runs a statement for many parameters, in one transaction."""
+        with self._begin() as connection:
+            connection.executemany(statement, parameters)
+
+    def delete_conversation(self, conversation_id: str, user_id: str) -> None:
+        self._connection().execute(
+            "DELETE FROM conversations WHERE id = ? AND user_id = ?",
+            (conversation_id, user_id),
+        )
+
+    def delete_message(self, message_id: str, conversation_id: str) -> None:
+        self._connection().execute(
+            "DELETE FROM messages WHERE id = ? AND conversation_id = ?",
+            (message_id, conversation_id),
+        )
+
+    def delete_all_messages(self, conversation_id: str) -> None:
+        with self._begin() as connection:
+            connection.execute(
+                "DELETE FROM messages WHERE conversation_id = ?",
+                (conversation_id,),
+            )
+            connection.execute(
+                "DELETE FROM summaries WHERE conversation_id = ?",
+                (conversation_id,),
+            )
+
+    def get_conversation(
+        self, conversation_id: str, user_id: str
+    ) -> Conversation | None:
+        row = (
+            self._connection()
+            .execute(
+                f"SELECT {self.CONVERSATION_COLUMNS} FROM conversations "
+                "WHERE id = ? AND user_id = ?",
+                (conversation_id, user_id),
+            )
+            .fetchone()
+        )
+        return Conversation(**row) if row else None
+
+    def get_message(
+        self, message_id: str, conversation_id: str
+    ) -> Message | None:
+        row = (
+            self._connection()
+            .execute(
+                f"SELECT {self.MESSAGE_COLUMNS} FROM messages "
+                "WHERE id = ? AND conversation_id = ?",
+                (message_id, conversation_id),
+            )
+            .fetchone()
+        )
+        return Message(**row) if row else None
+
+    def get_summary(self, conversation_id: str) -> Summary | None:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT conversation_id, user_id, text, summarized_until, "
+                "updated_at FROM summaries WHERE conversation_id = ?",
+                (conversation_id,),
+            )
+            .fetchone()
+        )
+        return Summary(**row) if row else None
+
+    def upsert_summary(self, summary: Summary) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO summaries (conversation_id, user_id, text, "
+            "summarized_until, updated_at) VALUES (:conversation_id, "
+            ":user_id, :text, :summarized_until, :updated_at)",
+            summary.model_dump(),
+        )
+
+    def list_conversations(
+        self,
+        user_id: str,
+        order_by: OrderBy = "DESC",
+    ) -> list[Conversation]:
+        direction = {"ASC": "ASC", "DESC": "DESC"}[order_by]
+        rows = self._connection().execute(
+            f"SELECT {self.CONVERSATION_COLUMNS} FROM conversations "
+            f"WHERE user_id = ? ORDER BY last_updated_at {direction}",
+            (user_id,),
+        )
+        return [Conversation(**row) for row in rows]
+
+    def list_messages(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+    ) -> list[Message]:
+        direction = {"ASC": "ASC", "DESC": "DESC"}[order_by]
+        rows = self._connection().execute(
+            f"SELECT {self.MESSAGE_COLUMNS} FROM messages "
+            f"WHERE conversation_id = ? ORDER BY created_at {direction}",
+            (conversation_id,),
+        )
+        return [Message(**row) for row in rows]
+
+    def list_recent_messages(
+        self,
+        conversation_id: str,
+        n_messages: int,
+    ) -> list[Message]:
+        rows = self._connection().execute(
+            f"SELECT {self.MESSAGE_COLUMNS} FROM messages "
+            "WHERE conversation_id = ? ORDER BY created_at DESC LIMIT ?",
+            (conversation_id, max(n_messages, 0)),
+        )
+        return [Message(**row) for row in rows][::-1]
+
+    def list_conversations_page(
+        self,
+        user_id: str,
+        order_by: OrderBy = "DESC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        rows = self._range(
+            f"SELECT {self.CONVERSATION_COLUMNS} FROM conversations "
+            "WHERE user_id = ?",
+            (user_id,),
+            "last_updated_at",
+            order_by,
+            limit,
+            cursor,
+        )
+        return _key_page(
+            [Conversation(**row) for row in rows], _conversation_key, limit
+        )
+
+    def list_messages_page(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Message]:
+        rows = self._range(
+            f"SELECT {self.MESSAGE_COLUMNS} FROM messages "
+            "WHERE conversation_id = ?",
+            (conversation_id,),
+            "created_at",
+            order_by,
+            limit,
+            cursor,
+        )
+        return _key_page([Message(**row) for row in rows], _message_key, limit)
+
+    def _range(
+        self,
+        query: str,
+        parameters: tuple[Any, ...],
+        sort_column: str,
+        order_by: OrderBy,
+        limit: int,
+        cursor: str | None,
+    ) -> list[sqlite3.Row]:
+        """Reads up to `limit + 1` rows after the (sort key, ID) of the
+        cursor, with a range scan of the index.
+        """
+        direction, operator = {"ASC": ("ASC", ">"), "DESC": ("DESC", "<")}[
+            order_by
+        ]
+        after = _decode_key(cursor)
+        if after is not None:
+            query += f" AND ({sort_column}, id) {operator} (?, ?)"
+            parameters += after
+        query += f" ORDER BY {sort_column} {direction}, id {direction} LIMIT ?"
+        return (
+            self._connection()
+            .execute(query, (*parameters, limit + 1))
+            .fetchall()
+        )
+
+
+# Estimated memory of a cached message besides its text, in bytes
+_CACHE_OVERHEAD = 400
+
+
+class _CachedWindow:
+    """The cached messages (ordered ASC) and summary of a conversation. The
+    messages are all of the conversation if `complete`, else its newest ones.
+    """
+
+    def __init__(self, expires_at: float) -> None:
+        self.messages: list[Message] | None = None
+        self.complete = False
+        self.summary: Summary | None = None
+        self.has_summary = False
+        self.expires_at = expires_at
+        self.size = 0
+
+    def measure(self) -> int:
+        """Estimates the memory used by the window, in bytes."""
+        texts = [message.text for message in self.messages or []]
+        if self.summary is not None:
+            texts.append(self.summary.text)
+        self.size = sum(len(text) + _CACHE_OVERHEAD for text in texts)
+        return self.size
+
+    def covers(self, n_messages: int | None) -> bool:
+        """Whether the window holds all the messages, or the newest
+        `n_messages` if set.
+        """
+        if self.messages is None:
+            return False
+        if self.complete:
+            return True
+        return n_messages is not None and len(self.messages) >= n_messages
+
+
+class _Load:
+    """A read of the database in flight, made stale by a concurrent write."""
+
+    stale = False
+
+
+class CachedChatDB(ChatDB):
+    """Read-through cache of the recent conversations, in front of a ChatDB.
+
+    The messages and the summary of a conversation are cached on the first
+    read, in an LRU bounded by an estimate of their memory. A read of the
+    recent messages (e.g. the history) only caches the newest `messages` (or
+    as many as read), and a read needing more falls through. The messages
+    created through the cache are written through to the cached window and
+    the deletes invalidate it. The windows expire after `ttl` seconds, which
+    bounds how stale a conversation written by another process can be.
+
+    All other operations are passed through to the database.
+
+    Args:
+        db: The cached database.
+        name: The name of the cache in the metrics.
+        max_bytes: The maximum estimated memory of the cache.
+        ttl: The time to live of a cached conversation, in seconds.
+        messages: The newest messages cached by a read of the recent messages.
+    """
+
+    def __init__(
+        self,
+        db: ChatDB,
+        name: str,
+        max_bytes: int = CHAT_CACHE_SIZE_MB * 1024 * 1024,
+        ttl: float = CHAT_CACHE_TTL,
+        messages: int = CHAT_CACHE_MESSAGES,
+    ) -> None:
+        self.db = db
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.messages = messages
+        self._windows: OrderedDict[str, _CachedWindow] = OrderedDict()
+        self._loads: dict[str, list[_Load]] = dict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ["hits", "misses", "evicted", "expired", "invalidated"], 0
+        )
+        register_metrics(f"chat_cache.{name}", self.metrics)
+
+    def metrics(self) -> dict[str, Any]:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+            "conversations": len(self._windows),
+            "bytes": self._size,
+        }
+
+    # Cache
+    def _lookup(self, conversation_id: str) -> _CachedWindow | None:
+        window = self._windows.get(conversation_id)
+        if window is None:
+            return None
+        if window.expires_at <= time.monotonic():
+            self._counters["expired"] += 1
+            self._drop(conversation_id)
+            return None
+        self._windows.move_to_end(conversation_id)
+        return window
+
+    def _cached_messages(
+        self, conversation_id: str, n_messages: int | None = None
+    ) -> list[Message] | None:
+        """The cached messages of a conversation, or its newest `n_messages`
+        if set.
+        """
+        with self._lock:
+            window = self._lookup(conversation_id)
+            if window is None or not window.covers(n_messages):
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            messages = window.messages or []
+            return messages[-n_messages:] if n_messages else list(messages)
+
+    def _cached_summary(
+        self, conversation_id: str
+    ) -> tuple[bool, Summary | None]:
+        with self._lock:
+            window = self._lookup(conversation_id)
+            if window is None or not window.has_summary:
+                self._counters["misses"] += 1
+                return False, None
+            self._counters["hits"] += 1
+            return True, window.summary
+
+    def _start_load(self, conversation_id: str) -> _Load:
+        load = _Load()
+        with self._lock:
+            self._loads.setdefault(conversation_id, []).append(load)
+        return load
+
+    def _end_load(
+        self,
+        conversation_id: str,
+        load: _Load,
+        messages: list[Message] | None = None,
+        summary: Summary | None = None,
+        has_summary: bool = False,
+        complete: bool = True,
+    ) -> None:
+        """Caches the result of a read, unless a write made it stale. The
+        messages are the newest ones only, unless `complete`.
+        """
+        with self._lock:
+            loads = self._loads[conversation_id]
+            loads.remove(load)
+            if not loads:
+                del self._loads[conversation_id]
+            if load.stale or (messages is None and not has_summary):
+                return
+            window = self._lookup(conversation_id)
+            if window is None:
+                window = _CachedWindow(time.monotonic() + self.ttl)
+                self._windows[conversation_id] = window
+            if messages is not None and (complete or not window.complete):
+                window.messages, window.complete = list(messages), complete
+            if has_summary:
+                window.summary, window.has_summary = summary, True
+            self._resize(window)
+
+    def _write(
+        self,
+        conversation_id: str,
+        message: Message | None = None,
+        summary: Summary | None = None,
+    ) -> None:
+        """Writes through a new message or summary, if the conversation is
+        cached.
+        """
+        with self._lock:
+            for load in self._loads.get(conversation_id, []):
+                load.stale = True
+            window = self._windows.get(conversation_id)
+            if window is None:
+                return
+            if message is not None and window.messages is not None:
+                # The newest messages only take the newer ones
+                if window.complete or _message_key(message) > _message_key(
+                    window.messages[0]
+                ):
+                    insort(window.messages, message, key=_message_key)
+            if summary is not None:
+                window.summary, window.has_summary = summary, True
+            self._resize(window)
+
+    def _invalidate(self, conversation_id: str) -> None:
+        with self._lock:
+            for load in self._loads.get(conversation_id, []):
+                load.stale = True
+            if conversation_id in self._windows:
+                self._counters["invalidated"] += 1
+                self._drop(conversation_id)
+
+    def _resize(self, window: _CachedWindow) -> None:
+        self._size -= window.size
+        self._size += window.measure()
+        while self._size > self.max_bytes and self._windows:
+            self._counters["evicted"] += 1
+            self._drop(next(iter(self._windows)))
+
+    def _drop(self, conversation_id: str) -> None:
+        window = self._windows.pop(conversation_id)
+        self._size -= window.size
+
+    # Cached reads
+    def list_messages(
+        self, conversation_id: str, order_by: OrderBy = "ASC"
+    ) -> list[Message]:
+        messages = self._cached_messages(conversation_id)
+        if messages is None:
+            load = self._start_load(conversation_id)
+            try:
+                messages = self.db.list_messages(conversation_id)
+            finally:
+                self._end_load(conversation_id, load, messages)
+        return messages[::-1] if order_by == "DESC" else messages
+
+    async def alist_messages(
+        self, conversation_id: str, order_by: OrderBy = "ASC"
+    ) -> list[Message]:
+        messages = self._cached_messages(conversation_id)
+        if messages is None:
+            load = self._start_load(conversation_id)
+            try:
+                messages = await self.db.alist_messages(conversation_id)
+            finally:
+                self._end_load(conversation_id, load, messages)
+        return messages[::-1] if order_by == "DESC" else messages
+
+    def list_recent_messages(
+        self, conversation_id: str, n_messages: int
+    ) -> list[Message]:
+        if n_messages <= 0:
+            return []
+        messages = self._cached_messages(conversation_id, n_messages)
+        if messages is None:
+            size = max(n_messages, self.messages)
+            load = self._start_load(conversation_id)
+            try:
+                messages = self.db.list_recent_messages(conversation_id, size)
+            finally:
+                self._end_load(
+                    conversation_id,
+                    load,
+                    messages,
+                    complete=len(messages or []) < size,
+                )
+        return messages[-n_messages:]
+
+    async def alist_recent_messages(
+        self, conversation_id: str, n_messages: int
+    ) -> list[Message]:
+        if n_messages <= 0:
+            return []
+        messages = self._cached_messages(conversation_id, n_messages)
+        if messages is None:
+            size = max(n_messages, self.messages)
+            load = self._start_load(conversation_id)
+            try:
+                messages = await self.db.alist_recent_messages(
+                    conversation_id, size
+                )
+            finally:
+                self._end_load(
+                    conversation_id,
+                    load,
+                    messages,
+                    complete=len(messages or []) < size,
+                )
+        return messages[-n_messages:]
+
+    def list_messages_page(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Message]:
+        page = self._cached_page(conversation_id, order_by, limit, cursor)
+        if page is None:
+            page = self.db.list_messages_page(
+                conversation_id, order_by, limit, cursor
+            )
+        return page
+
+    async def alist_messages_page(
+        self,
+        conversation_id: str,
+        order_by: OrderBy = "ASC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Message]:
+        page = self._cached_page(conversation_id, order_by, limit, cursor)
+        if page is None:
+            page = await self.db.alist_messages_page(
+                conversation_id, order_by, limit, cursor
+            )
+        return page
+
+    def _cached_page(
+        self,
+        conversation_id: str,
+        order_by: OrderBy,
+        limit: int,
+        cursor: str | None,
+    ) -> Page[Message] | None:
+        """Serves the first page from cache, if it is the only page. The
+        cursors are specific to the database, so the other pages are not.
+        """
+        if cursor is not None:
+            return None
+        messages = self._cached_messages(conversation_id)
+        if messages is None or len(messages) > limit:
+            return None
+        return Page(items=messages[::-1] if order_by == "DESC" else messages)
+
+    def get_summary(self, conversation_id: str) -> Summary | None:
+        cached, summary = self._cached_summary(conversation_id)
+        if not cached:
+            load = self._start_load(conversation_id)
+            try:
+                summary = self.db.get_summary(conversation_id)
+            finally:
+                self._end_load(conversation_id, load, None, summary, True)
+        return summary
+
+    async def aget_summary(self, conversation_id: str) -> Summary | None:
+        cached, summary = self._cached_summary(conversation_id)
+        if not cached:
+            load = self._start_load(conversation_id)
+            try:
+                summary = await self.db.aget_summary(conversation_id)
+            finally:
+                self._end_load(conversation_id, load, None, summary, True)
+        return summary
+
+    # Writes through the cache
+    def _create_message(self, message: Message) -> None:
+        self.db._create_message(message)
+        self._write(message.conversation_id, message=message)
+
+    async def acreate_message(
+        self,
+        conversation_id: str,
+        user_id: str,
+        role: Role,
+        text: str,
+        id: str | None = None,
+        created_at: str | None = None,
+        tokens: int | None = None,
+    ) -> Message:
+        message = await self.db.acreate_message(
+            conversation_id, user_id, role, text, id, created_at, tokens
+        )
+        self._write(conversation_id, message=message)
+        return message
+
+    def create_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        results = self.db.create_messages(messages)
+        for message, error in zip(messages, results):
+            if error is None:
+                self._write(message.conversation_id, message=message)
+        return results
+
+    async def acreate_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        results = await self.db.acreate_messages(messages)
+        for message, error in zip(messages, results):
+            if error is None:
+                self._write(message.conversation_id, message=message)
+        return results
+
+    def upsert_summary(self, summary: Summary) -> None:
+        self.db.upsert_summary(summary)
+        self._write(summary.conversation_id, summary=summary)
+
+    async def aupsert_summary(self, summary: Summary) -> None:
+        await self.db.aupsert_summary(summary)
+        self._write(summary.conversation_id, summary=summary)
+
+    # Deletes, invalidating the cache
+    def delete_message(self, message_id: str, conversation_id: str) -> None:
+        try:
+            self.db.delete_message(message_id, conversation_id)
+        finally:
+            self._invalidate(conversation_id)
+
+    async def adelete_message(
+        self, message_id: str, conversation_id: str
+    ) -> None:
+        try:
+            await self.db.adelete_message(message_id, conversation_id)
+        finally:
+            self._invalidate(conversation_id)
+
+    def delete_all_messages(self, conversation_id: str) -> None:
+        try:
+            self.db.delete_all_messages(conversation_id)
+        finally:
+            self._invalidate(conversation_id)
+
+    async def adelete_all_messages(self, conversation_id: str) -> None:
+        try:
+            await self.db.adelete_all_messages(conversation_id)
+        finally:
+            self._invalidate(conversation_id)
+
+    def delete_messages_after(
+        self, conversation_id: str, created_at: str
+    ) -> list[Message]:
+        try:
+            return self.db.delete_messages_after(conversation_id, created_at)
+        finally:
+            self._invalidate(conversation_id)
+
+    async def adelete_messages_after(
+        self, conversation_id: str, created_at: str
+    ) -> list[Message]:
+        try:
+            return await self.db.adelete_messages_after(
+                conversation_id, created_at
+            )
+        finally:
+            self._invalidate(conversation_id)
+
+    def delete_messages_until(
+        self, conversation_id: str, created_at: str
+    ) -> list[Message]:
+        try:
+            return self.db.delete_messages_until(conversation_id, created_at)
+        finally:
+            self._invalidate(conversation_id)
+
+    async def adelete_messages_until(
+        self, conversation_id: str, created_at: str
+    ) -> list[Message]:
+        try:
+            return await self.db.adelete_messages_until(
+                conversation_id, created_at
+            )
+        finally:
+            self._invalidate(conversation_id)
+
+    def keep_last_n(self, conversation_id: str, n_messages: int) -> None:
+        try:
+            self.db.keep_last_n(conversation_id, n_messages)
+        finally:
+            self._invalidate(conversation_id)
+
+    async def akeep_last_n(self, conversation_id: str, n_messages: int) -> None:
+        try:
+            await self.db.akeep_last_n(conversation_id, n_messages)
+        finally:
+            self._invalidate(conversation_id)
+
+    def upsert_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        try:
+            return self.db.upsert_messages(messages)
+        finally:
+            for conversation_id in _group(
+                [message.conversation_id for message in messages]
+            ):
+                self._invalidate(conversation_id)
+
+    async def aupsert_messages(
+        self, messages: list[Message]
+    ) -> list[Exception | None]:
+        try:
+            return await self.db.aupsert_messages(messages)
+        finally:
+            for conversation_id in _group(
+                [message.conversation_id for message in messages]
+            ):
+                self._invalidate(conversation_id)
+
+    # Passed through
+    def _create_conversation(self, conversation: Conversation) -> None:
+        self.db._create_conversation(conversation)
+
+    def _update_conversation(self, conversation: Conversation) -> None:
+        self.db._update_conversation(conversation)
+
+    def update_conversation_timestamp(
+        self, conversation_id: str, user_id: str
+    ) -> None:
+        self.db.update_conversation_timestamp(conversation_id, user_id)
+
+    def update_conversation_timestamps(
+        self, conversations: list[tuple[str, str]]
+    ) -> list[Exception | None]:
+        return self.db.update_conversation_timestamps(conversations)
+
+    def update_conversation_activity(
+        self, activities: list[ConversationActivity]
+    ) -> list[Exception | None]:
+        return self.db.update_conversation_activity(activities)
+
+    def delete_conversation(self, conversation_id: str, user_id: str) -> None:
+        self.db.delete_conversation(conversation_id, user_id)
+
+    def get_conversation(
+        self, conversation_id: str, user_id: str
+    ) -> Conversation | None:
+        return self.db.get_conversation(conversation_id, user_id)
+
+    def get_message(
+        self, message_id: str, conversation_id: str
+    ) -> Message | None:
+        return self.db.get_message(message_id, conversation_id)
+
+    def get_message_before(
+        self, conversation_id: str, created_at: str
+    ) -> Message | None:
+        return self.db.get_message_before(conversation_id, created_at)
+
+    def list_conversations(
+        self, user_id: str, order_by: OrderBy = "DESC"
+    ) -> list[Conversation]:
+        return self.db.list_conversations(user_id, order_by)
+
+    def list_conversations_page(
+        self,
+        user_id: str,
+        order_by: OrderBy = "DESC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        return self.db.list_conversations_page(user_id, order_by, limit, cursor)
+
+    def list_all_conversations_page(
+        self, limit: int = PAGE_DEFAULT_LIMIT, cursor: str | None = None
+    ) -> Page[Conversation]:
+        return self.db.list_all_conversations_page(limit, cursor)
+
+    def count_messages(self, conversation_id: str) -> int:
+        return self.db.count_messages(conversation_id)
+
+    def upsert_conversations(
+        self, conversations: list[Conversation]
+    ) -> list[Exception | None]:
+        return self.db.upsert_conversations(conversations)
+
+    async def acreate_conversation(
+        self, user_id: str, conversation_id: str | None = None
+    ) -> Conversation:
+        return await self.db.acreate_conversation(user_id, conversation_id)
+
+    async def aupdate_conversation_timestamp(
+        self, conversation_id: str, user_id: str
+    ) -> None:
+        await self.db.aupdate_conversation_timestamp(conversation_id, user_id)
+
+    async def aupdate_conversation_timestamps(
+        self, conversations: list[tuple[str, str]]
+    ) -> list[Exception | None]:
+        return await self.db.aupdate_conversation_timestamps(conversations)
+
+    async def aupdate_conversation_activity(
+        self, activities: list[ConversationActivity]
+    ) -> list[Exception | None]:
+        return await self.db.aupdate_conversation_activity(activities)
+
+    async def adelete_conversation(
+        self, conversation_id: str, user_id: str
+    ) -> None:
+        await self.db.adelete_conversation(conversation_id, user_id)
+
+    async def aget_conversation(
+        self, conversation_id: str, user_id: str
+    ) -> Conversation | None:
+        return await self.db.aget_conversation(conversation_id, user_id)
+
+    async def aget_message(
+        self, message_id: str, conversation_id: str
+    ) -> Message | None:
+        return await self.db.aget_message(message_id, conversation_id)
+
+    async def aget_message_before(
+        self, conversation_id: str, created_at: str
+    ) -> Message | None:
+        return await self.db.aget_message_before(conversation_id, created_at)
+
+    async def alist_conversations(
+        self, user_id: str, order_by: OrderBy = "DESC"
+    ) -> list[Conversation]:
+        return await self.db.alist_conversations(user_id, order_by)
+
+    async def alist_conversations_page(
+        self,
+        user_id: str,
+        order_by: OrderBy = "DESC",
+        limit: int = PAGE_DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> Page[Conversation]:
+        return await self.db.alist_conversations_page(
+            user_id, order_by, limit, cursor
+        )
+
+    async def alist_all_conversations_page(
+        self, limit: int = PAGE_DEFAULT_LIMIT, cursor: str | None = None
+    ) -> Page[Conversation]:
+        return await self.db.alist_all_conversations_page(limit, cursor)
+
+    async def acount_messages(self, conversation_id: str) -> int:
+        return await self.db.acount_messages(conversation_id)
+
+    async def aupsert_conversations(
+        self, conversations: list[Conversation]
+    ) -> list[Exception | None]:
+        return await self.db.aupsert_conversations(conversations)
+
+    async def aclose(self) -> None:
+        await self.db.aclose()
+
+
+class GCPNoSQLDB(ChatDB):
+    pass
+
+
+def get_chat_db(
+    endpoint: str, collection: str, cache: bool = True, **kwargs: Any
+) -> ChatDB:
+    db: ChatDB
+    if "azure.com" in endpoint:
+        db = AzureCosmosChatDB(
+            endpoint=endpoint,
+            collection=collection,
+            **kwargs,
+        )
+    elif endpoint.startswith("sqlite://"):
+        db = SqliteChatDB(
             endpoint=endpoint,
             collection=collection,
             **kwargs,
         )
     else:
-        return JsonChatDB(
+        db = JsonChatDB(
             endpoint=endpoint,
             collection=collection,
             **kwargs,
         )
+    if cache and CHAT_CACHE_SIZE_MB > 0:
+        db = CachedChatDB(db, name=collection)
+    return db
@@ -1,12 +1,85 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Any, Callable, NamedTuple
+from uuid import uuid4
 
 from langchain_core.embeddings.embeddings import Embeddings
+from pydantic import BaseModel
+
+from mcpbot.shared.config import (
+    VECTOR_UPSERT_BATCH_SIZE,
+    VECTOR_UPSERT_CONCURRENCY,
+)
+
+
+# Called with the number of documents written so far
+ProgressCallback = Callable[[int], None]
+
+
+class VectorDocument(BaseModel):
+    id: str
+    text: str
+    metadata: dict[str, Any]
+
+
+class SearchHit(BaseModel):
+    """A document found by a search and its distance to the question (the
+    lower, the closer), e.g. to drop the hits above a threshold.
+    """
+
+    text: str
+    distance: float
+
+
+def _batches(
+    documents: list[VectorDocument], batch_size: int
+) -> list[list[VectorDocument]]:
+    size = max(batch_size, 1)
+    return [documents[i : i + size] for i in range(0, len(documents), size)]
 
 
 class VectorDB(ABC):
-    @abstractmethod
+    def upsert_many(
+        self,
+        documents: list[VectorDocument],
+        batch_size: int = VECTOR_UPSERT_BATCH_SIZE,
+        concurrency: int = VECTOR_UPSERT_CONCURRENCY,
+        on_progress: ProgressCallback | None = None,
+    ) -> list[Exception | None]:
+        """Adds or replaces many documents, e.g. a whole knowledge base.
+
+        By default, the documents are upserted one by one. Backends override
+        it to embed `batch_size` documents per request and to write up to
+        `concurrency` documents at once.
+
+        Returns:
+            For each document, None if it was written or the error.
+        """
+        results: list[Exception | None] = []
+        for document in documents:
+            try:
+                self.upsert(document.id, document.text, document.metadata)
+            except Exception as error:
+                results.append(error)
+            else:
+                results.append(None)
+            if on_progress is not None:
+                on_progress(len(results))
+        return results
+
     def search(self, question: str, method: str, n_docs: int) -> list[str]:
+        """The texts of the `n_docs` documents closest to the question."""
+        return [hit.text for hit in self.search_hits(question, method, n_docs)]
+
+    @abstractmethod
+    def search_hits(
+        self, question: str, method: str, n_docs: int
+    ) -> list[SearchHit]:
+        """The `n_docs` documents closest to the question, closest first."""
         pass
 
     @abstractmethod
@@ -18,16 +91,55 @@ class VectorDB(ABC):
     ) -> None:
         pass
 
-    @abstractmethod
     def delete(self, id: str) -> None:
+        error = self.delete_many([id])[0]
+        if error is not None:
+            raise error
+
+    @abstractmethod
+    def delete_many(
+        self, ids: list[str], concurrency: int = VECTOR_UPSERT_CONCURRENCY
+    ) -> list[Exception | None]:
+        """Deletes many documents, e.g. the ones removed from the knowledge
+        base. Deleting a missing document is not an error.
+
+        Returns:
+            For each ID, None if it was deleted (or missing) or the error.
+        """
         pass
 
+    def get_by_id(
+        self, id: str, include_embeddings: bool = False
+    ) -> dict[str, Any]:
+        """The document (id, text and metadata), or {} if missing."""
+        return self.get_many([id], include_embeddings).get(id, {})
+
     @abstractmethod
-    def get_by_id(self, id: str) -> dict[str, Any]:
+    def get_many(
+        self,
+        ids: list[str],
+        include_embeddings: bool = False,
+        concurrency: int = VECTOR_UPSERT_CONCURRENCY,
+    ) -> dict[str, dict[str, Any]]:
+        """The documents of the IDs, e.g. to diff the knowledge base.
+
+        Args:
+            ids: The IDs of the documents.
+            include_embeddings: Whether to add the `embedding` of each
+                document, left out by default as it is the bulk of it.
+            concurrency: The maximum number of reads at once.
+
+        Returns:
+            Each document found (id, text and metadata) by its ID, the
+            missing ones are left out.
+        """
         pass
 
 
 class ChromaVectorDB(VectorDB):
+    # The IDs per get or delete call, below the SQLite variable limit
+    BATCH_SIZE = 5000
+
     def __init__(
         self,
         embeddings: Embeddings,
@@ -43,17 +155,16 @@ class ChromaVectorDB(VectorDB):
             collection_name=collection,
         )
 
-    def search(self, question: str, method: str, n_docs: int) -> list[str]:
-        method_map = {
-            "cosine": "similarity",
-            "euclidean": "similarity",
-        }
-        mapped_method = method_map[method]
+    def search_hits(
+        self, question: str, method: str, n_docs: int
+    ) -> list[SearchHit]:
+        # The distance function is the one of the collection (L2 by default)
+        if method not in ("cosine", "euclidean"):
+            raise ValueError(f"Unsupported search method: {method}")
         return [
-            doc.page_content
-            for doc in self.vector_store.search(
+            SearchHit(text=doc.page_content, distance=distance)
+            for doc, distance in self.vector_store.similarity_search_with_score(
                 query=question,
-                search_type=mapped_method,
                 k=n_docs,
             )
         ]
@@ -70,16 +181,72 @@ class ChromaVectorDB(VectorDB):
             metadatas=[metadata],
         )
 
-    def delete(self, id: str) -> None:
-        self.vector_store.delete(ids=[id])
-
-    def get_by_id(self, id: str) -> dict[str, Any]:
-        result = self.vector_store.get_by_ids([id])[0]
-        return {
-            "id": result.id,
-            "text": result.page_content,
-            "metadata": result.metadata,
-        }
+    def upsert_many(
+        self,
+        documents: list[VectorDocument],
+        batch_size: int = VECTOR_UPSERT_BATCH_SIZE,
+        concurrency: int = VECTOR_UPSERT_CONCURRENCY,
+        on_progress: ProgressCallback | None = None,
+    ) -> list[Exception | None]:
+        # Chroma embeds a batch with one request and writes it at once. Its
+        # writes are serialized, so the batches are written in order.
+        results: list[Exception | None] = []
+        for batch in _batches(documents, batch_size):
+            try:
+                self.vector_store.add_texts(
+                    ids=[document.id for document in batch],
+                    texts=[document.text for document in batch],
+                    metadatas=[document.metadata for document in batch],
+                )
+            except Exception as error:
+                results += [error] * len(batch)
+            else:
+                results += [None] * len(batch)
+            if on_progress is not None:
+                on_progress(len(results))
+        return results
+
+    def delete_many(
+        self, ids: list[str], concurrency: int = VECTOR_UPSERT_CONCURRENCY
+    ) -> list[Exception | None]:
+        # One call per batch, its writes are serialized anyway
+        results: list[Exception | None] = []
+        for start in range(0, len(ids), self.BATCH_SIZE):
+            batch = ids[start : start + self.BATCH_SIZE]
+            try:
+                self.vector_store.delete(ids=batch)
+            except Exception as error:
+                results += [error] * len(batch)
+            else:
+                results += [None] * len(batch)
+        return results
+
+    def get_many(
+        self,
+        ids: list[str],
+        include_embeddings: bool = False,
+        concurrency: int = VECTOR_UPSERT_CONCURRENCY,
+    ) -> dict[str, dict[str, Any]]:
+        include = ["documents", "metadatas"]
+        if include_embeddings:
+            include.append("embeddings")
+        documents: dict[str, dict[str, Any]] = dict()
+        for start in range(0, len(ids), self.BATCH_SIZE):
+            result = self.vector_store.get(
+                ids=ids[start : start + self.BATCH_SIZE], include=include
+            )
+            for i, id in enumerate(result["ids"]):
+                document = {
+                    "id": id,
+                    "text": result["documents"][i],
+                    "metadata": result["metadatas"][i] or {},
+                }
+                if include_embeddings:
+                    document["embedding"] = list(
+                        map(float, result["embeddings"][i])
+                    )
+                documents[id] = document
+        return documents
 
     def search_ids(self, question: str, method: str, n_docs: int) -> list[str]:
         """Only used for evaluation purposes locally (recall, precision, F1)"""
@@ -98,6 +265,29 @@ class ChromaVectorDB(VectorDB):
         ]
 
 
+# The Cosmos DB query of each distance function, with the vector and the
+# number of documents as parameters, so its plan is cached. The options of
+# VectorDistance must be a constant, hence one query per function.
+COSMOS_SEARCH_QUERIES = {
+    method: (
+        "SELECT TOP @n_docs c.text, "
+        "VectorDistance(c.embedding, @embedding, true, {options}) AS score "
+        "FROM c "
+        "ORDER BY VectorDistance(c.embedding, @embedding, true, {options})"
+    ).format(
+        options=f"{{'dataType': 'float32', 'distanceFunction': '{method}'}}"
+    )
+    for method in ("cosine", "euclidean", "dotproduct")
+}
+# The distance of each Cosmos DB score (cosine and dot product are
+# similarities, the higher the closer)
+COSMOS_SCORE_DISTANCES: dict[str, Callable[[float], float]] = {
+    "cosine": lambda score: 1 - score,
+    "euclidean": lambda score: score,
+    "dotproduct": lambda score: -score,
+}
+
+
 class AzureCosmosVectorDB(VectorDB):
     def __init__(
         self,
@@ -108,6 +298,7 @@ class AzureCosmosVectorDB(VectorDB):
         api_key: str,
     ) -> None:
         from azure.cosmos import CosmosClient
+        from azure.cosmos.exceptions import CosmosResourceNotFoundError
 
         self.vector_store = (
             CosmosClient(endpoint, api_key)
@@ -115,19 +306,30 @@ class AzureCosmosVectorDB(VectorDB):
             .get_container_client(collection)
         )
         self.embeddings = embeddings
+        self.not_found_error = CosmosResourceNotFoundError
 
-    def search(self, question: str, method: str, n_docs: int) -> list[str]:
-        query_vector = self.embeddings.embed_query(question)
-        query = (
-            "SELECT TOP {n_docs} c.text "
-            "FROM c "
-            "ORDER BY VectorDistance(c.embedding, {query_vector}, true, {{'dataType': 'float32', 'distanceFunction': '{method}'}})"
-        ).format(n_docs=n_docs, method=method, query_vector=query_vector)
+    def search_hits(
+        self, question: str, method: str, n_docs: int
+    ) -> list[SearchHit]:
+        query = COSMOS_SEARCH_QUERIES.get(method)
+        if query is None:
+            raise ValueError(f"Unsupported search method: {method}")
         response = self.vector_store.query_items(
             query=query,
+            parameters=[
+                {"name": "@n_docs", "value": int(n_docs)},
+                {
+                    "name": "@embedding",
+                    "value": self.embeddings.embed_query(question),
+                },
+            ],
             enable_cross_partition_query=True,
         )
-        return [item["text"] for item in response]
+        distance = COSMOS_SCORE_DISTANCES[method]
+        return [
+            SearchHit(text=item["text"], distance=distance(item["score"]))
+            for item in response
+        ]
 
     def upsert(
         self,
@@ -143,25 +345,381 @@ class AzureCosmosVectorDB(VectorDB):
         }
         self.vector_store.upsert_item(data)
 
-    def delete(self, id: str) -> None:
-        self.vector_store.query_items(
-            query=f"SELECT c.id FROM c WHERE c.id = '{id}'",
-            enable_cross_partition_query=True,
-        )
-        self.vector_store.delete_item(id, partition_key=id)
+    def upsert_many(
+        self,
+        documents: list[VectorDocument],
+        batch_size: int = VECTOR_UPSERT_BATCH_SIZE,
+        concurrency: int = VECTOR_UPSERT_CONCURRENCY,
+        on_progress: ProgressCallback | None = None,
+    ) -> list[Exception | None]:
+        # A batch is embedded with one request, then its items are written by
+        # the pool while the next batch is embedded
+        results: list[Exception | None] = [None] * len(documents)
+        # The writes of the previous batch, or the error of its embedding
+        in_flight: list[tuple[int, Future[Exception | None] | Exception]] = []
+        n_done = 0
 
-    def get_by_id(self, id: str) -> dict[str, Any]:
-        response = self.vector_store.query_items(
-            query=f"SELECT * FROM c WHERE c.id = '{id}'",
-            enable_cross_partition_query=True,
-        )
-        for item in response:
-            return {
+        def collect() -> None:
+            nonlocal n_done
+            for index, write in in_flight:
+                results[index] = (
+                    write if isinstance(write, Exception) else write.result()
+                )
+            n_done += len(in_flight)
+            if in_flight and on_progress is not None:
+                on_progress(n_done)
+            in_flight.clear()
+
+        with ThreadPoolExecutor(
+            max_workers=max(concurrency, 1), thread_name_prefix="vector-db"
+        ) as pool:
+            start = 0
+            for batch in _batches(documents, batch_size):
+                try:
+                    embeddings = self.embeddings.embed_documents(
+                        [document.text for document in batch]
+                    )
+                except Exception as error:
+                    collect()
+                    in_flight += [(start + i, error) for i in range(len(batch))]
+                else:
+                    collect()
+                    for i, (document, embedding) in enumerate(
+                        zip(batch, embeddings), start
+                    ):
+                        item = {
+                            "id": document.id,
+                            "text": document.text,
+                            "embedding": embedding,
+                            "metadata": document.metadata,
+                        }
+                        in_flight.append((i, pool.submit(self._write, item)))
+                start += len(batch)
+            collect()
+        return results
+
+    def _write(self, item: dict[str, Any]) -> Exception | None:
+        try:
+            self.vector_store.upsert_item(item)
+        except Exception as error:
+            return error
+        return None
+
+    # The ID is the partition key: every document is read and deleted with a
+    # point operation, on its own partition, so they run concurrently (a
+    # transactional batch cannot span partitions).
+    def delete_many(
+        self, ids: list[str], concurrency: int = VECTOR_UPSERT_CONCURRENCY
+    ) -> list[Exception | None]:
+        with ThreadPoolExecutor(
+            max_workers=max(concurrency, 1), thread_name_prefix="vector-db"
+        ) as pool:
+            return list(pool.map(self._delete, ids))
+
+    def _delete(self, id: str) -> Exception | None:
+        try:
+            self.vector_store.delete_item(id, partition_key=id)
+        except self.not_found_error:
+            return None
+        except Exception as error:
+            return error
+        return None
+
+    def get_many(
+        self,
+        ids: list[str],
+        include_embeddings: bool = False,
+        concurrency: int = VECTOR_UPSERT_CONCURRENCY,
+    ) -> dict[str, dict[str, Any]]:
+        with ThreadPoolExecutor(
+            max_workers=max(concurrency, 1), thread_name_prefix="vector-db"
+        ) as pool:
+            items = list(pool.map(self._read, dict.fromkeys(ids)))
+        documents: dict[str, dict[str, Any]] = dict()
+        for item in items:
+            if item is None:
+                continue
+            document = {
                 "id": item["id"],
                 "text": item["text"],
                 "metadata": item["metadata"],
             }
-        return {}
+            if include_embeddings:
+                document["embedding"] = item["embedding"]
+            documents[item["id"]] = document
+        return documents
+
+    def _read(self, id: str) -> dict[str, Any] | None:
+        try:
+            item: dict[str, Any] = self.vector_store.read_item(
+                id, partition_key=id
+            )
+        except self.not_found_error:
+            return None
+        return item
+
+
+class _NumpyIndex(NamedTuple):
+    """A version of the index: the memory-mapped embeddings (one row per
+    document), their norms and the documents, in the order of the rows.
+    """
+
+    embeddings: Any  # np.ndarray (float32, memory-mapped)
+    norms: Any  # np.ndarray (float32)
+    documents: list[VectorDocument]
+    rows: dict[str, int]  # The row of each document ID
+    version: str
+
+
+class NumpyVectorDB(VectorDB):
+    """Local vector database, an exact search over a float32 matrix.
+
+    The endpoint is `numpy:///<directory>`, every collection is stored in
+    its own directory: per version, the embeddings in a `.npy` file,
+    memory-mapped so the workers of a host share one copy of the pages, and
+    the documents in a `.json` file. A search is a matrix-vector product and
+    a partial sort (top-k with `argpartition`).
+
+    A write stores a new version and then replaces the manifest, which names
+    the current version, atomically. Each read compares the version of the
+    manifest (a few bytes) to the mapped one, so a worker maps the new
+    version on its next read, whatever the precision of the file timestamps.
+    It is meant for FAQ-scale collections (up to ~100k documents), as each
+    write rewrites the collection, written by one process at a time (e.g.
+    the ingestion script).
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        collection: str,
+        endpoint: str,
+        **kwargs: Any,
+    ) -> None:
+        import numpy as np
+
+        self.np = np
+        self.embeddings = embeddings
+        self.path = Path(endpoint.removeprefix("numpy:///")) / collection
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._index: _NumpyIndex | None = None
+        self._lock = threading.Lock()
+
+    def search_hits(
+        self, question: str, method: str, n_docs: int
+    ) -> list[SearchHit]:
+        index = self._load()
+        if not index.documents or n_docs <= 0:
+            return []
+        np = self.np
+        query = np.asarray(self.embeddings.embed_query(question), np.float32)
+        products = index.embeddings @ query
+        if method == "cosine":
+            norms = index.norms * (np.linalg.norm(query) or 1.0)
+            distances = np.maximum(
+                1 - products / np.where(norms == 0, 1.0, norms), 0
+            )
+        elif method == "euclidean":
+            squared = index.norms**2 - 2 * products + query @ query
+            distances = np.sqrt(np.maximum(squared, 0))
+        else:
+            raise ValueError(f"Unsupported search method: {method}")
+
+        k = min(n_docs, len(index.documents))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [
+            SearchHit(
+                text=index.documents[row].text, distance=float(distances[row])
+            )
+            for row in top
+        ]
+
+    def upsert(
+        self,
+        id: str,
+        text: str,
+        metadata: dict[str, Any],
+    ) -> None:
+        self.upsert_many([VectorDocument(id=id, text=text, metadata=metadata)])
+
+    def upsert_many(
+        self,
+        documents: list[VectorDocument],
+        batch_size: int = VECTOR_UPSERT_BATCH_SIZE,
+        concurrency: int = VECTOR_UPSERT_CONCURRENCY,
+        on_progress: ProgressCallback | None = None,
+    ) -> list[Exception | None]:
+        # The batches are embedded first, then the collection is written once
+        results: list[Exception | None] = [None] * len(documents)
+        vectors: dict[str, tuple[VectorDocument, list[float]]] = dict()
+        start = 0
+        for batch in _batches(documents, batch_size):
+            try:
+                embeddings = self.embeddings.embed_documents(
+                    [document.text for document in batch]
+                )
+            except Exception as error:
+                results[start : start + len(batch)] = [error] * len(batch)
+            else:
+                for document, embedding in zip(batch, embeddings):
+                    vectors[document.id] = (document, embedding)
+            start += len(batch)
+
+        try:
+            with self._lock:
+                index = self._load()
+                new_documents = list(index.documents)
+                matrix = self.np.array(index.embeddings, dtype=self.np.float32)
+                appended = []
+                for document, embedding in vectors.values():
+                    row = index.rows.get(document.id)
+                    if row is None:
+                        new_documents.append(document)
+                        appended.append(embedding)
+                    else:
+                        new_documents[row] = document
+                        matrix[row] = embedding
+                if appended:
+                    matrix = self._stack(
+                        matrix, self.np.asarray(appended, self.np.float32)
+                    )
+                self._store(matrix, new_documents, index.version)
+        except Exception as error:
+            results = [result or error for result in results]
+
+        if on_progress is not None:
+            on_progress(len(documents))
+        return results
+
+    def delete_many(
+        self, ids: list[str], concurrency: int = VECTOR_UPSERT_CONCURRENCY
+    ) -> list[Exception | None]:
+        # The collection is written once, without the rows of the IDs
+        try:
+            with self._lock:
+                index = self._load()
+                rows = sorted(
+                    {index.rows[id] for id in ids if id in index.rows}
+                )
+                if rows:
+                    removed = set(rows)
+                    self._store(
+                        self.np.delete(index.embeddings, rows, axis=0),
+                        [
+                            document
+                            for row, document in enumerate(index.documents)
+                            if row not in removed
+                        ],
+                        index.version,
+                    )
+        except Exception as error:
+            return [error] * len(ids)
+        return [None] * len(ids)
+
+    def get_many(
+        self,
+        ids: list[str],
+        include_embeddings: bool = False,
+        concurrency: int = VECTOR_UPSERT_CONCURRENCY,
+    ) -> dict[str, dict[str, Any]]:
+        index = self._load()
+        documents: dict[str, dict[str, Any]] = dict()
+        for id in ids:
+            row = index.rows.get(id)
+            if row is None:
+                continue
+            document = index.documents[row].model_dump()
+            if include_embeddings:
+                document["embedding"] = index.embeddings[row].tolist()
+            documents[id] = document
+        return documents
+
+    # Storage
+    def _stack(self, matrix: Any, rows: Any) -> Any:
+        if matrix.size == 0:
+            return rows
+        return self.np.vstack([matrix, rows])
+
+    def _load(self) -> _NumpyIndex:
+        """The current version of the index, mapped again if another
+        process (or thread) wrote a new one.
+        """
+        try:
+            manifest = json.loads(
+                (self.path / self.MANIFEST).read_text(encoding="utf-8")
+            )
+        except FileNotFoundError:
+            manifest = {"version": ""}
+        version = manifest["version"]
+        index = self._index
+        if index is not None and index.version == version:
+            return index
+
+        if not version:
+            index = _NumpyIndex(
+                embeddings=self.np.empty((0, 0), self.np.float32),
+                norms=self.np.empty(0, self.np.float32),
+                documents=[],
+                rows=dict(),
+                version="",
+            )
+        else:
+            try:
+                documents = [
+                    VectorDocument(**document)
+                    for document in json.loads(
+                        (self.path / f"{version}.json").read_text(
+                            encoding="utf-8"
+                        )
+                    )
+                ]
+                embeddings = self.np.load(
+                    self.path / f"{version}.npy", mmap_mode="r"
+                )
+            except FileNotFoundError:
+                # Replaced by a newer version since the manifest was read
+                return self._load()
+            index = _NumpyIndex(
+                embeddings=embeddings,
+                norms=self.np.linalg.norm(embeddings, axis=1).astype(
+                    self.np.float32
+                ),
+                documents=documents,
+                rows={
+                    document.id: row for row, document in enumerate(documents)
+                },
+                version=version,
+            )
+        self._index = index
+        return index
+
+    def _store(
+        self, matrix: Any, documents: list[VectorDocument], previous: str
+    ) -> None:
+        """Writes a new version of the index (the matrix and the documents),
+        then the manifest that points to it (atomically), then removes the
+        `previous` version, the one the write was based on.
+        """
+        version = uuid4().hex
+        self.np.save(
+            self.path / f"{version}.npy",
+            self.np.ascontiguousarray(matrix, dtype=self.np.float32),
+        )
+        (self.path / f"{version}.json").write_text(
+            json.dumps([document.model_dump() for document in documents]),
+            encoding="utf-8",
+        )
+        temp_path = self.path / f"{self.MANIFEST}.tmp"
+        temp_path.write_text(json.dumps({"version": version}), encoding="utf-8")
+        os.replace(temp_path, self.path / self.MANIFEST)
+        # The readers that mapped it keep their pages until they remap
+        if previous:
+            (self.path / f"{previous}.npy").unlink(missing_ok=True)
+            (self.path / f"{previous}.json").unlink(missing_ok=True)
+        self._index = None
 
 
 class GCPVectorDB(VectorDB):
@@ -181,6 +739,13 @@ def get_vector_db(
             endpoint=endpoint,
             **kwargs,
         )
+    elif endpoint.startswith("numpy://"):
+        return NumpyVectorDB(
+            embeddings=embeddings,
+            collection=collection,
+            endpoint=endpoint,
+            **kwargs,
+        )
     else:
         return ChromaVectorDB(
             embeddings=embeddings,
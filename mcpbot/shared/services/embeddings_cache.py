@@ -0,0 +1,172 @@
+from array import array
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Any
+
+from langchain_core.embeddings import Embeddings
+
+from mcpbot.shared.config import EMBEDDINGS_CACHE_PATH, EMBEDDINGS_CACHE_SIZE
+from mcpbot.shared.utils import register_metrics
+
+
+def normalize_text(text: str) -> str:
+    """The text as a cache key: case and whitespace do not matter."""
+    return " ".join(text.split()).casefold()
+
+
+class _DiskTier:
+    """The embeddings stored in SQLite, as float32 blobs, so they survive
+    restarts and are shared by the workers of a host.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS embeddings (
+        key TEXT PRIMARY KEY,
+        vector BLOB NOT NULL
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> list[float] | None:
+        row = (
+            self._connection()
+            .execute("SELECT vector FROM embeddings WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return array("f", row[0]).tolist() if row else None
+
+    def put(self, key: str, vector: list[float]) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            (key, array("f", vector).tobytes()),
+        )
+
+
+class CachedEmbeddings(Embeddings):
+    """Caches the query embeddings of a model, by the normalized text.
+
+    The embeddings are looked up in an in-memory LRU of `max_size` entries,
+    then, if `path` is set, in a SQLite file. The queries missing from both
+    are embedded by the model and stored in both tiers.
+
+    The documents are embedded as they are, without the cache: an ingestion
+    would evict the queries, and documents differing by case are distinct.
+
+    Args:
+        embeddings: The cached embeddings.
+        model: The name of the model, part of the key, so a new model never
+            gets the vectors of the previous one.
+        max_size: The maximum number of entries in memory.
+        path: The SQLite file of the disk tier, or None for memory only.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str,
+        max_size: int = EMBEDDINGS_CACHE_SIZE,
+        path: str | None = EMBEDDINGS_CACHE_PATH or None,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model = model
+        self.max_size = max_size
+        self.disk = _DiskTier(path) if path else None
+        self._entries: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ["memory_hits", "disk_hits", "misses", "evicted"], 0
+        )
+        register_metrics("embeddings_cache", self.metrics)
+
+    def metrics(self) -> dict[str, Any]:
+        hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+        lookups = hits + self._counters["misses"]
+        return {
+            **self._counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+    def embed_query(self, text: str) -> list[float]:
+        key = self._key(text)
+        vector = self._lookup(key)
+        if vector is None and self.disk is not None:
+            vector = self._found_on_disk(key, self.disk.get(key))
+        if vector is None:
+            vector = self._embedded(key, self.embeddings.embed_query(text))
+            if self.disk is not None:
+                self.disk.put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        key = self._key(text)
+        vector = self._lookup(key)
+        if vector is None and self.disk is not None:
+            vector = self._found_on_disk(
+                key, await asyncio.to_thread(self.disk.get, key)
+            )
+        if vector is None:
+            vector = self._embedded(
+                key, await self.embeddings.aembed_query(text)
+            )
+            if self.disk is not None:
+                await asyncio.to_thread(self.disk.put, key, vector)
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def _key(self, text: str) -> str:
+        return f"{self.model}\n{normalize_text(text)}"
+
+    def _lookup(self, key: str) -> list[float] | None:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self._counters["memory_hits"] += 1
+        return vector
+
+    def _found_on_disk(
+        self, key: str, vector: list[float] | None
+    ) -> list[float] | None:
+        if vector is not None:
+            with self._lock:
+                self._counters["disk_hits"] += 1
+                self._store(key, vector)
+        return vector
+
+    def _embedded(self, key: str, vector: list[float]) -> list[float]:
+        with self._lock:
+            self._counters["misses"] += 1
+            self._store(key, vector)
+        return vector
+
+    def _store(self, key: str, vector: list[float]) -> None:
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._counters["evicted"] += 1
@@ -1,10 +1,15 @@
+from .append_log import AppendLog
 from .metaclasses import ArbitaryTypesModel, Singleton
+from .metrics import collect_metrics, register_metrics
 from .read_files import read_file, write_file
 
 
 __all__ = [
+    "AppendLog",
     "ArbitaryTypesModel",
     "Singleton",
+    "collect_metrics",
     "read_file",
+    "register_metrics",
     "write_file",
 ]
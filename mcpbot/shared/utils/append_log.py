@@ -0,0 +1,461 @@
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Any, Iterator
+
+
+try:
+    import fcntl
+
+    HAS_FCNTL = True
+except ImportError:  # Windows
+    HAS_FCNTL = False
+
+# The (inode, size, mtime) of a segment file, None if it does not exist
+_FileStat = tuple[int, int, int] | None
+
+
+class _Segment:
+    """The in-memory index of a segment: the offsets of its live records."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        # The (sort key, ID) of the live records, sorted
+        self.order: list[tuple[str, str]] = []
+        # The (offset, length, sort key) of the live records, by ID
+        self.positions: dict[str, tuple[int, int, str]] = dict()
+        self.size = 0  # Bytes, the offset of the next record
+        self.dead = 0  # Lines of overwritten records and tombstones
+        # The file the index was built from (or last written to)
+        self.stat: _FileStat = None
+
+    def add(self, id: str, sort_key: str, offset: int, length: int) -> None:
+        self.remove(id)
+        self.positions[id] = (offset, length, sort_key)
+        insort(self.order, (sort_key, id))
+
+    def remove(self, id: str) -> bool:
+        position = self.positions.pop(id, None)
+        if position is None:
+            return False
+        self.order.remove((position[2], id))
+        self.dead += 1
+        return True
+
+
+class AppendLog:
+    """Append-only storage of JSON records, one segment per key.
+
+    A segment is a JSONL file. Every write appends a line to it: the new
+    version of a record or, on a delete, a tombstone. An in-memory index per
+    segment keeps the offsets of the live records, sorted by `sort_field`, so
+    listing the records is one sequential read of the segment, the newest
+    records are a tail read, a page of records is a key-based range read and
+    a single record is a seek. The index is built from the segment on first
+    access.
+
+    When most lines of a segment are dead (overwritten or deleted records),
+    the segment is compacted: it is rewritten with only its live records.
+
+    Several processes (e.g. the workers of a server, a migration script) can
+    share a directory: the reads hold a shared lock of the directory and the
+    writes an exclusive one (`flock`), and an index is rebuilt when its
+    segment was changed by another process (inode, size or mtime). Without
+    `fcntl` (Windows), a directory must only be used by one process.
+
+    Args:
+        path: The directory of the segments.
+        sort_field: The field of the records to sort them by.
+        compact_min_dead: The minimum number of dead lines before compacting.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        sort_field: str = "created_at",
+        compact_min_dead: int = 64,
+    ) -> None:
+        self.path = Path(path)
+        self.sort_field = sort_field
+        self.compact_min_dead = compact_min_dead
+        self._segments: dict[str, _Segment] = dict()
+        self._lock = threading.RLock()
+        self._lock_file: Any = None
+        self._lock_depth = 0
+
+    def put(self, key: str, id: str, record: dict[str, Any]) -> None:
+        """Adds or replaces a record."""
+        sort_key = str(record.get(self.sort_field, ""))
+        line = {"id": id, "sort_key": sort_key, "record": record}
+        with self._locked(exclusive=True):
+            segment = self._segment(key)
+            offset, length = self._append(segment, line)
+            segment.add(id, sort_key, offset, length)
+            self._maybe_compact(segment)
+
+    def put_many(
+        self, key: str, records: list[tuple[str, dict[str, Any]]]
+    ) -> None:
+        """Adds or replaces records, given as (ID, record), with one write."""
+        if not records:
+            return
+        entries = [
+            (id, str(record.get(self.sort_field, "")), record)
+            for id, record in records
+        ]
+        lines = [
+            {"id": id, "sort_key": sort_key, "record": record}
+            for id, sort_key, record in entries
+        ]
+        with self._locked(exclusive=True):
+            segment = self._segment(key)
+            positions = self._append_many(segment, lines)
+            for (id, sort_key, _), (offset, length) in zip(entries, positions):
+                segment.add(id, sort_key, offset, length)
+            self._maybe_compact(segment)
+
+    def delete(self, key: str, id: str) -> None:
+        """Deletes a record by writing a tombstone."""
+        with self._locked(exclusive=True):
+            segment = self._segment(key)
+            if not segment.remove(id):
+                return
+            self._append(segment, {"id": id, "deleted": True})
+            segment.dead += 1
+            self._maybe_compact(segment)
+
+    def delete_range(
+        self,
+        key: str,
+        start: str | None = None,
+        end: str | None = None,
+    ) -> int:
+        """Deletes the records with a sort key in [`start`, `end`) (None is
+        unbounded), with one write of their tombstones.
+
+        Returns:
+            The number of deleted records.
+        """
+        with self._locked(exclusive=True):
+            segment = self._segment(key)
+            return self._delete(segment, *self._bounds(segment, start, end))
+
+    def pop_range(
+        self,
+        key: str,
+        start: str | None = None,
+        end: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """Like `delete_range`, but returns the deleted records, sorted by
+        `sort_field`.
+        """
+        with self._locked(exclusive=True):
+            segment = self._segment(key)
+            first, last = self._bounds(segment, start, end)
+            records = self._read(
+                segment,
+                [segment.positions[id] for _, id in segment.order[first:last]],
+            )
+            self._delete(segment, first, last)
+            return records
+
+    def trim(self, key: str, n_records: int) -> int:
+        """Deletes all records of a key but the last `n_records`, with one
+        write of their tombstones.
+
+        Returns:
+            The number of deleted records.
+        """
+        with self._locked(exclusive=True):
+            segment = self._segment(key)
+            n_deleted = max(len(segment.order) - max(n_records, 0), 0)
+            return self._delete(segment, 0, n_deleted)
+
+    def drop(self, key: str) -> None:
+        """Deletes all records of a key."""
+        with self._locked(exclusive=True):
+            self._segments.pop(key, None)
+            self._file(key).unlink(missing_ok=True)
+
+    def keys(self) -> list[str]:
+        """Lists the keys with a segment, sorted."""
+        with self._locked():
+            return sorted(path.stem for path in self.path.glob("*.jsonl"))
+
+    def count(self, key: str) -> int:
+        """Counts the live records of a key."""
+        with self._locked():
+            return len(self._segment(key).order)
+
+    def get(self, key: str, id: str) -> dict[str, Any] | None:
+        with self._locked():
+            segment = self._segment(key)
+            position = segment.positions.get(id)
+            if position is None:
+                return None
+            return self._read(segment, [position])[0]
+
+    def items(self, key: str, reverse: bool = False) -> list[dict[str, Any]]:
+        """Lists the records of a key, sorted by `sort_field`."""
+        return self.tail(key, None, reverse)
+
+    def tail(
+        self,
+        key: str,
+        n_records: int | None,
+        reverse: bool = False,
+    ) -> list[dict[str, Any]]:
+        """Lists the last `n_records` records of a key (all if None), sorted
+        by `sort_field`.
+        """
+        with self._locked():
+            segment = self._segment(key)
+            order = segment.order
+            if n_records is not None:
+                order = order[-n_records:] if n_records > 0 else []
+            records = self._read(
+                segment, [segment.positions[id] for _, id in order]
+            )
+        if reverse:
+            records.reverse()
+        return records
+
+    def range(
+        self,
+        key: str,
+        after: tuple[str, str] | None,
+        n_records: int,
+        reverse: bool = False,
+    ) -> list[dict[str, Any]]:
+        """Lists up to `n_records` records of a key, sorted by `sort_field`,
+        that come after the (sort key, ID) `after` (from the start if None).
+
+        If reverse, the records are listed from the end, and the ones before
+        `after` are returned.
+        """
+        with self._locked():
+            segment = self._segment(key)
+            order = segment.order
+            if not reverse:
+                start = bisect_right(order, after) if after else 0
+                selected = order[start : start + max(n_records, 0)]
+            else:
+                end = bisect_left(order, after) if after else len(order)
+                selected = order[max(end - max(n_records, 0), 0) : end]
+            records = self._read(
+                segment, [segment.positions[id] for _, id in selected]
+            )
+        if reverse:
+            records.reverse()
+        return records
+
+    def import_legacy(self) -> int:
+        """Imports the records of the legacy layout, a directory per key with
+        a JSON file per record (named by its ID), into the segments.
+
+        The imported directories are moved to `.legacy`, so the records are
+        imported only once, and kept until they are deleted by hand.
+
+        Returns:
+            The number of imported records.
+        """
+        if not self.path.is_dir():
+            return 0
+        n_records = 0
+        with self._locked(exclusive=True):
+            for directory in sorted(self.path.iterdir()):
+                if not directory.is_dir() or directory.name.startswith("."):
+                    continue
+                files = sorted(directory.glob("*.json"))
+                if not files:
+                    continue
+                self.put_many(
+                    directory.name,
+                    [
+                        (file.stem, json.loads(file.read_bytes()))
+                        for file in files
+                    ],
+                )
+                imported = self.path / ".legacy" / directory.name
+                imported.parent.mkdir(exist_ok=True)
+                directory.rename(imported)
+                n_records += len(files)
+        return n_records
+
+    def compact(self, key: str) -> None:
+        """Rewrites the segment of a key with only its live records."""
+        with self._locked(exclusive=True):
+            self._compact(self._segment(key))
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False) -> Iterator[None]:
+        """Holds the lock of the threads, then the lock of the directory,
+        shared by the processes: shared to read, exclusive to write.
+        """
+        with self._lock:
+            if self._lock_depth or not HAS_FCNTL:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            if self._lock_file is None:
+                self.path.mkdir(parents=True, exist_ok=True)
+                self._lock_file = open(self.path / ".lock", "a+b")
+            mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            fcntl.flock(self._lock_file, mode)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.jsonl"
+
+    @staticmethod
+    def _stat(path: Path) -> _FileStat:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _segment(self, key: str) -> _Segment:
+        """The index of a segment, rebuilt if another process changed it."""
+        path = self._file(key)
+        segment = self._segments.get(key)
+        if segment is None or segment.stat != self._stat(path):
+            segment = self._load(path)
+            self._segments[key] = segment
+        return segment
+
+    def _load(self, path: Path) -> _Segment:
+        """Builds the index of a segment by replaying its lines."""
+        segment = _Segment(path)
+        if not path.exists():
+            return segment
+
+        data = path.read_bytes()
+        # A partially written last line (e.g. after a crash) is dropped
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(path, "r+b") as file:
+                file.truncate(end)
+
+        offset = 0
+        for raw_line in data[:end].splitlines(keepends=True):
+            line = json.loads(raw_line)
+            if line.get("deleted"):
+                segment.remove(line["id"])
+                segment.dead += 1
+            else:
+                segment.add(line["id"], line["sort_key"], offset, len(raw_line))
+            offset += len(raw_line)
+        segment.size = offset
+        segment.stat = self._stat(path)
+        return segment
+
+    def _append(
+        self,
+        segment: _Segment,
+        line: dict[str, Any],
+    ) -> tuple[int, int]:
+        return self._append_many(segment, [line])[0]
+
+    def _append_many(
+        self,
+        segment: _Segment,
+        lines: list[dict[str, Any]],
+    ) -> list[tuple[int, int]]:
+        """Appends lines with one write. Returns their (offset, length)."""
+        encoded = [
+            (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+            for line in lines
+        ]
+        segment.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(segment.path, "ab") as file:
+            file.write(b"".join(encoded))
+        segment.stat = self._stat(segment.path)
+        positions = []
+        for data in encoded:
+            positions.append((segment.size, len(data)))
+            segment.size += len(data)
+        return positions
+
+    def _read(
+        self,
+        segment: _Segment,
+        positions: list[tuple[int, int, str]],
+    ) -> list[dict[str, Any]]:
+        """Reads records with one read, from the first to the last offset."""
+        if not positions:
+            return []
+        start = min(offset for offset, _, _ in positions)
+        end = max(offset + length for offset, length, _ in positions)
+        with open(segment.path, "rb") as file:
+            file.seek(start)
+            data = file.read(end - start)
+        return [
+            json.loads(data[offset - start : offset - start + length])["record"]
+            for offset, length, _ in positions
+        ]
+
+    @staticmethod
+    def _bounds(
+        segment: _Segment, start: str | None, end: str | None
+    ) -> tuple[int, int]:
+        """The slice of the index with a sort key in [`start`, `end`)."""
+        order = segment.order
+        first = bisect_left(order, (start, "")) if start is not None else 0
+        last = bisect_left(order, (end, "")) if end is not None else len(order)
+        return first, last
+
+    def _delete(self, segment: _Segment, first: int, last: int) -> int:
+        """Deletes the records of a slice of the index, in one write."""
+        ids = [id for _, id in segment.order[first:last]]
+        if not ids:
+            return 0
+        self._append_many(segment, [{"id": id, "deleted": True} for id in ids])
+        del segment.order[first:last]
+        for id in ids:
+            del segment.positions[id]
+        # The deleted records and their tombstones
+        segment.dead += 2 * len(ids)
+        self._maybe_compact(segment)
+        return len(ids)
+
+    def _maybe_compact(self, segment: _Segment) -> None:
+        n_live = len(segment.positions)
+        if segment.dead >= self.compact_min_dead and segment.dead > n_live:
+            self._compact(segment)
+
+    def _compact(self, segment: _Segment) -> None:
+        if not segment.dead:
+            return
+        records = self._read(
+            segment, [segment.positions[id] for _, id in segment.order]
+        )
+        temp_path = segment.path.with_suffix(".jsonl.tmp")
+        compacted = _Segment(segment.path)
+        with open(temp_path, "wb") as file:
+            for (sort_key, id), record in zip(segment.order, records):
+                line = {"id": id, "sort_key": sort_key, "record": record}
+                data = (json.dumps(line, ensure_ascii=False) + "\n").encode(
+                    "utf-8"
+                )
+                file.write(data)
+                compacted.add(id, sort_key, compacted.size, len(data))
+                compacted.size += len(data)
+        os.replace(temp_path, segment.path)
+        segment.order = compacted.order
+        segment.positions = compacted.positions
+        segment.size = compacted.size
+        segment.dead = 0
+        segment.stat = self._stat(segment.path)
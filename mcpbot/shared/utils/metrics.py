@@ -0,0 +1,17 @@
+from typing import Any, Callable
+
+
+MetricsCollector = Callable[[], dict[str, Any]]
+
+# Collectors of the in-process metrics, by component name
+_COLLECTORS: dict[str, MetricsCollector] = dict()
+
+
+def register_metrics(name: str, collector: MetricsCollector) -> None:
+    """Registers a function that returns the metrics of a component."""
+    _COLLECTORS[name] = collector
+
+
+def collect_metrics() -> dict[str, dict[str, Any]]:
+    """Returns the current metrics of all registered components."""
+    return {name: collector() for name, collector in _COLLECTORS.items()}
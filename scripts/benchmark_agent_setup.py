@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from langgraph.prebuilt import create_react_agent
+
+from mcpbot.client.agent import get_agent
+from mcpbot.server.main import mcp
+from mcpbot.server.prompts import client_prompt
+from mcpbot.server.transport import load_local_tools
+from mcpbot.shared.init import config
+
+
+ITERATIONS = 200
+
+
+async def setup_per_message() -> None:
+    """Setup as it was done before: the agent is built on every message."""
+    create_react_agent(
+        model=config.models.llm,
+        tools=await load_local_tools(mcp),
+        prompt=client_prompt(),
+    )
+
+
+async def setup_cached() -> None:
+    """Setup with the process-level agent cache."""
+    await get_agent(mcp, config.models.llm)
+
+
+async def benchmark(name: str, setup) -> None:  # type: ignore[no-untyped-def]
+    await setup()  # Warm-up
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        await setup()
+    elapsed = (time.perf_counter() - start) / ITERATIONS
+    print(f"{name:<20} {elapsed * 1000:8.3f} ms/message")
+
+
+async def main() -> None:
+    print(f"Per-message agent setup ({ITERATIONS} iterations)")
+    await benchmark("Per message", setup_per_message)
+    await benchmark("Cached", setup_cached)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
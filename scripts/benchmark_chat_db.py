@@ -0,0 +1,154 @@
+from datetime import UTC, datetime, timedelta
+import random
+import tempfile
+import time
+from typing import Callable
+
+from mcpbot.shared.services.database_chat import (
+    ChatDB,
+    JsonChatDB,
+    Message,
+    SqliteChatDB,
+)
+
+
+N_CONVERSATIONS = 10_000
+N_MESSAGES = 100  # Per conversation, 1M messages in total
+N_USERS = 1_000
+SAMPLES = 1_000
+
+START = datetime(2025, 1, 1, tzinfo=UTC)
+
+
+def generate_messages(conversation_id: str, user_id: str) -> list[Message]:
+    return [
+        Message(
+            id=f"{conversation_id}-{i}",
+            conversation_id=conversation_id,
+            user_id=user_id,
+            role="human" if i % 2 == 0 else "ai",
+            text="Lorem ipsum dolor sit amet. " * 8,
+            created_at=(START + timedelta(seconds=i)).isoformat(),
+            tokens=56,
+        )
+        for i in range(N_MESSAGES)
+    ]
+
+
+def load_json(db_messages: JsonChatDB, db_conversations: JsonChatDB) -> None:
+    for c in range(N_CONVERSATIONS):
+        user_id = f"user-{c % N_USERS}"
+        db_conversations.create_conversation(user_id, f"conversation-{c}")
+        for message in generate_messages(f"conversation-{c}", user_id):
+            db_messages.log.put(
+                message.conversation_id, message.id, message.model_dump()
+            )
+
+
+def load_sqlite(
+    db_messages: SqliteChatDB,
+    db_conversations: SqliteChatDB,
+) -> None:
+    connection = db_messages._connection()
+    connection.execute("BEGIN")
+    for c in range(N_CONVERSATIONS):
+        user_id = f"user-{c % N_USERS}"
+        db_conversations.create_conversation(user_id, f"conversation-{c}")
+        connection.executemany(
+            f"INSERT INTO messages ({SqliteChatDB.MESSAGE_COLUMNS}) VALUES "
+            "(:id, :conversation_id, :user_id, :role, :text, :created_at, "
+            ":tokens)",
+            [
+                message.model_dump()
+                for message in generate_messages(f"conversation-{c}", user_id)
+            ],
+        )
+    connection.execute("COMMIT")
+
+
+def measure(name: str, operation: Callable[[int], object]) -> None:
+    start = time.perf_counter()
+    for _ in range(SAMPLES):
+        operation(random.randrange(N_CONVERSATIONS))
+    elapsed = (time.perf_counter() - start) / SAMPLES
+    print(f"  {name:<30} {elapsed * 1000:8.3f} ms/op")
+
+
+def benchmark(name: str, db_messages: ChatDB, db_conversations: ChatDB) -> None:
+    print(name)
+    measure(
+        "list_messages",
+        lambda c: db_messages.list_messages(f"conversation-{c}"),
+    )
+    measure(
+        "list_recent_messages (10)",
+        lambda c: db_messages.list_recent_messages(f"conversation-{c}", 10),
+    )
+    measure(
+        "list_messages_page (20)",
+        lambda c: db_messages.list_messages_page(f"conversation-{c}", limit=20),
+    )
+    measure(
+        "list_conversations",
+        lambda c: db_conversations.list_conversations(f"user-{c % N_USERS}"),
+    )
+    measure(
+        "create_message",
+        lambda c: db_messages.create_message(
+            f"conversation-{c}", f"user-{c % N_USERS}", "human", "Hello!"
+        ),
+    )
+    measure(
+        "update_conversation_timestamp",
+        lambda c: db_conversations.update_conversation_timestamp(
+            f"conversation-{c}", f"user-{c % N_USERS}"
+        ),
+    )
+    measure(
+        "keep_last_n (90)",
+        lambda c: db_messages.keep_last_n(f"conversation-{c}", 90),
+    )
+    measure(
+        "delete_messages_after (last 10)",
+        lambda c: db_messages.delete_messages_after(
+            f"conversation-{c}",
+            (START + timedelta(seconds=N_MESSAGES - 10)).isoformat(),
+        ),
+    )
+
+
+def main() -> None:
+    total = N_CONVERSATIONS * N_MESSAGES
+    print(f"{N_CONVERSATIONS} conversations, {total} messages")
+    with tempfile.TemporaryDirectory() as path:
+        random.seed(0)
+        json_dbs = (
+            JsonChatDB(endpoint=path, collection="messages"),
+            JsonChatDB(endpoint=path, collection="conversations"),
+        )
+        start = time.perf_counter()
+        load_json(*json_dbs)
+        print(f"JsonChatDB loaded in {time.perf_counter() - start:.1f} s")
+        # Cold indexes, as after a restart
+        json_dbs = (
+            JsonChatDB(endpoint=path, collection="messages"),
+            JsonChatDB(endpoint=path, collection="conversations"),
+        )
+        benchmark("JsonChatDB", *json_dbs)
+
+    with tempfile.TemporaryDirectory() as path:
+        random.seed(0)
+        sqlite_dbs = (
+            SqliteChatDB(endpoint=f"sqlite:///{path}", collection="messages"),
+            SqliteChatDB(
+                endpoint=f"sqlite:///{path}", collection="conversations"
+            ),
+        )
+        start = time.perf_counter()
+        load_sqlite(*sqlite_dbs)
+        print(f"SqliteChatDB loaded in {time.perf_counter() - start:.1f} s")
+        benchmark("SqliteChatDB", *sqlite_dbs)
+
+
+if __name__ == "__main__":
+    main()
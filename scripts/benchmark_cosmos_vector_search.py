@@ -0,0 +1,110 @@
+"""Compares the request units (RU) and latency of the Cosmos DB vector
+search, with the vector formatted into the query text (before) and as a
+parameter (after).
+
+Runs against the Cosmos DB emulator by default, on a container with a vector
+index on `/embedding`, filled e.g. with `scripts/create_document.py`. Set
+COSMOS_ENDPOINT, COSMOS_KEY, COSMOS_DATABASE and COSMOS_CONTAINER to use
+another account.
+"""
+
+import hashlib
+import os
+import statistics
+import time
+from typing import Any
+
+from azure.cosmos import CosmosClient
+import numpy as np
+
+from mcpbot.shared.services.database_vector import COSMOS_SEARCH_QUERIES
+
+
+ENDPOINT = os.getenv("COSMOS_ENDPOINT", "https://localhost:8081")
+# The well-known key of the emulator
+KEY = os.getenv(
+    "COSMOS_KEY",
+    "C2y6yDjf5/R+ob0N8A7Cgv30VRDJIWEHLM+4QDU5DE2nQ9nDuVTqobD4b8mGGyPMbIZnq"
+    "yMsEcaGQy67XIw/Jw==",
+)
+DATABASE = os.getenv("COSMOS_DATABASE", "mcpbot")
+CONTAINER = os.getenv("COSMOS_CONTAINER", "faq")
+DIMENSIONS = 1536  # text-embedding-ada-002
+SAMPLES = 200
+N_DOCS = 3  # As in the rag tool
+METHOD = "cosine"
+
+
+def embed(text: str) -> list[float]:
+    """A unit vector seeded by the text, so no model is called."""
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8])
+    vector = np.random.default_rng(seed).standard_normal(DIMENSIONS)
+    unit: list[float] = (vector / np.linalg.norm(vector)).tolist()
+    return unit
+
+
+def formatted(vector: list[float]) -> dict[str, Any]:
+    """The query as it was: the vector and the options in the text."""
+    return {
+        "query": (
+            f"SELECT TOP {N_DOCS} c.text FROM c ORDER BY VectorDistance("
+            f"c.embedding, {vector}, true, "
+            f"{{'dataType': 'float32', 'distanceFunction': '{METHOD}'}})"
+        ),
+    }
+
+
+def parameterized(vector: list[float]) -> dict[str, Any]:
+    return {
+        "query": COSMOS_SEARCH_QUERIES[METHOD],
+        "parameters": [
+            {"name": "@n_docs", "value": N_DOCS},
+            {"name": "@embedding", "value": vector},
+        ],
+    }
+
+
+def measure(container: Any, name: str, build: Any) -> None:
+    charges: list[float] = []
+    latencies = []
+    for i in range(SAMPLES):
+        start = time.perf_counter()
+        list(
+            container.query_items(
+                **build(embed(f"Question {i}")),
+                enable_cross_partition_query=True,
+                response_hook=lambda headers, _: charges.append(
+                    float(headers["x-ms-request-charge"])
+                ),
+            )
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(
+        f"{name:<14} "
+        f"RU/query {sum(charges) / SAMPLES:7.2f}  "
+        f"p50 {statistics.median(latencies):7.2f} ms  "
+        f"p95 {latencies[int(len(latencies) * 0.95)]:7.2f} ms"
+    )
+
+
+def main() -> None:
+    container = (
+        CosmosClient(
+            ENDPOINT,
+            KEY,
+            connection_verify=not ENDPOINT.startswith("https://localhost"),
+        )
+        .get_database_client(DATABASE)
+        .get_container_client(CONTAINER)
+    )
+    print(f"{ENDPOINT} {DATABASE}/{CONTAINER}, top {N_DOCS} by {METHOD}")
+    for name, build in (
+        ("formatted", formatted),
+        ("parameterized", parameterized),
+    ):
+        measure(container, name, build)
+
+
+if __name__ == "__main__":
+    main()
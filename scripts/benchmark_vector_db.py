@@ -0,0 +1,122 @@
+"""Compares the search latency and memory (RSS) of NumpyVectorDB and
+ChromaVectorDB, on a synthetic FAQ-scale collection.
+
+The embeddings are random (seeded by the text), so no model is called and
+only the vector stores are measured. Every backend is measured in a fresh
+process, after its collection is written.
+"""
+
+import hashlib
+from multiprocessing import get_context
+from pathlib import Path
+import statistics
+import tempfile
+import time
+
+from langchain_core.embeddings import Embeddings
+import numpy as np
+
+from mcpbot.shared.services.database_vector import (
+    ChromaVectorDB,
+    NumpyVectorDB,
+    VectorDB,
+    VectorDocument,
+)
+
+
+N_DOCUMENTS = 5_000
+DIMENSIONS = 1536  # text-embedding-ada-002
+SAMPLES = 500
+N_DOCS = 3  # As in the rag tool
+
+
+class RandomEmbeddings(Embeddings):
+    """Unit vectors seeded by the text, the same one for the same text."""
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    @staticmethod
+    def _embed(text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8])
+        vector = np.random.default_rng(seed).standard_normal(DIMENSIONS)
+        unit: list[float] = (vector / np.linalg.norm(vector)).tolist()
+        return unit
+
+
+def open_db(backend: str, directory: str) -> VectorDB:
+    if backend == "numpy":
+        return NumpyVectorDB(
+            RandomEmbeddings(), "faq", endpoint=f"numpy:///{directory}"
+        )
+    return ChromaVectorDB(RandomEmbeddings(), "faq", endpoint=directory)
+
+
+def rss_mb() -> float:
+    """The resident memory of the process (Linux)."""
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def load(backend: str, directory: str) -> None:
+    documents = [
+        VectorDocument(
+            id=f"doc-{i}",
+            text=f"Question {i}: lorem ipsum dolor sit amet. " * 4,
+            metadata={"title": f"Document {i}"},
+        )
+        for i in range(N_DOCUMENTS)
+    ]
+    start = time.perf_counter()
+    errors = open_db(backend, directory).upsert_many(documents)
+    elapsed = time.perf_counter() - start
+    n_failed = sum(error is not None for error in errors)
+    print(f"{backend:<8} loaded in {elapsed:6.1f} s ({n_failed} failed)")
+
+
+def measure(backend: str, directory: str) -> None:
+    rss_start = rss_mb()
+    db = open_db(backend, directory)
+    db.search("Warm-up", "cosine", N_DOCS)
+    rss_open = rss_mb()
+
+    for method in ("cosine", "euclidean"):
+        latencies = []
+        for i in range(SAMPLES):
+            start = time.perf_counter()
+            db.search(f"Question {i}", method, N_DOCS)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        print(
+            f"{backend:<8} {method:<10} "
+            f"p50 {statistics.median(latencies):7.3f} ms  "
+            f"p95 {latencies[int(len(latencies) * 0.95)]:7.3f} ms"
+        )
+    print(
+        f"{backend:<8} RSS {rss_mb():7.1f} MB "
+        f"(+{rss_open - rss_start:.1f} MB to open and search)"
+    )
+
+
+def run(function, *args: str) -> None:  # type: ignore[no-untyped-def]
+    """Runs a step in a fresh process, so the RSS is its own."""
+    process = get_context("spawn").Process(target=function, args=args)
+    process.start()
+    process.join()
+
+
+def main() -> None:
+    print(f"{N_DOCUMENTS} documents of {DIMENSIONS} dimensions, top {N_DOCS}")
+    for backend in ("numpy", "chroma"):
+        with tempfile.TemporaryDirectory() as directory:
+            run(load, backend, directory)
+            run(measure, backend, directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,11 @@
+import os
+import time
+
+import httpx
+
+from mcpbot.shared.config import PORT
 from mcpbot.shared.init import config
+from mcpbot.shared.services import VectorDocument
 from mcpbot.shared.utils import read_file
 
 
@@ -9,21 +16,66 @@ if __name__ != "__main__":
 
 db_vector = config.databases.vector["faq"]
 if WRITE:
-    for document in read_file("faq.yml"):
-        id = document["title"]
+    documents = [
+        VectorDocument(
+            id=document["title"],
+            text=(
+                f"Source: {document['source']} \n"
+                f"Title: {document['title']} \n"
+                f"Answer: {document['answer']}"
+            ),
+            metadata={
+                "title": document["title"],
+                "category": document["category"],
+                "source": document["source"],
+                "question": document["question"],
+            },
+        )
+        for document in read_file("faq.yml")
+    ]
 
-        text = (
-            f"Source: {document['source']} \n"
-            f"Title: {document['title']} \n"
-            f"Answer: {document['answer']}"
+    start = time.perf_counter()
+
+    def report(n_done: int) -> None:
+        elapsed = time.perf_counter() - start
+        print(
+            f"\r{n_done}/{len(documents)} documents "
+            f"({n_done / max(elapsed, 1e-9):.1f} docs/s)",
+            end="",
+            flush=True,
+        )
+
+    errors = db_vector.upsert_many(documents, on_progress=report)
+    print()
+    for document, error in zip(documents, errors):
+        if error is not None:
+            print(f"Failed to upsert '{document.id}': {error}")
+    n_failed = sum(error is not None for error in errors)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Upserted {len(documents) - n_failed} documents in {elapsed:.1f} s "
+        f"({len(documents) / max(elapsed, 1e-9):.1f} docs/s), "
+        f"{n_failed} failed"
+    )
+
+    # The cached answers of the running server may be outdated now
+    try:
+        provider_token = (
+            os.popen("gcloud auth print-identity-token").read().strip()
+        )
+        response = httpx.post(
+            url=f"http://localhost:{PORT}/token",
+            data={"token": provider_token},
+        )
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        response = httpx.delete(
+            url=f"http://localhost:{PORT}/v1/cache/answers",
+            headers={"Authorization": f"Bearer {token}"},
         )
-        metadata = {
-            "title": document["title"],
-            "category": document["category"],
-            "source": document["source"],
-            "question": document["question"],
-        }
-        db_vector.upsert(id=id, text=text, metadata=metadata)
+        response.raise_for_status()
+    except (httpx.HTTPError, KeyError) as error:
+        print(f"Failed to invalidate the answer cache: {error}")
 else:
     question = "What are the holidays this year?"
     search = db_vector.search(question=question, method="cosine", n_docs=1)
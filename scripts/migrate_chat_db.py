@@ -0,0 +1,519 @@
+"""Exports, imports and migrates the chat data (conversations, summaries and
+messages), streamed as NDJSON in constant memory.
+
+    python scripts/migrate_chat_db.py export SOURCE chat.ndjson
+    python scripts/migrate_chat_db.py import chat.ndjson TARGET
+    python scripts/migrate_chat_db.py migrate SOURCE TARGET
+
+A database is `config` (the chat databases of the config file), a directory
+(JsonChatDB), `sqlite:///<directory>` (SqliteChatDB) or an Azure Cosmos DB
+endpoint (with --source/target-database and --source/target-api-key). A
+directory in the legacy JSON layout (a file per record) is upgraded to the
+segments when it is opened, and can then be exported as usual.
+
+The records are written to the target with upserts, in batches, several
+batches at once. An interrupted run resumes from its checkpoint file when
+run again with the same arguments: the records after the checkpoint are
+written again, which is safe with upserts. At the end, the number of
+messages of every conversation is compared between the source and the
+target.
+"""
+
+import argparse
+import asyncio
+from collections import deque
+from itertools import islice
+import json
+import os
+from pathlib import Path
+import sys
+import time
+from typing import Any, Iterator
+
+from mcpbot.shared.services.database_chat import (
+    CachedChatDB,
+    ChatDB,
+    Conversation,
+    Message,
+    Summary,
+    get_chat_db,
+)
+
+
+Record = Conversation | Summary | Message
+
+KINDS: dict[str, type[Record]] = {
+    "conversation": Conversation,
+    "summary": Summary,
+    "message": Message,
+}
+
+REPORT_INTERVAL = 5.0  # Seconds between two progress reports
+MAX_REPORTED_ERRORS = 10
+
+
+def kind_of(record: Record) -> str:
+    return {
+        Conversation: "conversation",
+        Summary: "summary",
+        Message: "message",
+    }[type(record)]
+
+
+def open_dbs(
+    endpoint: str,
+    database: str | None,
+    api_key: str | None,
+    collections: tuple[str, str],
+) -> tuple[ChatDB, ChatDB]:
+    """Opens the (conversations, messages) databases, without the cache."""
+    if endpoint == "config":
+        from mcpbot.shared.init import config
+
+        dbs = tuple(
+            db.db if isinstance(db, CachedChatDB) else db
+            for db in (
+                config.databases.chat["conversations"],
+                config.databases.chat["messages"],
+            )
+        )
+        return dbs[0], dbs[1]
+
+    kwargs: dict[str, Any] = dict()
+    if "azure.com" in endpoint:
+        if not database or not api_key:
+            sys.exit(f"{endpoint}: a database and an API key are required.")
+        kwargs = {"database": database, "api_key": api_key}
+    conversations, messages = collections
+    return (
+        get_chat_db(endpoint, conversations, cache=False, **kwargs),
+        get_chat_db(endpoint, messages, cache=False, **kwargs),
+    )
+
+
+class Checkpoint:
+    """The position of a run, saved atomically to a JSON file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def load(self) -> dict[str, Any] | None:
+        if not self.path.exists():
+            return None
+        state: dict[str, Any] = json.loads(self.path.read_text())
+        print(f"Resuming from {self.path}: {state}")
+        return state
+
+    def save(self, state: dict[str, Any]) -> None:
+        temp_path = self.path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(state))
+        os.replace(temp_path, self.path)
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+class Progress:
+    """Counts the records and reports the throughput."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.reported_at = self.start
+        self.counts = dict.fromkeys(KINDS, 0)
+        self.failed = 0
+
+    def add(self, kind: str, n_records: int = 1, n_failed: int = 0) -> None:
+        self.counts[kind] += n_records - n_failed
+        self.failed += n_failed
+        if time.perf_counter() - self.reported_at >= REPORT_INTERVAL:
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        now = time.perf_counter()
+        self.reported_at = now
+        elapsed = now - self.start
+        total = sum(self.counts.values())
+        counts = ", ".join(f"{kind}: {n}" for kind, n in self.counts.items())
+        prefix = "Done in" if final else "Running for"
+        print(
+            f"{prefix} {elapsed:.0f} s: {counts}, {self.failed} failed "
+            f"({total / max(elapsed, 1e-9):.0f} records/s)"
+        )
+
+
+class Writer:
+    """Writes records to the target in batches, up to `concurrency` batches
+    at once.
+
+    `mark` saves a position to the checkpoint, once all records added before
+    it are written.
+    """
+
+    def __init__(
+        self,
+        db_conversations: ChatDB,
+        db_messages: ChatDB,
+        checkpoint: Checkpoint,
+        progress: Progress,
+        batch_size: int,
+        concurrency: int,
+    ) -> None:
+        self.db_conversations = db_conversations
+        self.db_messages = db_messages
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.batch_size = batch_size
+
+        self._batches: dict[str, list[Any]] = {kind: [] for kind in KINDS}
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: list[asyncio.Task[None]] = []
+        # The positions and the writes they wait for, in order
+        self._marks: deque[tuple[list[asyncio.Task[None]], dict[str, Any]]] = (
+            deque()
+        )
+        self._n_errors = 0
+
+    async def add(self, record: Record) -> None:
+        kind = kind_of(record)
+        batch = self._batches[kind]
+        batch.append(record)
+        if len(batch) >= self.batch_size:
+            await self._submit(kind)
+
+    async def mark(self, state: dict[str, Any]) -> None:
+        for kind in KINDS:
+            await self._submit(kind)
+        self._marks.append((self._tasks, state))
+        self._tasks = []
+        self._advance()
+
+    async def close(self) -> None:
+        for kind in KINDS:
+            await self._submit(kind)
+        tasks = [task for tasks, _ in self._marks for task in tasks]
+        await asyncio.gather(*tasks, *self._tasks)
+        self._advance()
+
+    async def _submit(self, kind: str) -> None:
+        batch = self._batches[kind]
+        if not batch:
+            return
+        self._batches[kind] = []
+        # Waits while `concurrency` batches are being written
+        await self._slots.acquire()
+        task = asyncio.create_task(self._write(kind, batch))
+        task.add_done_callback(lambda _: self._slots.release())
+        task.add_done_callback(lambda _: self._advance())
+        self._tasks.append(task)
+
+    async def _write(self, kind: str, batch: list[Any]) -> None:
+        errors: list[Any]
+        try:
+            if kind == "conversation":
+                errors = await self.db_conversations.aupsert_conversations(
+                    batch
+                )
+            elif kind == "message":
+                errors = await self.db_messages.aupsert_messages(batch)
+            else:
+                errors = await asyncio.gather(
+                    *(self.db_messages.aupsert_summary(item) for item in batch),
+                    return_exceptions=True,
+                )
+        except Exception as error:
+            errors = [error] * len(batch)
+
+        for item, failure in zip(batch, errors):
+            if failure is not None and self._n_errors < MAX_REPORTED_ERRORS:
+                self._n_errors += 1
+                print(f"Failed to write {kind} '{item.id}': {failure}")
+        n_failed = sum(failure is not None for failure in errors)
+        self.progress.add(kind, len(batch), n_failed)
+
+    def _advance(self) -> None:
+        """Saves the last position whose writes are all done."""
+        state = None
+        while self._marks and all(map(_succeeded, self._marks[0][0])):
+            state = self._marks.popleft()[1]
+        if state is not None:
+            self.checkpoint.save(state)
+
+
+def _succeeded(task: asyncio.Task[None]) -> bool:
+    return task.done() and not task.cancelled() and task.exception() is None
+
+
+async def verify(
+    expected: Iterator[tuple[Conversation, int]],
+    db_conversations: ChatDB,
+    db_messages: ChatDB,
+    concurrency: int,
+) -> bool:
+    """Checks that the target has the conversations, with the expected
+    number of messages each.
+    """
+    n_checked = 0
+    mismatches = 0
+
+    async def check(conversation: Conversation, n_expected: int) -> bool:
+        stored, n_stored = await asyncio.gather(
+            db_conversations.aget_conversation(
+                conversation.id, conversation.user_id
+            ),
+            db_messages.acount_messages(conversation.id),
+        )
+        if stored is None or n_stored != n_expected:
+            if mismatches < MAX_REPORTED_ERRORS:
+                state = "missing" if stored is None else f"{n_stored} messages"
+                print(
+                    f"Mismatch in '{conversation.id}': {state}, "
+                    f"expected {n_expected}"
+                )
+            return False
+        return True
+
+    while chunk := list(islice(expected, concurrency)):
+        results = await asyncio.gather(*(check(*args) for args in chunk))
+        n_checked += len(chunk)
+        mismatches += results.count(False)
+
+    print(f"Verified {n_checked} conversations: {mismatches} mismatches")
+    return mismatches == 0
+
+
+def export(
+    db_conversations: ChatDB,
+    db_messages: ChatDB,
+    output: Path,
+    checkpoint: Checkpoint,
+    batch_size: int,
+) -> bool:
+    state = checkpoint.load() or {"cursor": None, "offset": 0, "lines": 0}
+    progress = Progress()
+    with open(output, "ab" if state["offset"] else "wb") as file:
+        # Drops the lines written after the checkpoint
+        file.truncate(state["offset"])
+        file.seek(state["offset"])
+
+        def write(record: Record) -> None:
+            line = {"type": kind_of(record), "data": record.model_dump()}
+            file.write((json.dumps(line, ensure_ascii=False) + "\n").encode())
+            state["lines"] += 1
+            progress.add(kind_of(record))
+
+        for page in db_conversations.iter_conversations(
+            batch_size, state["cursor"]
+        ):
+            for conversation in page.items:
+                write(conversation)
+                summary = db_messages.get_summary(conversation.id)
+                if summary is not None:
+                    write(summary)
+                for messages in db_messages.iter_messages(
+                    conversation.id, batch_size
+                ):
+                    for message in messages:
+                        write(message)
+            file.flush()
+            state["cursor"] = page.next_cursor
+            state["offset"] = file.tell()
+            checkpoint.save(state)
+    progress.report(final=True)
+    checkpoint.clear()
+
+    # Reads the file back, e.g. to catch a full disk
+    with open(output, "rb") as written:
+        n_lines = sum(1 for _ in written)
+    expected = int(state["lines"])
+    print(f"Verified {output}: {n_lines} lines, expected {expected}")
+    return n_lines == expected
+
+
+def read_records(input: Path, offset: int = 0) -> Iterator[tuple[Record, int]]:
+    """Reads the records of a file, with the offset after each of them."""
+    with open(input, "rb") as file:
+        file.seek(offset)
+        for line in file:
+            offset += len(line)
+            record = json.loads(line)
+            yield KINDS[record["type"]](**record["data"]), offset
+
+
+def count_file(input: Path) -> Iterator[tuple[Conversation, int]]:
+    """The conversations of a file and their number of messages (the
+    messages follow their conversation).
+    """
+    conversation, n_messages = None, 0
+    for record, _ in read_records(input):
+        if isinstance(record, Conversation):
+            if conversation is not None:
+                yield conversation, n_messages
+            conversation, n_messages = record, 0
+        elif isinstance(record, Message):
+            n_messages += 1
+    if conversation is not None:
+        yield conversation, n_messages
+
+
+def count_source(
+    db_conversations: ChatDB, db_messages: ChatDB, batch_size: int
+) -> Iterator[tuple[Conversation, int]]:
+    for page in db_conversations.iter_conversations(batch_size):
+        for conversation in page.items:
+            yield conversation, db_messages.count_messages(conversation.id)
+
+
+async def import_(
+    input: Path,
+    db_conversations: ChatDB,
+    db_messages: ChatDB,
+    checkpoint: Checkpoint,
+    batch_size: int,
+    concurrency: int,
+) -> bool:
+    state = checkpoint.load() or {"offset": 0}
+    progress = Progress()
+    writer = Writer(
+        db_conversations,
+        db_messages,
+        checkpoint,
+        progress,
+        batch_size,
+        concurrency,
+    )
+    records = read_records(input, state["offset"])
+    for n_records, (record, offset) in enumerate(records, 1):
+        await writer.add(record)
+        if n_records % batch_size == 0:
+            await writer.mark({"offset": offset})
+    await writer.close()
+    progress.report(final=True)
+    checkpoint.clear()
+    return progress.failed == 0 and await verify(
+        count_file(input), db_conversations, db_messages, concurrency
+    )
+
+
+async def migrate(
+    source: tuple[ChatDB, ChatDB],
+    target: tuple[ChatDB, ChatDB],
+    checkpoint: Checkpoint,
+    batch_size: int,
+    concurrency: int,
+) -> bool:
+    source_conversations, source_messages = source
+    state = checkpoint.load() or {"cursor": None}
+    progress = Progress()
+    writer = Writer(*target, checkpoint, progress, batch_size, concurrency)
+    cursor = state["cursor"]
+    while True:
+        page = await source_conversations.alist_all_conversations_page(
+            batch_size, cursor
+        )
+        for conversation in page.items:
+            await writer.add(conversation)
+            summary = await source_messages.aget_summary(conversation.id)
+            if summary is not None:
+                await writer.add(summary)
+            messages_cursor = None
+            while True:
+                messages = await source_messages.alist_messages_page(
+                    conversation.id, "ASC", batch_size, messages_cursor
+                )
+                for message in messages.items:
+                    await writer.add(message)
+                if messages.next_cursor is None:
+                    break
+                messages_cursor = messages.next_cursor
+        await writer.mark({"cursor": page.next_cursor})
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    await writer.close()
+    progress.report(final=True)
+    checkpoint.clear()
+    return progress.failed == 0 and await verify(
+        count_source(*source, batch_size), *target, concurrency
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("command", choices=["export", "import", "migrate"])
+    parser.add_argument("source", help="A database, or a file to import")
+    parser.add_argument("target", help="A database, or a file to export to")
+    parser.add_argument("--source-database")
+    parser.add_argument(
+        "--source-api-key", default=os.getenv("SOURCE_COSMOS_API_KEY")
+    )
+    parser.add_argument("--target-database")
+    parser.add_argument(
+        "--target-api-key", default=os.getenv("TARGET_COSMOS_API_KEY")
+    )
+    parser.add_argument(
+        "--collections",
+        nargs=2,
+        default=("conversations", "messages"),
+        metavar=("CONVERSATIONS", "MESSAGES"),
+    )
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Batches written at once"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        help="Default: the file with .checkpoint, or migrate.checkpoint",
+    )
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = parse_args()
+    collections = tuple(args.collections)
+    if args.command == "import":
+        source = None
+    else:
+        source = open_dbs(
+            args.source, args.source_database, args.source_api_key, collections
+        )
+    if args.command == "export":
+        target = None
+    else:
+        target = open_dbs(
+            args.target, args.target_database, args.target_api_key, collections
+        )
+
+    file = {"export": args.target, "import": args.source}.get(args.command)
+    checkpoint = Checkpoint(
+        args.checkpoint
+        or Path(f"{file}.checkpoint" if file else "migrate.checkpoint")
+    )
+    try:
+        if args.command == "export":
+            assert source is not None
+            ok = export(*source, Path(args.target), checkpoint, args.batch_size)
+        elif args.command == "import":
+            assert target is not None
+            ok = await import_(
+                Path(args.source),
+                *target,
+                checkpoint,
+                args.batch_size,
+                args.concurrency,
+            )
+        else:
+            assert source is not None and target is not None
+            ok = await migrate(
+                source, target, checkpoint, args.batch_size, args.concurrency
+            )
+    finally:
+        for db in (*(source or ()), *(target or ())):
+            await db.aclose()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -4,7 +4,7 @@ import json
 import os
 
 from mcpbot.shared.config import COMPANY, PORT
-from mcpbot.client.endpoints.messages.create import CreateMessageResponse
+from mcpbot.client.streaming import DeltaEvent
 
 
 OPTION = 1
@@ -49,9 +49,13 @@ async def main() -> None:
             headers={"Authorization": f"Bearer {token}"},
             json={"message": QUESTION},
         ) as response:
-            async for chunk in response.aiter_bytes():
-                response = CreateMessageResponse(**json.loads(chunk))  # type: ignore[assignment]
-                print(response.ai.text, end="", flush=True)  # type: ignore[attr-defined]
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line.removeprefix("event: ")
+                elif line.startswith("data: ") and event == "delta":
+                    data = json.loads(line.removeprefix("data: "))
+                    print(DeltaEvent(**data).text, end="", flush=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,133 @@
+"""Tests of the admission of the agent runs (`AdmissionScheduler`), and of the
+`Admission` dependency of the endpoints.
+"""
+
+import asyncio
+from typing import AsyncGenerator, Iterator
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+import pytest
+
+from mcpbot.client import admission
+from mcpbot.client.admission import (
+    Admission,
+    AdmissionRejected,
+    AdmissionScheduler,
+)
+from mcpbot.client.oauth2 import User, validate_user
+
+
+class Body(BaseModel):
+    message: str
+
+
+@pytest.fixture
+def scheduler(monkeypatch: pytest.MonkeyPatch) -> AdmissionScheduler:
+    """The scheduler of the endpoints: 1 agent at once, 1 waiting request."""
+    scheduler = AdmissionScheduler(
+        max_concurrent=1, max_queue=1, max_queue_per_user=1, max_wait=0.1
+    )
+    monkeypatch.setattr(admission, "scheduler", scheduler)
+    return scheduler
+
+
+@pytest.fixture
+def client(scheduler: AdmissionScheduler) -> Iterator[TestClient]:
+    app = FastAPI()
+    app.dependency_overrides[validate_user] = lambda: User(
+        user_id="user", email="user@example.com"
+    )
+
+    @app.post("/run")
+    async def run(ticket: Admission, body: Body) -> dict[str, str]:
+        if body.message == "fail":
+            raise RuntimeError("The agent failed.")
+        return {"message": body.message}
+
+    @app.post("/stream")
+    async def stream(ticket: Admission) -> StreamingResponse:
+        async def chunks() -> AsyncGenerator[str, None]:
+            try:
+                yield str(scheduler.metrics()["active"])
+            finally:
+                ticket.release()
+
+        ticket.hand_over()
+        return StreamingResponse(chunks())
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        yield client
+
+
+def test_round_robin() -> None:
+    async def admitted() -> list[str]:
+        scheduler = AdmissionScheduler(
+            max_concurrent=1, max_queue=10, max_queue_per_user=10, max_wait=1
+        )
+        running = await scheduler.acquire("a")
+        order: list[str] = []
+
+        async def run(user_id: str) -> None:
+            ticket = await scheduler.acquire(user_id)
+            order.append(user_id)
+            await asyncio.sleep(0)
+            ticket.release()
+
+        # User a queues 3 requests before user b queues 1
+        runs = [asyncio.create_task(run(user)) for user in "aaab"]
+        await asyncio.sleep(0)
+        assert scheduler.metrics()["queued"] == 4
+        running.release()
+        await asyncio.gather(*runs)
+        assert scheduler.metrics()["active"] == 0
+        return order
+
+    assert asyncio.run(admitted()) == ["a", "b", "a", "a"]
+
+
+def test_rejected_after_wait() -> None:
+    async def rejected() -> AdmissionRejected:
+        scheduler = AdmissionScheduler(
+            max_concurrent=1, max_queue=1, max_queue_per_user=1, max_wait=0.01
+        )
+        await scheduler.acquire("a")
+        with pytest.raises(AdmissionRejected) as error:
+            await scheduler.acquire("b")
+        assert scheduler.metrics()["queued"] == 0
+        return error.value
+
+    assert asyncio.run(rejected()).retry_after >= 1
+
+
+def test_full_queue(client: TestClient, scheduler: AdmissionScheduler) -> None:
+    async def fill() -> None:
+        await scheduler.acquire("other")
+        scheduler._queued = scheduler.max_queue
+
+    asyncio.run(fill())
+    response = client.post("/run", json={"message": "hello"})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert scheduler.metrics()["rejected_full"] == 1
+
+
+def test_released_after_request(
+    client: TestClient, scheduler: AdmissionScheduler
+) -> None:
+    assert client.post("/run", json={"message": "hello"}).status_code == 200
+    assert client.post("/run", json={"message": "fail"}).status_code == 500
+    # The body is validated after the ticket is taken
+    assert client.post("/run", json={"text": "hello"}).status_code == 422
+    assert client.post("/run").status_code == 422
+    metrics = scheduler.metrics()
+    assert (metrics["admitted"], metrics["active"]) == (4, 0)
+
+
+def test_handed_over(client: TestClient, scheduler: AdmissionScheduler) -> None:
+    # The stream still holds the ticket while it runs
+    response = client.post("/stream")
+    assert response.text == "1"
+    assert scheduler.metrics()["active"] == 0
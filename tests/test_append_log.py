@@ -0,0 +1,175 @@
+"""Tests of the append-only storage of the local chat database (`AppendLog`),
+and of the import of its legacy layout (a JSON file per record).
+"""
+
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from mcpbot.shared.services.database_chat import JsonChatDB
+from mcpbot.shared.utils.append_log import AppendLog
+
+
+KEY = "conversation"
+
+
+def record(i: int, text: str | None = None) -> dict[str, Any]:
+    return {
+        "id": f"record-{i}",
+        "created_at": f"2025-01-01T00:00:{i:02d}",
+        "text": text or f"record {i}",
+    }
+
+
+def ids(records: list[dict[str, Any]]) -> list[str]:
+    return [record["id"] for record in records]
+
+
+def lines(log: AppendLog, key: str = KEY) -> list[dict[str, Any]]:
+    with open(log.path / f"{key}.jsonl", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+@pytest.fixture
+def log(tmp_path: Path) -> AppendLog:
+    """A log with the records 1 to 5, written in a shuffled order."""
+    log = AppendLog(tmp_path, compact_min_dead=1000)
+    for i in [3, 1, 5, 2, 4]:
+        log.put(KEY, f"record-{i}", record(i))
+    return log
+
+
+def test_sorted(log: AppendLog) -> None:
+    assert ids(log.items(KEY)) == [f"record-{i}" for i in range(1, 6)]
+    assert ids(log.items(KEY, reverse=True))[0] == "record-5"
+    assert log.get(KEY, "record-2") == record(2)
+    assert log.get(KEY, "missing") is None
+    assert log.count(KEY) == 5 and log.count("other") == 0
+    assert log.keys() == [KEY]
+
+
+def test_overwrite_and_tombstones(log: AppendLog, tmp_path: Path) -> None:
+    log.put(KEY, "record-2", record(2, "updated"))
+    log.delete(KEY, "record-4")
+    log.delete(KEY, "missing")
+    # Every write is a new line, the delete a tombstone
+    assert len(lines(log)) == 7 and lines(log)[-1]["deleted"]
+    assert ids(log.items(KEY)) == [
+        "record-1",
+        "record-2",
+        "record-3",
+        "record-5",
+    ]
+    # The index is rebuilt the same from the file
+    reloaded = AppendLog(tmp_path)
+    assert reloaded.items(KEY) == log.items(KEY)
+    assert reloaded.get(KEY, "record-2") == record(2, "updated")
+
+
+def test_compaction(tmp_path: Path) -> None:
+    log = AppendLog(tmp_path, compact_min_dead=4)
+    for i in range(1, 4):
+        log.put(KEY, f"record-{i}", record(i))
+    for text in ["a", "b", "c"]:
+        log.put(KEY, "record-1", record(1, text))
+    assert len(lines(log)) == 6
+    # Compacted once more lines are dead than alive
+    log.put(KEY, "record-1", record(1, "d"))
+    assert len(lines(log)) == 3
+    assert log.get(KEY, "record-1") == record(1, "d")
+    log.delete(KEY, "record-2")
+    log.compact(KEY)
+    assert [line["id"] for line in lines(log)] == ["record-1", "record-3"]
+    assert AppendLog(tmp_path).items(KEY) == log.items(KEY)
+
+
+def test_tail_and_range(log: AppendLog) -> None:
+    assert ids(log.tail(KEY, 2)) == ["record-4", "record-5"]
+    assert ids(log.tail(KEY, 2, reverse=True)) == ["record-5", "record-4"]
+    assert log.tail(KEY, 0) == [] and len(log.tail(KEY, 10)) == 5
+    after = (record(2)["created_at"], "record-2")
+    assert ids(log.range(KEY, after, 2)) == ["record-3", "record-4"]
+    assert ids(log.range(KEY, after, 2, reverse=True)) == ["record-1"]
+    assert ids(log.range(KEY, None, 2, reverse=True)) == [
+        "record-5",
+        "record-4",
+    ]
+
+
+def test_range_deletes(log: AppendLog, tmp_path: Path) -> None:
+    start, end = record(2)["created_at"], record(4)["created_at"]
+    assert log.delete_range(KEY, start, end) == 2
+    assert ids(log.items(KEY)) == ["record-1", "record-4", "record-5"]
+    assert ids(log.pop_range(KEY, start=end)) == ["record-4", "record-5"]
+    assert log.pop_range(KEY, start=end) == []
+    log.put(KEY, "record-6", record(6))
+    assert log.trim(KEY, 1) == 1
+    assert ids(log.items(KEY)) == ["record-6"]
+    assert ids(AppendLog(tmp_path).items(KEY)) == ["record-6"]
+
+
+def test_reload_after_other_writer(log: AppendLog, tmp_path: Path) -> None:
+    # E.g. another worker process, with its own index of the segment
+    other = AppendLog(tmp_path)
+    assert other.count(KEY) == 5
+    other.put(KEY, "record-6", record(6))
+    assert ids(log.tail(KEY, 1)) == ["record-6"]
+    other.delete(KEY, "record-1")
+    assert log.get(KEY, "record-1") is None
+    # The other writer replaced the segment with a compacted one
+    other.delete(KEY, "record-2")
+    other.compact(KEY)
+    assert len(lines(log)) == 4
+    assert ids(log.items(KEY)) == ids(other.items(KEY))
+    log.put(KEY, "record-7", record(7))
+    assert other.count(KEY) == 5
+
+
+def test_partial_last_line(log: AppendLog, tmp_path: Path) -> None:
+    # E.g. a crash while writing
+    with open(tmp_path / f"{KEY}.jsonl", "ab") as file:
+        file.write(b'{"id": "record-6", "sort')
+    reloaded = AppendLog(tmp_path)
+    assert reloaded.count(KEY) == 5
+    reloaded.put(KEY, "record-6", record(6))
+    assert ids(AppendLog(tmp_path).tail(KEY, 1)) == ["record-6"]
+
+
+def test_import_legacy(tmp_path: Path) -> None:
+    for i in [2, 1]:
+        legacy = tmp_path / KEY / f"record-{i}.json"
+        legacy.parent.mkdir(exist_ok=True)
+        legacy.write_text(json.dumps(record(i)), encoding="utf-8")
+    log = AppendLog(tmp_path)
+    assert log.import_legacy() == 2
+    assert log.items(KEY) == [record(1), record(2)]
+    assert not (tmp_path / KEY).exists()
+    assert (tmp_path / ".legacy" / KEY / "record-1.json").exists()
+    # Only once
+    assert log.import_legacy() == 0 and log.count(KEY) == 2
+
+
+def test_json_chat_db_legacy_layout(tmp_path: Path) -> None:
+    # The layout of JsonChatDB before the segments
+    message = {
+        "id": "message-1",
+        "conversation_id": "conversation-1",
+        "user_id": "user-1",
+        "role": "human",
+        "text": "Hello",
+        "created_at": "2025-01-01T00:00:00+00:00",
+    }
+    directory = tmp_path / "messages" / "conversation-1"
+    directory.mkdir(parents=True)
+    (directory / "message-1.json").write_text(json.dumps(message, indent=4))
+    db = JsonChatDB(str(tmp_path), "messages")
+    assert [
+        m.model_dump(exclude={"tokens"})
+        for m in db.list_messages("conversation-1")
+    ] == [message]
+    assert (
+        JsonChatDB(str(tmp_path), "messages").count_messages("conversation-1")
+        == 1
+    )
@@ -0,0 +1,324 @@
+"""Tests of the read-through cache of the chat databases (`CachedChatDB`).
+
+The tests run against the JSON and SQLite databases, and against Cosmos DB
+(marker `cosmos`) when COSMOS_ENDPOINT is set, e.g. to the emulator with its
+certificate trusted. Each Cosmos test uses its own temporary container.
+"""
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Any, Callable, Coroutine, Iterator, TypeVar
+from uuid import uuid4
+
+import pytest
+
+from mcpbot.shared.services import database_chat
+from mcpbot.shared.services.database_chat import (
+    AzureCosmosChatDB,
+    CachedChatDB,
+    ChatDB,
+    JsonChatDB,
+    Message,
+    SqliteChatDB,
+    Summary,
+    new_message,
+)
+
+
+T = TypeVar("T")
+
+CONVERSATION_ID = "conversation"
+USER_ID = "user"
+# The well-known key of the emulator
+COSMOS_KEY = os.getenv(
+    "COSMOS_KEY",
+    "C2y6yDjf5/R+ob0N8A7Cgv30VRDJIWEHLM+4QDU5DE2nQ9nDuVTqobD4b8mGGyPMbIZnq"
+    "yMsEcaGQy67XIw/Jw==",
+)
+
+
+def message(i: int, text: str | None = None) -> Message:
+    """The i-th message of the conversation, in order of creation."""
+    return new_message(
+        CONVERSATION_ID,
+        USER_ID,
+        "human" if i % 2 else "ai",
+        text or f"message {i}",
+        id=f"message-{i}",
+        created_at=f"2025-01-01T00:00:{i:02d}+00:00",
+    )
+
+
+def summary(text: str) -> Summary:
+    return Summary(
+        conversation_id=CONVERSATION_ID,
+        user_id=USER_ID,
+        text=text,
+        summarized_until=message(2).created_at,
+        updated_at=message(2).created_at,
+    )
+
+
+def texts(messages: list[Message]) -> list[str]:
+    return [message.text for message in messages]
+
+
+def run(db: ChatDB, coroutine: Coroutine[Any, Any, T]) -> T:
+    """Runs a coroutine, then closes the async clients of its event loop."""
+
+    async def main() -> T:
+        try:
+            return await coroutine
+        finally:
+            await db.aclose()
+
+    return asyncio.run(main())
+
+
+def cosmos_chat_db() -> Iterator[ChatDB]:
+    endpoint = os.getenv("COSMOS_ENDPOINT")
+    if not endpoint:
+        pytest.skip("COSMOS_ENDPOINT is not set")
+    from azure.cosmos import CosmosClient, PartitionKey
+
+    database = os.getenv("COSMOS_DATABASE", "mcpbot-tests")
+    collection = f"messages-{uuid4().hex}"
+    client = CosmosClient(endpoint, COSMOS_KEY)
+    container = client.create_database_if_not_exists(database)
+    container.create_container(collection, PartitionKey("/conversation_id"))
+    try:
+        yield AzureCosmosChatDB(database, collection, endpoint, COSMOS_KEY)
+    finally:
+        container.delete_container(collection)
+
+
+@pytest.fixture(
+    params=["json", "sqlite", pytest.param("cosmos", marks=pytest.mark.cosmos)]
+)
+def db(request: pytest.FixtureRequest, tmp_path: Path) -> Iterator[ChatDB]:
+    """The cached database, with 5 messages in the conversation."""
+    if request.param == "cosmos":
+        databases = cosmos_chat_db()
+    elif request.param == "sqlite":
+        databases = iter([SqliteChatDB(f"sqlite:///{tmp_path}", "messages")])
+    else:
+        databases = iter([JsonChatDB(str(tmp_path), "messages")])
+    for db in databases:
+        assert (
+            db.create_messages([message(i) for i in range(1, 6)]) == [None] * 5
+        )
+        yield db
+        asyncio.run(db.aclose())
+
+
+@pytest.fixture
+def cache(db: ChatDB) -> CachedChatDB:
+    return CachedChatDB(db, name="test")
+
+
+class Clock:
+    """A monotonic clock that only moves when told to."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+# The writes of the cached conversation, blocking and async
+WRITES: dict[
+    str,
+    tuple[
+        Callable[[ChatDB], Any], Callable[[ChatDB], Coroutine[Any, Any, Any]]
+    ],
+] = {
+    "create_message": (
+        lambda db: db.create_message(
+            CONVERSATION_ID,
+            USER_ID,
+            "ai",
+            "new",
+            created_at=message(9).created_at,
+        ),
+        lambda db: db.acreate_message(
+            CONVERSATION_ID,
+            USER_ID,
+            "ai",
+            "new",
+            created_at=message(9).created_at,
+        ),
+    ),
+    "create_messages": (
+        lambda db: db.create_messages([message(9)]),
+        lambda db: db.acreate_messages([message(9)]),
+    ),
+    "upsert_messages": (
+        lambda db: db.upsert_messages([message(3, "updated"), message(9)]),
+        lambda db: db.aupsert_messages([message(3, "updated"), message(9)]),
+    ),
+    "delete_message": (
+        lambda db: db.delete_message(message(3).id, CONVERSATION_ID),
+        lambda db: db.adelete_message(message(3).id, CONVERSATION_ID),
+    ),
+    "delete_all_messages": (
+        lambda db: db.delete_all_messages(CONVERSATION_ID),
+        lambda db: db.adelete_all_messages(CONVERSATION_ID),
+    ),
+    "delete_messages_after": (
+        lambda db: db.delete_messages_after(
+            CONVERSATION_ID, message(4).created_at
+        ),
+        lambda db: db.adelete_messages_after(
+            CONVERSATION_ID, message(4).created_at
+        ),
+    ),
+    "delete_messages_until": (
+        lambda db: db.delete_messages_until(
+            CONVERSATION_ID, message(2).created_at
+        ),
+        lambda db: db.adelete_messages_until(
+            CONVERSATION_ID, message(2).created_at
+        ),
+    ),
+    "keep_last_n": (
+        lambda db: db.keep_last_n(CONVERSATION_ID, 2),
+        lambda db: db.akeep_last_n(CONVERSATION_ID, 2),
+    ),
+}
+
+
+def test_read_through(cache: CachedChatDB, db: ChatDB) -> None:
+    assert texts(cache.list_messages(CONVERSATION_ID)) == [
+        f"message {i}" for i in range(1, 6)
+    ]
+    # A write bypassing the cache is not seen: the reads hit the cache
+    db.create_messages([message(9)])
+    assert len(cache.list_messages(CONVERSATION_ID)) == 5
+    assert texts(cache.list_messages(CONVERSATION_ID, "DESC"))[0] == "message 5"
+    assert texts(cache.list_recent_messages(CONVERSATION_ID, 2)) == [
+        "message 4",
+        "message 5",
+    ]
+    metrics = cache.metrics()
+    assert (metrics["misses"], metrics["hits"]) == (1, 3)
+    assert metrics["conversations"] == 1 and metrics["bytes"] > 0
+
+
+def test_read_through_async(cache: CachedChatDB, db: ChatDB) -> None:
+    async def reads() -> list[list[Message]]:
+        first = await cache.alist_messages(CONVERSATION_ID)
+        await db.acreate_messages([message(9)])
+        return [first, await cache.alist_recent_messages(CONVERSATION_ID, 9)]
+
+    first, second = run(cache, reads())
+    assert first == second and len(first) == 5
+    assert (cache.metrics()["misses"], cache.metrics()["hits"]) == (1, 1)
+
+
+def test_recent_window(db: ChatDB) -> None:
+    cache = CachedChatDB(db, name="test", messages=3)
+    # Only the newest 3 messages are read and cached
+    assert texts(cache.list_recent_messages(CONVERSATION_ID, 2)) == [
+        "message 4",
+        "message 5",
+    ]
+    # An older message is outside of the window
+    cache.create_messages([message(0), message(9)])
+    assert texts(cache.list_recent_messages(CONVERSATION_ID, 3)) == [
+        "message 4",
+        "message 5",
+        "message 9",
+    ]
+    # More messages than the window are read from the database
+    assert texts(cache.list_recent_messages(CONVERSATION_ID, 5)) == [
+        f"message {i}" for i in [2, 3, 4, 5, 9]
+    ]
+    assert texts(cache.list_messages(CONVERSATION_ID))[0] == "message 0"
+    assert len(cache.list_recent_messages(CONVERSATION_ID, 10)) == 7
+    metrics = cache.metrics()
+    assert (metrics["misses"], metrics["hits"]) == (3, 2)
+
+
+def test_recent_window_async(db: ChatDB) -> None:
+    cache = CachedChatDB(db, name="test", messages=10)
+
+    async def reads() -> list[list[Message]]:
+        first = await cache.alist_recent_messages(CONVERSATION_ID, 2)
+        await db.acreate_messages([message(9)])
+        return [first, await cache.alist_messages(CONVERSATION_ID)]
+
+    # The conversation is shorter than the window, so it is cached whole
+    first, second = run(cache, reads())
+    assert texts(first) == ["message 4", "message 5"] and len(second) == 5
+    assert (cache.metrics()["misses"], cache.metrics()["hits"]) == (1, 1)
+
+
+def test_delete_messages_after(cache: CachedChatDB) -> None:
+    deleted = cache.delete_messages_after(
+        CONVERSATION_ID, message(4).created_at
+    )
+    assert texts(deleted) == ["message 4", "message 5"]
+    assert texts(cache.list_messages(CONVERSATION_ID)) == [
+        f"message {i}" for i in range(1, 4)
+    ]
+
+
+def test_delete_messages_until(cache: CachedChatDB) -> None:
+    deleted = cache.delete_messages_until(
+        CONVERSATION_ID, message(2).created_at
+    )
+    assert texts(deleted) == ["message 1", "message 2"]
+    assert texts(cache.list_messages(CONVERSATION_ID)) == [
+        f"message {i}" for i in range(3, 6)
+    ]
+
+
+def test_summary_read_through(cache: CachedChatDB, db: ChatDB) -> None:
+    assert cache.get_summary(CONVERSATION_ID) is None
+    # The missing summary is cached too
+    db.upsert_summary(summary("bypassed"))
+    assert cache.get_summary(CONVERSATION_ID) is None
+    # A summary written through the cache is seen
+    cache.upsert_summary(summary("written"))
+    cached = cache.get_summary(CONVERSATION_ID)
+    assert cached is not None and cached.text == "written"
+    stored = db.get_summary(CONVERSATION_ID)
+    assert stored is not None and stored.text == "written"
+
+
+@pytest.mark.parametrize("write", WRITES)
+def test_write(cache: CachedChatDB, db: ChatDB, write: str) -> None:
+    before = cache.list_messages(CONVERSATION_ID)
+    WRITES[write][0](cache)
+    after = cache.list_messages(CONVERSATION_ID)
+    assert after != before
+    assert after == db.list_messages(CONVERSATION_ID)
+
+
+@pytest.mark.parametrize("write", WRITES)
+def test_write_async(cache: CachedChatDB, db: ChatDB, write: str) -> None:
+    async def written() -> tuple[list[Message], list[Message]]:
+        before = await cache.alist_messages(CONVERSATION_ID)
+        await WRITES[write][1](cache)
+        return before, await cache.alist_messages(CONVERSATION_ID)
+
+    before, after = run(cache, written())
+    assert after != before
+    assert after == db.list_messages(CONVERSATION_ID)
+
+
+def test_ttl(db: ChatDB, monkeypatch: pytest.MonkeyPatch) -> None:
+    clock = Clock()
+    monkeypatch.setattr(database_chat, "time", clock)
+    cache = CachedChatDB(db, name="test", ttl=60)
+    assert len(cache.list_messages(CONVERSATION_ID)) == 5
+    # E.g. another process writes the conversation
+    db.create_messages([message(9)])
+    clock.now = 59.0
+    assert len(cache.list_messages(CONVERSATION_ID)) == 5
+    clock.now = 60.0
+    assert len(cache.list_messages(CONVERSATION_ID)) == 6
+    metrics = cache.metrics()
+    assert (metrics["misses"], metrics["hits"], metrics["expired"]) == (2, 1, 1)
@@ -0,0 +1,79 @@
+"""Tests of the cache of the query embeddings (`CachedEmbeddings`): the hits
+on the normalized text, the LRU eviction and the disk tier.
+"""
+
+import asyncio
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+from mcpbot.shared.services.embeddings_cache import CachedEmbeddings
+
+
+class Counting(Embeddings):
+    """Embeds a text as its length, and counts the embedded texts."""
+
+    def __init__(self) -> None:
+        self.embedded: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.embedded.append(text)
+        return [float(len(text)), 0.5]
+
+
+def test_hits() -> None:
+    model = Counting()
+    cache = CachedEmbeddings(model, model="model", max_size=10)
+    vector = cache.embed_query("Book a  desk")
+    # Case and whitespace do not matter
+    assert cache.embed_query(" book a desk") == vector
+    assert asyncio.run(cache.aembed_query("BOOK A DESK")) == vector
+    assert model.embedded == ["Book a  desk"]
+    metrics = cache.metrics()
+    assert (metrics["memory_hits"], metrics["misses"]) == (2, 1)
+
+
+def test_documents_not_cached() -> None:
+    model = Counting()
+    cache = CachedEmbeddings(model, model="model", max_size=1)
+    cache.embed_query("query")
+    # Documents differing by case are embedded as they are
+    assert cache.embed_documents(["Desk", "desk", "desk"]) == [[4.0, 1.0]] * 3
+    assert asyncio.run(cache.aembed_documents(["Room"])) == [[4.0, 1.0]]
+    # And do not evict the queries
+    cache.embed_query("query")
+    assert model.embedded == ["query", "Desk", "desk", "desk", "Room"]
+    assert cache.metrics()["evicted"] == 0
+
+
+def test_lru_eviction() -> None:
+    model = Counting()
+    cache = CachedEmbeddings(model, model="model", max_size=2)
+    cache.embed_query("a")
+    cache.embed_query("b")
+    # The least recently used is evicted: "b", as "a" was just read
+    cache.embed_query("a")
+    cache.embed_query("c")
+    cache.embed_query("a")
+    cache.embed_query("b")
+    assert model.embedded == ["a", "b", "c", "b"]
+    assert cache.metrics()["evicted"] == 2 and cache.metrics()["size"] == 2
+
+
+def test_disk_tier(tmp_path: Path) -> None:
+    path = str(tmp_path / "embeddings.sqlite3")
+    model = Counting()
+    vector = CachedEmbeddings(model, model="model", path=path).embed_query("a")
+    # E.g. after a restart, or in another worker
+    cache = CachedEmbeddings(model, model="model", path=path)
+    assert asyncio.run(cache.aembed_query("A")) == vector
+    assert cache.embed_query("a") == vector
+    metrics = cache.metrics()
+    assert (metrics["disk_hits"], metrics["memory_hits"]) == (1, 1)
+    # A new model never gets the vectors of the previous one
+    CachedEmbeddings(model, model="other", path=path).embed_query("a")
+    assert model.embedded == ["a", "a"]
@@ -0,0 +1,107 @@
+"""Tests of the local vector database (`NumpyVectorDB`): the writes, the
+search and the reload of a version written by another instance.
+"""
+
+import os
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+import pytest
+
+from mcpbot.shared.services.database_vector import (
+    NumpyVectorDB,
+    VectorDocument,
+)
+
+
+# The embedding of each text, the unknown texts are the zero vector
+VECTORS = {
+    "north": [0.0, 1.0],
+    "east": [1.0, 0.0],
+    "far east": [10.0, 0.0],
+    "north east": [1.0, 1.0],
+}
+
+
+class Lookup(Embeddings):
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return VECTORS.get(text, [0.0, 0.0])
+
+
+def document(id: str, text: str) -> VectorDocument:
+    return VectorDocument(id=id, text=text, metadata={"source": id})
+
+
+@pytest.fixture
+def db(tmp_path: Path) -> NumpyVectorDB:
+    db = NumpyVectorDB(Lookup(), "faq", endpoint=f"numpy:///{tmp_path}")
+    results = db.upsert_many(
+        [
+            document("1", "north"),
+            document("2", "east"),
+            document("3", "far east"),
+        ]
+    )
+    assert results == [None] * 3
+    return db
+
+
+def test_upsert(db: NumpyVectorDB) -> None:
+    assert db.get_many(["1", "missing"]) == {
+        "1": {"id": "1", "text": "north", "metadata": {"source": "1"}}
+    }
+    db.upsert("1", "north east", {"source": "updated"})
+    db.upsert("4", "north", {})
+    documents = db.get_many(["1", "4"], include_embeddings=True)
+    assert documents["1"]["text"] == "north east"
+    assert documents["1"]["embedding"] == [1.0, 1.0]
+    assert documents["4"]["embedding"] == [0.0, 1.0]
+    # Only the current version is kept
+    assert len(list(db.path.glob("*.npy"))) == 1
+
+
+def test_delete(db: NumpyVectorDB) -> None:
+    assert db.delete_many(["2", "missing"]) == [None, None]
+    assert set(db.get_many(["1", "2", "3"])) == {"1", "3"}
+    assert db.search("east", "cosine", 1) == ["far east"]
+
+
+def test_search_cosine(db: NumpyVectorDB) -> None:
+    # "east" and "far east" have the same direction
+    hits = db.search_hits("north east", "cosine", 3)
+    assert [hit.text for hit in hits][0] == "north"
+    assert hits[0].distance == pytest.approx(1 - 0.5**0.5, abs=1e-6)
+    hits = db.search_hits("east", "cosine", 3)
+    assert [hit.distance for hit in hits] == pytest.approx([0, 0, 1], abs=1e-6)
+    assert hits[-1].text == "north"
+
+
+def test_search_euclidean(db: NumpyVectorDB) -> None:
+    hits = db.search_hits("east", "euclidean", 3)
+    assert [hit.text for hit in hits] == ["east", "north", "far east"]
+    assert [hit.distance for hit in hits] == pytest.approx([0, 2**0.5, 9])
+    assert db.search("east", "euclidean", 0) == []
+    with pytest.raises(ValueError):
+        db.search("east", "dot", 1)
+
+
+def test_reload_after_other_writer(db: NumpyVectorDB, tmp_path: Path) -> None:
+    # E.g. the ingestion script, while the workers serve the searches
+    other = NumpyVectorDB(Lookup(), "faq", endpoint=f"numpy:///{tmp_path}")
+    assert db.search("north", "euclidean", 1) == ["north"]
+    manifest = db.path / db.MANIFEST
+    mtime = manifest.stat().st_mtime_ns
+    other.upsert("1", "north east", {})
+    # With coarse timestamps, the new manifest has the same mtime
+    os.utime(manifest, ns=(mtime, mtime))
+    assert db.search("north", "euclidean", 1) == ["north east"]
+    other.delete("2")
+    os.utime(manifest, ns=(mtime, mtime))
+    assert db.get_many(["2"]) == {}
+    # A write on the first instance is based on the current version
+    db.upsert("5", "north", {})
+    assert set(other.get_many(["1", "2", "3", "5"])) == {"1", "3", "5"}
+    assert len(list(db.path.glob("*.npy"))) == 1
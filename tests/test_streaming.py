@@ -0,0 +1,142 @@
+"""Tests of the streaming of the answers: the coalescing of the tokens
+(`coalesce_text`) and the cancellation on a client disconnect
+(`cancel_on_disconnect`).
+"""
+
+import asyncio
+from typing import Any, AsyncGenerator, AsyncIterator, Coroutine, TypeVar
+
+import pytest
+
+from mcpbot.client.streaming import (
+    ClientDisconnected,
+    cancel_on_disconnect,
+    coalesce_text,
+)
+
+
+T = TypeVar("T")
+
+
+class Tokens:
+    """A token stream, which sleeps `delay` seconds before each token."""
+
+    def __init__(self, tokens: list[str], delay: float = 0.0) -> None:
+        self.tokens = tokens
+        self.delay = delay
+        self.read: list[str] = []
+        self.closed = False
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        try:
+            for token in self.tokens:
+                await asyncio.sleep(self.delay)
+                self.read.append(token)
+                yield token
+        finally:
+            self.closed = True
+
+
+async def collect(
+    stream: AsyncIterator[str],
+) -> tuple[list[str], BaseException | None]:
+    """The items of a stream, and the error that ended it, if any."""
+    items: list[str] = []
+    try:
+        async for item in stream:
+            items.append(item)
+    except Exception as error:
+        return items, error
+    return items, None
+
+
+def run(coroutine: Coroutine[Any, Any, T]) -> T:
+    return asyncio.run(coroutine)
+
+
+def test_coalesce_by_size() -> None:
+    tokens = Tokens(["a", "bb", "cc", "d", "ee", "f"])
+    stream = coalesce_text(tokens.stream(), interval_ms=10_000, max_bytes=4)
+    # The first token right away, then chunks of at least 4 bytes
+    assert run(collect(stream)) == (["a", "bbcc", "deef"], None)
+    assert tokens.closed
+
+
+def test_coalesce_by_interval() -> None:
+    tokens = Tokens(["a", "b", "c", "d"], delay=0.03)
+    stream = coalesce_text(tokens.stream(), interval_ms=10, max_bytes=1000)
+    # The buffer is flushed after 10 ms, while the next token is awaited
+    assert run(collect(stream)) == (["a", "b", "c", "d"], None)
+
+
+def test_coalesce_flushes_before_error() -> None:
+    async def failing() -> AsyncGenerator[str, None]:
+        yield "a"
+        yield "b"
+        yield "c"
+        raise ClientDisconnected()
+
+    stream = coalesce_text(failing(), interval_ms=10_000, max_bytes=1000)
+    items, error = run(collect(stream))
+    assert items == ["a", "bc"] and isinstance(error, ClientDisconnected)
+
+
+def test_coalesce_closed_while_reading() -> None:
+    tokens = Tokens(["a", "b"], delay=10)
+
+    async def close() -> None:
+        stream = coalesce_text(tokens.stream(), interval_ms=10, max_bytes=1)
+        read = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        read.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await read
+        await stream.aclose()
+
+    run(close())
+    assert tokens.closed and tokens.read == []
+
+
+def test_cancel_on_disconnect() -> None:
+    tokens = Tokens(["a", "b", "c", "d"], delay=0.02)
+    checks = 0
+
+    async def is_disconnected() -> bool:
+        nonlocal checks
+        checks += 1
+        return checks == 3
+
+    stream = cancel_on_disconnect(tokens.stream(), is_disconnected, 10)
+    items, error = run(collect(stream))
+    assert isinstance(error, ClientDisconnected)
+    # The stream is cancelled where it waits, it does not produce the rest
+    assert items == tokens.read and len(items) < 4
+    assert tokens.closed
+
+
+def test_cancel_on_disconnect_idle() -> None:
+    # E.g. a long tool call, the client is checked in the meantime
+    tokens = Tokens(["a"], delay=10)
+
+    async def is_disconnected() -> bool:
+        return True
+
+    stream = cancel_on_disconnect(tokens.stream(), is_disconnected, 10)
+    items, error = run(asyncio.wait_for(collect(stream), 1))
+    assert items == [] and isinstance(error, ClientDisconnected)
+    assert tokens.closed
+
+
+def test_cancel_on_disconnect_keeps_read_text() -> None:
+    # The next token is read while the client is checked
+    tokens = Tokens(["a", "b"], delay=0.02)
+
+    async def is_disconnected() -> bool:
+        await asyncio.sleep(0.05)
+        return True
+
+    stream = cancel_on_disconnect(tokens.stream(), is_disconnected, 10)
+    items, error = run(collect(stream))
+    assert items == ["a"] and isinstance(error, ClientDisconnected)
+    # The read had finished, the stream is still closed
+    assert tokens.read == ["a"] and tokens.closed
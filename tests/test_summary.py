@@ -0,0 +1,69 @@
+"""Tests of the rolling summary of a conversation (`ConversationSummarizer`)."""
+
+import asyncio
+from pathlib import Path
+
+from langchain_core.language_models import FakeListChatModel
+import pytest
+
+from mcpbot.client.persistence import ChatWriteQueue
+from mcpbot.client.summary import ConversationSummarizer
+from mcpbot.shared.services.database_chat import (
+    ChatDB,
+    ConversationActivity,
+    JsonChatDB,
+    new_message,
+)
+
+
+CONVERSATION_ID = "conversation"
+USER_ID = "user"
+
+
+@pytest.fixture
+def databases(tmp_path: Path) -> tuple[ChatDB, ChatDB]:
+    """The messages and conversations, with 6 messages of 10 tokens."""
+    db_messages = JsonChatDB(str(tmp_path), "messages")
+    db_conversations = JsonChatDB(str(tmp_path), "conversations")
+    db_conversations.create_conversation(USER_ID, CONVERSATION_ID)
+    messages = [
+        new_message(
+            CONVERSATION_ID,
+            USER_ID,
+            "human" if i % 2 else "ai",
+            f"message {i}",
+            created_at=f"2025-01-01T00:00:{i:02d}+00:00",
+            tokens=10,
+        )
+        for i in range(1, 7)
+    ]
+    db_messages.create_messages(messages)
+    db_conversations.update_conversation_activity(
+        [ConversationActivity.of(CONVERSATION_ID, USER_ID, added=messages)]
+    )
+    return db_messages, db_conversations
+
+
+def test_summarize(databases: tuple[ChatDB, ChatDB]) -> None:
+    db_messages, db_conversations = databases
+    summarizer = ConversationSummarizer(
+        llm=FakeListChatModel(responses=["The summary."]),
+        db_messages=db_messages,
+        db_conversations=db_conversations,
+        writer=ChatWriteQueue(db_messages, db_conversations),
+        threshold=4,
+        keep=2,
+    )
+    summary = asyncio.run(summarizer.summarize(CONVERSATION_ID, USER_ID))
+    assert summary is not None and summary.text == "The summary."
+    assert [m.text for m in db_messages.list_messages(CONVERSATION_ID)] == [
+        "message 5",
+        "message 6",
+    ]
+    # The folded messages are subtracted from the conversation
+    conversation = db_conversations.get_conversation(CONVERSATION_ID, USER_ID)
+    assert conversation is not None
+    assert (conversation.message_count, conversation.total_tokens) == (2, 20)
+    assert conversation.last_message_preview == "message 6"
+    # Under the threshold, nothing is folded
+    assert asyncio.run(summarizer.summarize(CONVERSATION_ID, USER_ID)) is None
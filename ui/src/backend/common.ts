@@ -5,6 +5,11 @@ type RequestMethod = "GET" | "POST" | "PUT" | "DELETE" | "PATCH";
 
 export type OrderBy = "ASC" | "DESC";
 
+export type Page<T> = {
+    items: T[];
+    next_cursor: string | null;
+};
+
 // Overload: without parseJson, returns Response
 export function fetchWithToken(
     options: {
@@ -69,3 +74,24 @@ export async function fetchWithToken<T = unknown>(
         throw error;
     }
 }
+
+// Lists all items of a paginated endpoint, following the cursors
+export async function fetchAllPages<T>(
+    url: string,
+    params: Record<string, string>,
+): Promise<T[]> {
+    const items: T[] = [];
+    let cursor: string | null = null;
+    do {
+        const query = new URLSearchParams(params);
+        if (cursor) query.set("cursor", cursor);
+        const page: Page<T> = await fetchWithToken<Page<T>>({
+            url: `${url}?${query.toString()}`,
+            method: "GET",
+            parseJson: true
+        });
+        items.push(...page.items);
+        cursor = page.next_cursor;
+    } while (cursor);
+    return items;
+}
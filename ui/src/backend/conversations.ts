@@ -1,4 +1,4 @@
-import { type OrderBy, fetchWithToken} from "./common";
+import { type OrderBy, fetchAllPages, fetchWithToken} from "./common";
 
 type ConversationItem = {
     id: string;
@@ -20,12 +20,7 @@ async function getConversations(
     orderBy: OrderBy = 'DESC',
 ): Promise<ConversationItem[]> {
     const url = "/conversations";
-    const params = new URLSearchParams({order_by: orderBy});
-    return fetchWithToken<ConversationItem[]>({
-        url: `${url}?${params.toString()}`,
-        method: "GET",
-        parseJson: true
-    });
+    return fetchAllPages<ConversationItem>(url, {order_by: orderBy});
 }
 
 async function deleteConversation(conversation_id: string): Promise<void> {
@@ -1,4 +1,4 @@
-import { type OrderBy, fetchWithToken } from "./common";
+import { type OrderBy, fetchAllPages, fetchWithToken } from "./common";
 
 enum Role {
   Human = "human",
@@ -39,7 +39,8 @@ async function* sendMessage(
   message: string,
   conversationId: string,
 ): AsyncGenerator<CreateMessageResponse> {
-  const url = `/conversations/${conversationId}/messages`;
+  // The UI parses the legacy JSON stream format
+  const url = `/conversations/${conversationId}/messages?stream_format=json`;
   const body = {message: message};
   const response = await fetchWithToken({
     url: url,
@@ -91,7 +92,7 @@ async function* editMessage(
   messageId: string,
   conversationId: string,
 ): AsyncGenerator<CreateMessageResponse> {
-  const url = `/conversations/${conversationId}/messages/${messageId}`;
+  const url = `/conversations/${conversationId}/messages/${messageId}?stream_format=json`;
   const body = {message: message};
   const response = await fetchWithToken({
     url: url,
@@ -142,12 +143,7 @@ async function getMessages(
   orderBy: OrderBy = 'ASC',
 ): Promise<MessageItem[]> {
   const url = `/conversations/${conversation_id}/messages`
-  const params = new URLSearchParams({order_by: orderBy});
-  return fetchWithToken<MessageItem[]>({
-    url: `${url}?${params.toString()}`,
-    method: "GET",
-    parseJson: true
-  });
+  return fetchAllPages<MessageItem>(url, {order_by: orderBy});
 }
 
 export { type MessageItem, Role, editMessage, getMessages, sendMessage};